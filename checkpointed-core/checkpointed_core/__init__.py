@@ -2,4 +2,10 @@ from .pipeline import Pipeline
 from .handle import PipelineStepHandle
 from .step import PipelineStep
 from .plan import ExecutionPlan
+from .executor import TaskExecutor
+from .distributed import Coordinator
+from .compression import Compression
+from .garbage_collection import collect_garbage
 from . import parameters
+from . import storage
+from . import tiering
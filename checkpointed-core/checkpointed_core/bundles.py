@@ -0,0 +1,225 @@
+"""Bundles of checkpoints, for moving checkpoints between machines.
+
+A bundle is a single (compressed) tar archive, which is written and
+read as a stream, so that bundles of any size can be exported and
+imported without temporary copies. It holds the following members:
+
+- `bundle.json`: the pipeline the checkpoints were exported from, and
+  the fingerprint, format and metadata of every checkpoint;
+- `checkpoints/<index>/...`: the files of every checkpoint, including
+  the checkpoints of the sub-pipelines run by the step;
+- `checksums.json`: the SHA-256 digest of every file, written last.
+
+Checkpoints are identified by the fingerprints of their steps (see
+`checkpointing`), which do not depend on the identifiers of steps, so
+that a bundle can be imported into any pipeline containing the same steps.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import io
+import json
+import os
+import tarfile
+import time
+import typing
+
+from . import compression
+from .compression import Compression
+
+BUNDLE_VERSION = 1
+
+_HEADER_MEMBER = 'bundle.json'
+_CHECKSUMS_MEMBER = 'checksums.json'
+_CHECKPOINTS_DIRECTORY = 'checkpoints'
+
+
+class BundledCheckpoint(typing.NamedTuple):
+    # Fingerprint of the step which produced the checkpoint
+    fingerprint: str
+    format: str | None
+    # Metadata as a JSON string
+    metadata: str | None
+    size: int | None
+    digest: str | None
+    codec: str | None
+
+
+class BundleHeader(typing.NamedTuple):
+    version: int
+    # Name of the pipeline the checkpoints were exported from
+    pipeline: str
+    created: float
+    checkpoints: list[BundledCheckpoint]
+
+
+def write_bundle(filename: str,
+                 pipeline: str,
+                 checkpoints: list[tuple[BundledCheckpoint, str]], *,
+                 codec: Compression | None = None) -> int:
+    """Write a bundle holding the given checkpoints, given as pairs of
+    their description and the directory holding their files.
+
+    The bundle only appears under `filename` once it is complete.
+    Returns the size of the bundle, in bytes.
+    """
+    header = BundleHeader(BUNDLE_VERSION, pipeline, time.time(), [c for c, _ in checkpoints])
+    checksums = {}
+    temp = f'{filename}.{os.getpid()}.partial'
+    try:
+        with compression.open_stream(temp, 'wb', codec) as file:
+            with tarfile.open(fileobj=file, mode='w|', format=tarfile.PAX_FORMAT) as archive:
+                _add_bytes(archive, _HEADER_MEMBER, json.dumps(_header_to_json(header)).encode())
+                for index, (_, directory) in enumerate(checkpoints):
+                    for path, name in _list_files(directory):
+                        member = f'{_CHECKPOINTS_DIRECTORY}/{index}/{name}'
+                        checksums[member] = _add_file(archive, member, path)
+                _add_bytes(archive, _CHECKSUMS_MEMBER, json.dumps(checksums).encode())
+        os.replace(temp, filename)
+    except BaseException:
+        if os.path.exists(temp):
+            os.remove(temp)
+        raise
+    return os.path.getsize(filename)
+
+
+def read_bundle(filename: str,
+                select: typing.Callable[[BundleHeader], dict[int, str]]) -> BundleHeader:
+    """Read a bundle, extracting the files of the checkpoints selected
+    by `select`, which maps the indices of the checkpoints to extract
+    (in the header of the bundle) to the directories to extract them to.
+
+    Raises ValueError if the bundle is invalid or corrupt, in which
+    case extracted files must be discarded.
+    """
+    try:
+        return _read_bundle(filename, select)
+    except (EOFError, tarfile.TarError) as e:
+        raise ValueError(f'Bundle {filename} is corrupt ({e})') from e
+
+
+def _read_bundle(filename: str,
+                 select: typing.Callable[[BundleHeader], dict[int, str]]) -> BundleHeader:
+    header = None
+    destinations = {}
+    checksums = {}
+    with compression.open_stream(filename, 'rb') as file:
+        with tarfile.open(fileobj=file, mode='r|') as archive:
+            for member in archive:
+                if header is None:
+                    if member.name != _HEADER_MEMBER:
+                        raise ValueError(f'{filename} is not a checkpoint bundle')
+                    header = _header_from_json(json.load(archive.extractfile(member)))
+                    destinations = select(header)
+                    continue
+                if member.name == _CHECKSUMS_MEMBER:
+                    expected = json.load(archive.extractfile(member))
+                    if expected != checksums:
+                        raise ValueError(f'Bundle {filename} is corrupt (checksum mismatch)')
+                    return header
+                if not member.isfile():
+                    raise ValueError(f'Unexpected member in bundle {filename}: {member.name}')
+                index, name = _parse_member_name(member.name, len(header.checkpoints))
+                target = None
+                if index in destinations:
+                    target = os.path.join(destinations[index], *name.split('/'))
+                checksums[member.name] = _extract_file(archive.extractfile(member), target)
+    if header is None:
+        raise ValueError(f'{filename} is not a checkpoint bundle')
+    raise ValueError(f'Bundle {filename} is incomplete')
+
+
+def _header_to_json(header: BundleHeader) -> dict:
+    return {
+        'version': header.version,
+        'pipeline': header.pipeline,
+        'created': header.created,
+        'checkpoints': [checkpoint._asdict() for checkpoint in header.checkpoints]
+    }
+
+
+def _header_from_json(data: dict) -> BundleHeader:
+    if data.get('version') != BUNDLE_VERSION:
+        raise ValueError(f'Unsupported bundle version: {data.get("version")}')
+    return BundleHeader(
+        data['version'],
+        data['pipeline'],
+        data['created'],
+        [BundledCheckpoint(**checkpoint) for checkpoint in data['checkpoints']]
+    )
+
+
+def _list_files(directory: str) -> typing.Iterator[tuple[str, str]]:
+    for root, directories, filenames in os.walk(directory):
+        directories.sort()
+        for filename in sorted(filenames):
+            path = os.path.join(root, filename)
+            yield path, os.path.relpath(path, directory).replace(os.sep, '/')
+
+
+def _parse_member_name(name: str, checkpoints: int) -> tuple[int, str]:
+    parts = name.split('/')
+    if (len(parts) < 3
+            or parts[0] != _CHECKPOINTS_DIRECTORY
+            or not parts[1].isdigit()
+            or int(parts[1]) >= checkpoints
+            or any(part in ('', '.', '..') for part in parts[2:])):
+        raise ValueError(f'Invalid member in bundle: {name}')
+    return int(parts[1]), '/'.join(parts[2:])
+
+
+def _add_bytes(archive: tarfile.TarFile, name: str, data: bytes):
+    info = tarfile.TarInfo(name)
+    info.size = len(data)
+    info.mtime = int(time.time())
+    archive.addfile(info, io.BytesIO(data))
+
+
+def _add_file(archive: tarfile.TarFile, name: str, path: str) -> str:
+    # Files are always stored as regular files; checkpoints may
+    # hold files linked to outputs, or to the shared cache.
+    with open(path, 'rb') as file:
+        stat = os.fstat(file.fileno())
+        info = tarfile.TarInfo(name)
+        info.size = stat.st_size
+        info.mtime = int(stat.st_mtime)
+        info.mode = 0o644
+        reader = _HashingReader(file)
+        archive.addfile(info, reader)
+    return reader.hexdigest()
+
+
+def _extract_file(source: typing.IO[bytes], target: str | None) -> str:
+    """Copy a member of a bundle to `target` (if not None),
+    returning its digest.
+    """
+    digest = hashlib.sha256()
+    output = None
+    if target is not None:
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        output = open(target, 'xb')
+    try:
+        while chunk := source.read(1 << 20):
+            digest.update(chunk)
+            if output is not None:
+                output.write(chunk)
+    finally:
+        if output is not None:
+            output.close()
+    return digest.hexdigest()
+
+
+class _HashingReader:
+
+    def __init__(self, file: typing.IO[bytes]):
+        self._file = file
+        self._digest = hashlib.sha256()
+
+    def read(self, size: int = -1) -> bytes:
+        data = self._file.read(size)
+        self._digest.update(data)
+        return data
+
+    def hexdigest(self) -> str:
+        return self._digest.hexdigest()
@@ -1,13 +1,16 @@
 from __future__ import annotations
 
 import collections
-import itertools
+import graphlib
+import hashlib
+import json
 import logging
-import math
 import typing
 
 from .graph import PipelineGraph
 from .handle import PipelineStepHandle
+from .scheduling import get_factory_key
+from .step import PipelineStep
 
 
 class CheckpointGraph:
@@ -15,12 +18,8 @@ class CheckpointGraph:
     def __init__(self,
                  graph: PipelineGraph,
                  config_by_step: dict[PipelineStepHandle, dict[str, typing.Any]]):
-        self._input_labels_per_node = {
-            node.handle: set(node.factory.supported_inputs().keys())
-            for node in graph.vertices
-        }
         self._factories = {
-            node.handle: node.factory.__name__
+            node.handle: get_factory_key(node.factory)
             for node in graph.vertices
         }
         self._outputs_per_node = collections.defaultdict(list)
@@ -38,47 +37,166 @@ class CheckpointGraph:
                                for node in graph.vertices
                                if node.factory.has_dynamic_checkpoint()}
         self._config_by_step = config_by_step
-
-    @property
-    def _handles_by_factory(self) -> dict[str, list[PipelineStepHandle]]:
-        handles_by_factory = collections.defaultdict(list)
-        for handle, factory in self._factories.items():
-            handles_by_factory[factory].append(handle)
-        return handles_by_factory
+        self._order = None
+        self._fingerprints = self._compute_fingerprints()
 
     def compute_checkpoint_mapping(
             self,
-            old: CheckpointGraph,
+            old_fingerprints: dict[PipelineStepHandle, str],
+            old_inputs: dict[PipelineStepHandle, list[tuple[str, PipelineStepHandle]]],
             logger: logging.Logger) -> dict[PipelineStepHandle, PipelineStepHandle]:
-        return self._compute_best_matchup(old, logger)
+        """Map steps of this graph to equivalent steps of an older graph,
+        given by the fingerprints and inputs of its steps.
+
+        Two steps are equivalent if they have the same fingerprint,
+        i.e. if they have the same type and configuration, and their
+        inputs are equivalent as well. Matching is done by fingerprint
+        lookup, in time linear in the size of both graphs.
+        """
+        if self.is_same_graph(old_fingerprints, old_inputs):
+            logger.info(f'Graph is unchanged; preserving all {len(old_fingerprints)} steps')
+            return {handle: handle for handle in self.fingerprints}
+        # Equivalent old steps are indexed both by fingerprint, and by
+        # fingerprint and inputs. Among equivalent steps, the one consuming
+        # the steps the inputs of a new step have been mapped to is preferred.
+        old_by_fingerprint = collections.defaultdict(collections.deque)
+        old_by_inputs = collections.defaultdict(collections.deque)
+        for handle, fingerprint in sorted(old_fingerprints.items()):
+            old_by_fingerprint[fingerprint].append(handle)
+            old_by_inputs[(fingerprint, tuple(sorted(old_inputs.get(handle, ()))))].append(handle)
+        fingerprints = self.fingerprints
+        inputs = self._get_inputs_by_node()
+        used = set()
+        mapping = {}
+        for handle in self._topological_order():
+            key = (
+                fingerprints[handle],
+                tuple(sorted((label, mapping.get(source)) for label, source in inputs[handle]))
+            )
+            match = _pop_unused(old_by_inputs.get(key), used)
+            if match is None:
+                match = _pop_unused(old_by_fingerprint.get(fingerprints[handle]), used)
+            if match is None:
+                continue
+            used.add(match)
+            mapping[handle] = match
+            logger.info(f'Found matching nodes: {match} -> {handle}')
+        logger.info(f'Found a checkpoint mapping preserving {len(mapping)} steps!')
+        if mapping:
+            logger.info('Final checkpoint mapping:')
+            for key in sorted(mapping, key=lambda h: h.get_raw_identifier()):
+                logger.info(f'{key} -> {mapping[key]}')
+        return mapping
+
+    def is_same_graph(self,
+                      old_fingerprints: dict[PipelineStepHandle, str],
+                      old_inputs: dict[PipelineStepHandle, list[tuple[str, PipelineStepHandle]]]) -> bool:
+        """Check whether an older graph has the same steps (with the
+        same identifiers) and connections as this graph.
+        """
+        if old_fingerprints != self.fingerprints:
+            return False
+        inputs = self._get_inputs_by_node()
+        return all(
+            sorted(old_inputs.get(handle, ())) == sorted(inputs[handle]) for handle in old_fingerprints
+        )
+
+    def upgrade_factory_names(self, factories: typing.Iterable[type[PipelineStep]]):
+        """Replace the class names, by which graphs stored by older versions
+        identify the type of steps, by the keys of the given factories.
+
+        Names shared by several of the factories are ambiguous, and kept.
+        """
+        keys_by_name = {}
+        for factory in factories:
+            keys_by_name.setdefault(factory.__name__, set()).add(get_factory_key(factory))
+        self._factories = {
+            handle: next(iter(keys_by_name[name])) if len(keys_by_name.get(name, ())) == 1 else name
+            for handle, name in self._factories.items()
+        }
+        self._fingerprints = None
+
+    @property
+    def fingerprints(self) -> dict[PipelineStepHandle, str]:
+        """Merkle fingerprint of every step, computed from its type,
+        its (canonicalised) configuration, and the fingerprints of its inputs.
+        """
+        # Graphs stored by older versions do not contain fingerprints
+        if getattr(self, '_fingerprints', None) is None:
+            self._fingerprints = self._compute_fingerprints()
+        return self._fingerprints
+
+    @property
+    def inputs(self) -> dict[PipelineStepHandle, list[tuple[str, PipelineStepHandle]]]:
+        """The (label, source) pairs of the inputs of every step."""
+        # Used for every step while running, so computed once
+        if getattr(self, '_inputs', None) is None:
+            inputs_by_node = self._get_inputs_by_node()
+            self._inputs = {handle: inputs_by_node[handle] for handle in self._factories}
+        return self._inputs
+
+    def _compute_fingerprints(self) -> dict[PipelineStepHandle, str]:
+        inputs_by_node = self._get_inputs_by_node()
+        fingerprints = {}
+        for handle in self._topological_order():
+            digest = hashlib.sha256()
+            digest.update(self._factories[handle].encode())
+            digest.update(b'\0')
+            digest.update(hash_config(self._config_by_step[handle]).encode())
+            for label, source in sorted(inputs_by_node[handle]):
+                digest.update(b'\0')
+                digest.update(label.encode())
+                digest.update(b'=')
+                digest.update(fingerprints[source].encode())
+            fingerprints[handle] = digest.hexdigest()
+        return fingerprints
+
+    def _get_inputs_by_node(self) -> dict[PipelineStepHandle, list[tuple[str, PipelineStepHandle]]]:
+        # Graphs stored by older versions do not contain the inputs
+        if getattr(self, '_inputs_by_node', None) is None:
+            inputs_by_node = collections.defaultdict(list)
+            for (target, label), source in self._inputs_per_node.items():
+                inputs_by_node[target].append((str(label), source))
+            self._inputs_by_node = inputs_by_node
+        return self._inputs_by_node
+
+    def _topological_order(self) -> list[PipelineStepHandle]:
+        # Graphs stored by older versions do not contain the order
+        if getattr(self, '_order', None) is None:
+            sorter = graphlib.TopologicalSorter({handle: set() for handle in self._factories})
+            for (target, _), source in self._inputs_per_node.items():
+                sorter.add(target, source)
+            self._order = list(sorter.static_order())
+        return self._order
 
     def update_checkpoint_mapping(self,
                                   mapping: dict[PipelineStepHandle, PipelineStepHandle],
                                   valid_checkpoints: set[PipelineStepHandle],
-                                  logger: logging) -> dict[PipelineStepHandle, PipelineStepHandle]:
+                                  logger: logging, *,
+                                  undecided: set[PipelineStepHandle] = frozenset(),
+                                  recomputed: set[PipelineStepHandle] = frozenset()) -> dict[PipelineStepHandle, PipelineStepHandle]:
+        """Restrict a checkpoint mapping to the steps with a valid
+        checkpoint, all inputs of which are preserved as well.
+
+        Steps in `undecided` (dynamic checkpoints whose validity is only
+        known after they have run) are preserved, until they are marked
+        as invalid (see `get_descendants`). Steps consuming a step in
+        `recomputed` are preserved as well; they remain valid if the
+        recomputed step produces the same output as before.
+
+        Computed in a single pass over the steps in topological order.
+        """
         logger.info('Updating mapping with valid checkpoints.')
         logger.info(f'Valid checkpoints: {", ".join(map(str, valid_checkpoints))}')
-        result = {
-            x: y
-            for x, y in mapping.items()
-            if x in valid_checkpoints and x in self._input_nodes
-        }
-        while True:
-            additions = {
-                x: y
-                for x, y in mapping.items()
-                if (
-                        x not in result and
-                        x in valid_checkpoints and
-                        all(
-                            self._inputs_per_node[(x, label)] in result
-                            for label in self._input_labels_per_node[x]
-                        )
-                )
-            }
-            if not additions:
-                break
-            result |= additions
+        inputs = self._get_inputs_by_node()
+        result = {}
+        for handle in self._topological_order():
+            if handle not in mapping:
+                continue
+            if handle not in valid_checkpoints and handle not in undecided:
+                continue
+            if all(source in result or source in recomputed for _, source in inputs[handle]):
+                result[handle] = mapping[handle]
         logger.info(f'Final checkpoint mapping preserves {len(result)} steps!')
         if result:
             logger.info('Final checkpoint mapping:')
@@ -86,6 +204,38 @@ class CheckpointGraph:
                 logger.info(f'{key} -> {result[key]}')
         return result
 
+    def get_consumers(self, handle: PipelineStepHandle) -> set[PipelineStepHandle]:
+        return {target for target, _ in self._outputs_per_node.get(handle, ())}
+
+    def get_descendants(self, handle: PipelineStepHandle) -> set[PipelineStepHandle]:
+        """Return all steps depending (directly or indirectly) on a step,
+        including the step itself.
+        """
+        descendants = {handle}
+        todo = [handle]
+        while todo:
+            current = todo.pop()
+            for target, _ in self._outputs_per_node.get(current, ()):
+                if target not in descendants:
+                    descendants.add(target)
+                    todo.append(target)
+        return descendants
+
+    def get_ancestors(self, handles: typing.Iterable[PipelineStepHandle]) -> set[PipelineStepHandle]:
+        """Return all steps the given steps (directly or indirectly)
+        depend on, including the given steps.
+        """
+        inputs = self._get_inputs_by_node()
+        ancestors = set(handles)
+        todo = list(ancestors)
+        while todo:
+            current = todo.pop()
+            for _, source in inputs[current]:
+                if source not in ancestors:
+                    ancestors.add(source)
+                    todo.append(source)
+        return ancestors
+
     def extract_dynamic_steps(self,
                               mapping: dict[PipelineStepHandle, PipelineStepHandle]) -> set[PipelineStepHandle]:
         return set(mapping) & self._dynamic_steps
@@ -94,91 +244,59 @@ class CheckpointGraph:
             self,
             mapping: dict[PipelineStepHandle, PipelineStepHandle],
             _logger: logging.Logger) -> dict[PipelineStepHandle, set[PipelineStepHandle]]:
-        requirements_by_step = collections.defaultdict(set)
-        for start in self._input_nodes:
-            dynamic_nodes_on_path = set()
-            todo = [start]
-            while todo:
-                current = todo.pop()
-                requirements_by_step[current] |= dynamic_nodes_on_path
-                if current in self._dynamic_steps:
-                    dynamic_nodes_on_path.add(current)
-                for target, _ in self._outputs_per_node[current]:
-                    todo.append(target)
+        """For every step, return the steps with dynamic checkpoints
+        it (directly or indirectly) depends on.
+        """
+        inputs = self._get_inputs_by_node()
+        requirements_by_step = {}
+        for handle in self._topological_order():
+            requirements = set()
+            for _, source in inputs[handle]:
+                requirements |= requirements_by_step[source]
+                if source in self._dynamic_steps:
+                    requirements.add(source)
+            requirements_by_step[handle] = requirements
         return {
             key: value
             for key, value in requirements_by_step.items()
             if key in mapping
         }
 
-    def _compute_best_matchup(self,
-                              old: CheckpointGraph,
-                              logger: logging.Logger) -> dict[PipelineStepHandle, PipelineStepHandle]:
-        best = {}
-        for matchup in self._compute_equivalent_nodes(old, logger):
-            mapping = self._compute_caching_mapping_from_matchup(matchup,
-                                                                 old,
-                                                                 logger)
-            best = max(best, mapping, key=len)
-        logger.info(f'Found a checkpoint mapping preserving {len(best)} steps!')
-        if best:
-            logger.info('Final checkpoint mapping:')
-            for key in sorted(best, key=lambda h: h.get_raw_identifier()):
-                logger.info(f'{key} -> {best[key]}')
-        return best
-
-    def _compute_equivalent_nodes(self,
-                                  old: CheckpointGraph,
-                                  logger: logging.Logger):
-        matchups_per_node = collections.defaultdict(list)
-        for factory, handles in self._handles_by_factory.items():
-            for new_handle in handles:
-                for old_handle in old._handles_by_factory[factory]:
-                    if self._config_by_step[new_handle] != old._config_by_step[old_handle]:
-                        continue
-                    logger.info(f'Found possibly matching nodes: {old_handle} -> {new_handle}')
-                    matchups_per_node[new_handle].append((new_handle, old_handle))
-        number_of_matchups = math.prod(len(x) for x in matchups_per_node.values())
-        logger.info(f'Possible number of node matchups: {number_of_matchups}')
-        yield from itertools.product(*matchups_per_node.values())
-
-    def _compute_caching_mapping_from_matchup(
-            self,
-            matchup: list[tuple[PipelineStepHandle, PipelineStepHandle]],
-            old: CheckpointGraph,
-            _logger: logging.Logger):
-        cacheable = {
-            (x, y)
-            for x, y in matchup
-            if (
-                x in self._input_nodes and
-                y in old._input_nodes
-            )
-        }
-        while True:
-            additions = {
-                (x, y)
-                for x, y in matchup
-                if (
-                    (x, y) not in cacheable and
-                    self._check_input_compatibility(x, y, old, cacheable)
-                )
-            }
-            if not additions:
-                break
-            cacheable |= additions
-        return dict(cacheable)
-
-    def _check_input_compatibility(self,
-                                   x: PipelineStepHandle,
-                                   y: PipelineStepHandle,
-                                   old: CheckpointGraph,
-                                   cacheable: set[tuple[PipelineStepHandle, PipelineStepHandle]]) -> bool:
-        if self._input_labels_per_node[x] != self._input_labels_per_node[y]:
-            return False
-        for key in self._input_labels_per_node[x]:
-            p = self._inputs_per_node[(x, key)]
-            q = old._inputs_per_node[(y, key)]
-            if (p, q) not in cacheable:
-                return False
-        return True
+
+def _pop_unused(candidates: collections.deque | None, used: set) -> PipelineStepHandle | None:
+    while candidates:
+        candidate = candidates.popleft()
+        if candidate not in used:
+            return candidate
+    return None
+
+
+def hash_config(config: typing.Any) -> str:
+    """Compute a hash of a step configuration, which does not
+    depend on the order of keys in dictionaries or items in sets.
+
+    Only JSON-like values (and sets) are supported; other values
+    raise a ValueError, since their representation is not stable.
+    """
+    return hashlib.sha256(
+        json.dumps(_canonicalise(config), separators=(',', ':')).encode()
+    ).hexdigest()
+
+
+def _canonicalise(value: typing.Any) -> typing.Any:
+    if isinstance(value, dict):
+        return {'dict': sorted(
+            ([_canonicalise(k), _canonicalise(v)] for k, v in value.items()),
+            key=lambda item: json.dumps(item[0])
+        )}
+    if isinstance(value, (list, tuple)):
+        return [_canonicalise(item) for item in value]
+    if isinstance(value, (set, frozenset)):
+        return {'set': sorted(
+            (_canonicalise(item) for item in value), key=json.dumps
+        )}
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    raise ValueError(
+        f'Cannot hash configuration value of type {type(value).__name__}: {value!r}'
+    )
@@ -0,0 +1,226 @@
+"""Compression of checkpoint files.
+
+Data formats open their files using `open_file`. When a checkpoint
+is written with compression enabled (see `compressed`), files are
+written through the selected codec, and the name of every file gets
+the suffix of the codec. Files are decompressed transparently when
+they are read, based on their suffix.
+
+The codecs of the standard library (gzip, bz2, lzma) are always
+available; zstd and lz4 are available if the `zstandard` and `lz4`
+packages are installed. The codec 'auto' selects the fastest
+available codec.
+"""
+
+from __future__ import annotations
+
+import bz2
+import contextlib
+import contextvars
+import gzip
+import io
+import lzma
+import os
+import shutil
+import typing
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import lz4.frame
+except ImportError:
+    lz4 = None
+
+
+class Compression(typing.NamedTuple):
+    codec: str
+    # Codec specific compression level; None for the default level
+    level: int | None = None
+
+    def __str__(self):
+        if self.level is None:
+            return self.codec
+        return f'{self.codec}:{self.level}'
+
+
+class _Codec(typing.NamedTuple):
+    suffix: str
+    # Leading bytes of compressed files
+    magic: bytes
+    open: typing.Callable[[str, str, int | None], typing.IO]
+    available: typing.Callable[[], bool]
+
+
+def _open_gzip(filename: str, mode: str, level: int | None) -> typing.IO:
+    if 'r' in mode:
+        return gzip.open(filename, mode)
+    # The modification time is written to the header of gzip files;
+    # it is fixed, so that equal contents have equal digests (early cut-off).
+    file = gzip.GzipFile(
+        filename, mode.replace('t', ''), compresslevel=6 if level is None else level, mtime=0
+    )
+    if 't' in mode:
+        return io.TextIOWrapper(file, io.text_encoding(None))
+    return file
+
+
+def _open_bz2(filename: str, mode: str, level: int | None) -> typing.IO:
+    return bz2.open(filename, mode, compresslevel=9 if level is None else level)
+
+
+def _open_lzma(filename: str, mode: str, level: int | None) -> typing.IO:
+    if 'r' in mode:
+        return lzma.open(filename, mode)
+    return lzma.open(filename, mode, preset=level)
+
+
+def _open_zstd(filename: str, mode: str, level: int | None) -> typing.IO:
+    if 'r' in mode:
+        file = zstandard.open(filename, mode)
+    else:
+        # Compression uses all cores
+        compressor = zstandard.ZstdCompressor(
+            level=3 if level is None else level, threads=-1
+        )
+        file = zstandard.open(filename, mode, cctx=compressor)
+    # Many loaders (e.g. pickle) perform small reads
+    if mode == 'rb':
+        return io.BufferedReader(file)
+    return file
+
+
+def _open_lz4(filename: str, mode: str, level: int | None) -> typing.IO:
+    return lz4.frame.open(filename, mode, compression_level=0 if level is None else level)
+
+
+_codecs: dict[str, _Codec] = {
+    'gzip': _Codec('.gz', b'\x1f\x8b', _open_gzip, lambda: True),
+    'bz2': _Codec('.bz2', b'BZh', _open_bz2, lambda: True),
+    'lzma': _Codec('.xz', b'\xfd7zXZ\x00', _open_lzma, lambda: True),
+    'zstd': _Codec('.zst', b'\x28\xb5\x2f\xfd', _open_zstd, lambda: zstandard is not None),
+    'lz4': _Codec('.lz4', b'\x04\x22\x4d\x18', _open_lz4, lambda: lz4 is not None),
+}
+
+# Preferred codecs, in order
+_PREFERENCE = ('zstd', 'lz4', 'gzip')
+
+_active: contextvars.ContextVar[Compression | None] = contextvars.ContextVar(
+    'active_compression', default=None
+)
+
+
+def is_available(codec: str) -> bool:
+    return codec in _codecs and _codecs[codec].available()
+
+
+def get_default_codec() -> str:
+    """The fastest codec which is available."""
+    for codec in _PREFERENCE:
+        if is_available(codec):
+            return codec
+    raise RuntimeError('No compression codec available')
+
+
+def resolve(compression: Compression | None) -> Compression | None:
+    """Resolve the codec 'auto' to the fastest available codec,
+    and check that the codec is available.
+
+    Levels are codec specific, so the level of 'auto' is ignored.
+    """
+    if compression is None:
+        return None
+    if compression.codec == 'auto':
+        return Compression(get_default_codec())
+    validate(compression)
+    return compression
+
+
+def validate(compression: Compression):
+    if compression.codec not in _codecs:
+        raise ValueError(f'Unknown compression codec: {compression.codec!r}')
+    if not is_available(compression.codec):
+        raise ValueError(
+            f'Compression codec {compression.codec!r} is not available; '
+            f'install the package providing it'
+        )
+
+
+@contextlib.contextmanager
+def compressed(compression: Compression | None) -> typing.Iterator[None]:
+    """Compress the files opened for writing using `open_file`
+    within this context (in the current thread or task).
+    """
+    token = _active.set(resolve(compression))
+    try:
+        yield
+    finally:
+        _active.reset(token)
+
+
+def open_file(filename: str, mode: str = 'rb') -> typing.IO:
+    """Open a file of a checkpoint, (de)compressing it if necessary.
+
+    As for `open`, files are opened in text mode unless
+    the mode contains 'b'.
+    """
+    # Codecs open files in binary mode by default
+    codec_mode = mode if 'b' in mode or 't' in mode else mode + 't'
+    if 'r' in mode:
+        if os.path.exists(filename):
+            return open(filename, mode)
+        for codec in _codecs.values():
+            if os.path.exists(filename + codec.suffix):
+                return codec.open(filename + codec.suffix, codec_mode, None)
+        raise FileNotFoundError(filename)
+    compression = _active.get()
+    if compression is None:
+        return open(filename, mode)
+    codec = _codecs[compression.codec]
+    return codec.open(filename + codec.suffix, codec_mode, compression.level)
+
+
+def decompress_tree(path: str):
+    """Decompress the compressed files of a checkpoint in
+    a directory tree in place, removing their suffixes.
+    """
+    for directory, _, filenames in os.walk(path):
+        for filename in filenames:
+            for name, codec in _codecs.items():
+                if not filename.endswith(codec.suffix):
+                    continue
+                validate(Compression(name))
+                source = os.path.join(directory, filename)
+                with codec.open(source, 'rb', None) as compressed_file:
+                    with open(source.removesuffix(codec.suffix), 'wb') as file:
+                        shutil.copyfileobj(compressed_file, file, 1 << 20)
+                os.remove(source)
+                break
+
+
+def file_exists(filename: str) -> bool:
+    """Check whether a file of a checkpoint exists, compressed or not."""
+    return os.path.exists(filename) or any(
+        os.path.exists(filename + codec.suffix) for codec in _codecs.values()
+    )
+
+
+def open_stream(filename: str, mode: str, compression: Compression | None = None) -> typing.IO:
+    """Open a single file (e.g. an archive) in binary mode, (de)compressing
+    it if necessary. Unlike `open_file`, the name of the file is not
+    changed; the codec of a file which is read is detected from its contents.
+    """
+    if 'r' not in mode:
+        compression = resolve(compression)
+        if compression is None:
+            return open(filename, mode)
+        return _codecs[compression.codec].open(filename, mode, compression.level)
+    with open(filename, 'rb') as file:
+        header = file.read(8)
+    for name, codec in _codecs.items():
+        if header.startswith(codec.magic):
+            validate(Compression(name))
+            return codec.open(filename, mode, None)
+    return open(filename, mode)
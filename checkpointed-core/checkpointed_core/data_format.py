@@ -3,12 +3,16 @@ from __future__ import annotations
 import abc
 import typing
 
+from .compression import Compression, file_exists, open_file, validate
+
 _registry: dict[str, type[DataFormat]] | None = None
+_compression_by_format: dict[str, Compression] = {}
 
 
 def initialise_format_registry():
     global _registry
     _registry = {}
+    _compression_by_format.clear()
 
 
 def is_initialised() -> bool:
@@ -31,6 +35,24 @@ def get_format(name: str) -> type[DataFormat]:
     return _registry[name]
 
 
+def set_compression(name: str, compression: Compression | None):
+    """Set the compression used for checkpoints stored in a format.
+
+    Only applies to formats opening their files using `open_file`.
+    Steps can override the compression using `PipelineStep.get_compression`.
+    """
+    if compression is None:
+        _compression_by_format.pop(name, None)
+    else:
+        if compression.codec != 'auto':
+            validate(compression)
+        _compression_by_format[name] = compression
+
+
+def get_compression(name: str) -> Compression | None:
+    return _compression_by_format.get(name)
+
+
 def is_registered(name: str) -> bool:
     if _registry is None:
         raise RuntimeError("Format registry is not initialized")
@@ -48,3 +70,19 @@ class DataFormat(abc.ABC):
     @abc.abstractmethod
     def load(path: str) -> typing.Any:
         pass
+
+    @classmethod
+    def store_stream(cls, path: str, batches: typing.Iterable[list]):
+        """Store a result which is produced as a stream of batches.
+
+        The default implementation collects the stream into a single
+        list, which is stored using `store`. Formats which can write
+        incrementally should override this method (and `load_stream`),
+        so that streams are stored with bounded memory.
+        """
+        cls.store(path, [item for batch in batches for item in batch])
+
+    @classmethod
+    def load_stream(cls, path: str) -> typing.Iterator[list]:
+        """Load a (list-valued) result as a stream of batches."""
+        yield cls.load(path)
@@ -1,19 +1,154 @@
 from __future__ import annotations
 
+import asyncio
+import collections
+import concurrent.futures
+import contextlib
+import hashlib
+import itertools
 import json
 import logging
 import os
 import pickle
 import shutil
+import threading
 import typing
+import uuid
 
+from . import bundles
 from . import checkpointing
+from . import compression
 from . import data_format
+from . import fileutils
+from . import manifest
+from . import partitioning
+from . import scheduling
+from . import tiering
 from .graph import PipelineGraph
+from .compression import Compression
 from .handle import PipelineStepHandle
+from .shared_cache import SharedCache
 from .step import PipelineStep
 
 
+# Directory holding the checkpoints of the steps of a sub-pipeline,
+# inside the checkpoint of the step running the sub-pipeline
+NESTED_CHECKPOINT_DIRECTORY = 'nested'
+# Entries in checkpoint directories which are not part of the stored data
+_RESERVED_CHECKPOINT_ENTRIES = frozenset({NESTED_CHECKPOINT_DIRECTORY})
+# Marker file for checkpoints stored as separate partitions
+_PARTITIONS_FILE = 'partitions.json'
+# Files coordinating the runs (processes) sharing a checkpoint directory
+_SETUP_LOCK_FILE = 'setup.lock'
+_RUN_LOCK_FILE = 'run.lock'
+_CLAIMS_DIRECTORY = 'claims'
+
+
+def prepare_checkpoint(filename: str):
+    """Clear the data of a checkpoint, before new data is written to it.
+
+    Files are removed rather than overwritten, because they may be
+    linked to output files. Nested checkpoints are preserved.
+    """
+    os.makedirs(filename, exist_ok=True)
+    for entry in os.scandir(filename):
+        if entry.name in _RESERVED_CHECKPOINT_ENTRIES:
+            continue
+        if entry.is_dir(follow_symlinks=False):
+            shutil.rmtree(entry.path)
+        else:
+            os.remove(entry.path)
+
+
+def write_checkpoint(filename: str,
+                     formatter: type[data_format.DataFormat],
+                     value: typing.Any,
+                     codec: Compression | None = None) -> int:
+    """Write the data of a checkpoint, returning its size in bytes.
+
+    The data is durable once this function returns. The checkpoint
+    only becomes visible once it is committed to the manifest
+    by the owning `ResultStore`.
+    """
+    prepare_checkpoint(filename)
+    with compression.compressed(codec):
+        formatter.store(filename, value)
+    return fileutils.sync_tree(filename, exclude=_RESERVED_CHECKPOINT_ENTRIES)
+
+
+def load_checkpoint(filename: str,
+                    formatter: type[data_format.DataFormat]) -> typing.Any:
+    """Load the data of a checkpoint. Partitioned checkpoints
+    are returned as `Partitions`.
+    """
+    marker = os.path.join(filename, _PARTITIONS_FILE)
+    if not os.path.exists(marker):
+        return formatter.load(filename)
+    with open(marker) as file:
+        partitions = json.load(file)['partitions']
+    return partitioning.Partitions(
+        formatter.load(_get_partition_filename(filename, i)) for i in range(partitions)
+    )
+
+
+def load_checkpoint_stream(filename: str,
+                           formatter: type[data_format.DataFormat]) -> typing.Iterator[list]:
+    """Load the data of a checkpoint as a stream of batches,
+    concatenating the partitions of partitioned checkpoints.
+    """
+    marker = os.path.join(filename, _PARTITIONS_FILE)
+    if not os.path.exists(marker):
+        return formatter.load_stream(filename)
+    with open(marker) as file:
+        partitions = json.load(file)['partitions']
+    return itertools.chain.from_iterable(
+        formatter.load_stream(_get_partition_filename(filename, i))
+        for i in range(partitions)
+    )
+
+
+def _get_partition_filename(filename: str, index: int) -> str:
+    return os.path.join(filename, f'partition-{index}')
+
+
+def _get_validation(dependencies: list[str]) -> str:
+    # Signatures of the files the validity of a checkpoint depends on
+    return json.dumps([[path, fileutils.stat_signature(path)] for path in dependencies])
+
+
+def _is_validation_current(validation: str) -> bool:
+    return _get_validation([path for path, _ in json.loads(validation)]) == validation
+
+
+def lock_checkpoint_directory(directory: str) -> fileutils.FileLock | None:
+    """Lock a checkpoint directory exclusively, if no run is using it.
+
+    Returns the (held) lock, or None if the directory is in use.
+    """
+    with fileutils.FileLock(os.path.join(directory, _SETUP_LOCK_FILE)):
+        lock = fileutils.FileLock(os.path.join(directory, _RUN_LOCK_FILE))
+        if lock.acquire(blocking=False):
+            return lock
+        lock.release()
+        return None
+
+
+def _new_location() -> str:
+    # Locations do not depend on the step, so that checkpoints can be
+    # reassigned to other steps without moving them. Data directories
+    # are sharded, so that no directory holds more than a fraction
+    # of the checkpoints.
+    name = uuid.uuid4().hex
+    return f'store/{name[:2]}/{name}'
+
+
+def _update_duration(estimate: float | None, seconds: float) -> float:
+    if estimate is None:
+        return seconds
+    # Exponential moving average, so that estimates follow changes in the data
+    return 0.5 * estimate + 0.5 * seconds
+
+
 class ResultStore:
 
     def __init__(self, *,
@@ -21,17 +156,15 @@ class ResultStore:
                  checkpoint_directory: str,
                  graph: PipelineGraph,
                  config_by_step: dict[PipelineStepHandle, dict[str, typing.Any]],
-                 logger: logging.Logger):
+                 logger: logging.Logger,
+                 max_writers: int = 2,
+                 shared_cache: SharedCache | None = None,
+                 hot_tier: tiering.HotTier | None = None,
+                 scope: set[PipelineStepHandle] | None = None):
         if not data_format.is_initialised():
             data_format.initialise_format_registry()
         self._output_directory = output_directory
         self._checkpoint_directory = checkpoint_directory
-        self._checkpoint_metadata_directory = os.path.join(
-            self._checkpoint_directory, 'metadata'
-        )
-        self._checkpoint_data_directory = os.path.join(
-            self._checkpoint_directory, 'data'
-        )
         self._output_file_by_step = {
             node.handle: node.output_filename
             for node in graph.vertices
@@ -39,51 +172,214 @@ class ResultStore:
         }
         self._logger = logger
         self._make_directories()
-        # Load checkpointing
-        self._graph_file = os.path.join(
-            self._checkpoint_metadata_directory,
-            'graph.pickle'
+        # Write-behind persistence of checkpoints
+        self._max_writers = max_writers
+        self._writer_pool: concurrent.futures.ThreadPoolExecutor | None = None
+        self._pending_writes: dict[PipelineStepHandle, concurrent.futures.Future] = {}
+        self._pending_writes_lock = threading.Lock()
+        self._stored_in_session: set[PipelineStepHandle] = set()
+        self._statistics_file = os.path.join(
+            self._checkpoint_directory, 'statistics.json'
         )
+        self._step_durations = self._load_step_durations()
+        # Durations measured in this session, merged into the statistics file on close
+        self._measured_durations: dict[str, list[float]] = {}
+        self._entries_lock = threading.Lock()
         self._graph = graph
+        self._factories_by_handle = {
+            vertex.handle: vertex.factory for vertex in graph.vertices
+        }
         self._config_by_step = config_by_step
+        # Steps being run; checkpoints of other steps are kept without validating them
+        self._scope = scope
+        self._shared_cache = shared_cache
+        # Checkpoints written to the hot tier are promoted to the
+        # checkpoint directory in the background.
+        self._hot_tier = hot_tier
+        self._promotion_pool: concurrent.futures.ThreadPoolExecutor | None = None
+        self._promotions: dict[PipelineStepHandle, concurrent.futures.Future] = {}
+        self._promotions_lock = threading.Lock()
         self._checkpoint_graph = checkpointing.CheckpointGraph(graph, config_by_step)
-        if os.path.exists(self._graph_file):
-            with open(self._graph_file, 'rb') as f:
-                old_graph = pickle.load(f)
-            self._caching_mapping = self._checkpoint_graph.compute_checkpoint_mapping(
-                old_graph, logger
+        self._cutoff_lock = threading.Lock()
+        # Checkpoints whose validity has been checked when the run started
+        self._validated_checkpoints: set[PipelineStepHandle] = set()
+        # Runs (processes) sharing the checkpoint directory hold the run lock.
+        # Checkpoints are loaded and cleaned up by one run at a time.
+        self._run_lock = fileutils.FileLock(
+            os.path.join(self._checkpoint_directory, _RUN_LOCK_FILE)
+        )
+        self._setup_lock = fileutils.FileLock(
+            os.path.join(self._checkpoint_directory, _SETUP_LOCK_FILE)
+        )
+        self._setup_lock_depth = 0
+        self._setup_thread_lock = threading.RLock()
+        self._claims: dict[PipelineStepHandle, fileutils.FileLock] = {}
+        self._claims_lock = threading.Lock()
+        with self._lock_setup():
+            self._run_lock.acquire(shared=True)
+            if self._is_only_run():
+                # Claims are only held by runs using the checkpoint directory
+                shutil.rmtree(
+                    os.path.join(self._checkpoint_directory, _CLAIMS_DIRECTORY), ignore_errors=True
+                )
+            # Load checkpointing
+            self._manifest = manifest.Manifest(
+                os.path.join(self._checkpoint_directory, manifest.MANIFEST_FILENAME)
             )
-        else:
-            self._caching_mapping = {}
-        self._remap_checkpoints()
-        self._valid_static_checkpoints = self._check_static_checkpoints()
-        self._caching_mapping = self._checkpoint_graph.update_checkpoint_mapping(
-            self._caching_mapping, self._valid_static_checkpoints, logger
+            self._import_legacy_checkpoints()
+            self._entries = self._manifest.get_entries()
+            old_fingerprints, old_inputs = self._load_old_graph()
+            if old_fingerprints:
+                self._caching_mapping = self._checkpoint_graph.compute_checkpoint_mapping(
+                    old_fingerprints, old_inputs, logger
+                )
+            else:
+                self._caching_mapping = {}
+            self._remap_checkpoints()
+            self._valid_static_checkpoints = self._check_static_checkpoints()
+            dynamic_steps = self._checkpoint_graph.extract_dynamic_steps(self._caching_mapping)
+            # Steps with an invalid checkpoint are recomputed. If they produce
+            # the same output as before, the checkpoints depending on them remain
+            # valid (early cut-off), so these are kept until this is known.
+            self._previous_digests = {
+                handle: self._entries[handle.get_raw_identifier()].digest
+                for handle in self._caching_mapping
+                if handle not in self._valid_static_checkpoints
+                and handle not in dynamic_steps
+                and self.have_checkpoint_for(handle)
+                and self._entries[handle.get_raw_identifier()].digest is not None
+            }
+            # Dynamic checkpoints (and the checkpoints depending on them)
+            # are kept until the dynamic steps have run, and been marked.
+            self._caching_mapping = self._checkpoint_graph.update_checkpoint_mapping(
+                self._caching_mapping,
+                self._valid_static_checkpoints,
+                logger,
+                undecided={handle for handle in dynamic_steps if self.have_checkpoint_for(handle)},
+                recomputed=self._previous_digests.keys()
+            )
+            self._delete_invalidated_checkpoints()
+            # Checkpoints used by this run are the most recently used ones,
+            # even if they are never loaded (see `garbage_collection`).
+            self._manifest.touch(handle.get_raw_identifier() for handle in self._caching_mapping)
+            self._dynamic_checkpoints = dict.fromkeys(
+                self._checkpoint_graph.extract_dynamic_steps(self._caching_mapping), False
+            )
+            self._dynamic_checkpoint_requirements = self._checkpoint_graph.extract_dynamic_requirements(
+                self._caching_mapping, self._logger
+            )
+            if not self._checkpoint_graph.is_same_graph(old_fingerprints, old_inputs):
+                self._store_graph()
+
+    def _store_graph(self):
+        self._manifest.store_graph(
+            {
+                handle.get_raw_identifier(): fingerprint
+                for handle, fingerprint in self._checkpoint_graph.fingerprints.items()
+            },
+            {
+                handle.get_raw_identifier(): [
+                    (label, source.get_raw_identifier()) for label, source in inputs
+                ]
+                for handle, inputs in self._checkpoint_graph.inputs.items()
+            }
         )
-        self._delete_invalidated_checkpoints()
-        self._dynamic_checkpoints = dict.fromkeys(
-            self._checkpoint_graph.extract_dynamic_steps(self._caching_mapping), False
+
+    def _load_old_graph(self) -> tuple[dict[PipelineStepHandle, str],
+                                       dict[PipelineStepHandle, list[tuple[str, PipelineStepHandle]]]]:
+        fingerprints, inputs = self._manifest.load_graph()
+        handles = {step: PipelineStepHandle(step, None) for step in fingerprints}
+        return (
+            {handles[step]: fingerprint for step, fingerprint in fingerprints.items()},
+            {
+                handles[step]: [(label, handles[source]) for label, source in step_inputs]
+                for step, step_inputs in inputs.items()
+            }
         )
-        self._dynamic_checkpoint_requirements = self._checkpoint_graph.extract_dynamic_requirements(
-            self._caching_mapping, self._logger
+
+    def _import_legacy_checkpoints(self):
+        # Older versions stored the graph in a pickle, and the metadata
+        # of every checkpoint in a separate file. Import these once.
+        metadata_directory = os.path.join(self._checkpoint_directory, 'metadata')
+        graph_file = os.path.join(metadata_directory, 'graph.pickle')
+        if not os.path.exists(graph_file):
+            return
+        self._logger.info(f'Importing checkpoints from {self._checkpoint_directory} into manifest')
+        with open(graph_file, 'rb') as f:
+            old_graph = pickle.load(f)
+        # Older versions identified the type of steps by their class name
+        old_graph.upgrade_factory_names(self._factories_by_handle.values())
+        self._manifest.store_graph(
+            {
+                handle.get_raw_identifier(): fingerprint
+                for handle, fingerprint in old_graph.fingerprints.items()
+            },
+            {
+                handle.get_raw_identifier(): [
+                    (label, source.get_raw_identifier()) for label, source in inputs
+                ]
+                for handle, inputs in old_graph.inputs.items()
+            }
         )
-        self._valid_dynamic_endpoints = set()
-        with open(self._graph_file, 'wb') as f:
-            pickle.dump(self._checkpoint_graph, f)
+        data_directory = os.path.join(self._checkpoint_directory, 'data')
+        for name in os.listdir(data_directory) if os.path.isdir(data_directory) else ():
+            if not name.isdigit():
+                continue
+            location = f'data/{name}'
+            metadata_filename = os.path.join(metadata_directory, f'{name}.json')
+            # Data without metadata is registered as well, so that it is cleaned up
+            self._manifest.begin(int(name), location)
+            if os.path.exists(metadata_filename):
+                with open(metadata_filename) as file:
+                    metadata = json.load(file)
+                self._manifest.commit(
+                    int(name),
+                    location,
+                    None,
+                    metadata,
+                    fileutils.tree_size(
+                        self._get_path(location), exclude=_RESERVED_CHECKPOINT_ENTRIES
+                    ),
+                    fileutils.tree_digest(
+                        self._get_path(location), exclude=_RESERVED_CHECKPOINT_ENTRIES
+                    )
+                )
+        shutil.rmtree(metadata_directory)
 
     def _check_static_checkpoints(self) -> set[PipelineStepHandle]:
         valid_checkpoints = set()
-        factories_by_handle = {}
-        for vertex in self._graph.vertices:
-            factories_by_handle[vertex.handle] = vertex.factory
+        validations = {}
         for handle in self._caching_mapping:
             if not self.have_checkpoint_for(handle):
                 continue
-            instance = factories_by_handle[handle](self._config_by_step[handle],
-                                                   self._logger)
+            entry = self._entries[handle.get_raw_identifier()]
+            # The checkpoint may have been replaced by a concurrent run of another pipeline
+            if entry.fingerprint is not None and entry.fingerprint != self._checkpoint_graph.fingerprints[handle]:
+                continue
+            if self._scope is not None and handle not in self._scope:
+                valid_checkpoints.add(handle)
+                continue
+            # Checkpoints found valid by an earlier run remain valid
+            # until the files their validity depends on change.
+            if entry.validation is not None and _is_validation_current(entry.validation):
+                valid_checkpoints.add(handle)
+                self._validated_checkpoints.add(handle)
+                continue
+            instance = self._factories_by_handle[handle](self._config_by_step[handle],
+                                                         self._logger)
             if not instance.checkpoint_is_valid(self.retrieve_metadata(handle)):
                 continue
             valid_checkpoints.add(handle)
+            self._validated_checkpoints.add(handle)
+            dependencies = instance.get_checkpoint_dependencies()
+            if dependencies is not None:
+                validations[handle.get_raw_identifier()] = _get_validation(
+                    [os.path.abspath(path) for path in dependencies]
+                )
+        if validations:
+            self._manifest.set_validations(validations)
+            for step, validation in validations.items():
+                self._entries[step] = self._entries[step]._replace(validation=validation)
         return valid_checkpoints
 
     def sub_storage(self,
@@ -91,70 +387,150 @@ class ResultStore:
                     graph: PipelineGraph,
                     config_by_step: dict[PipelineStepHandle, dict[str, typing.Any]]) -> ResultStore:
         nested_checkpoint_directory = os.path.join(
-            self._get_checkpoint_filename(parent_handle), 'nested'
+            self._get_checkpoint_filename(parent_handle), NESTED_CHECKPOINT_DIRECTORY
         )
         return ResultStore(
             graph=graph,
             output_directory=None,
             checkpoint_directory=nested_checkpoint_directory,
             config_by_step=config_by_step,
-            logger=self._logger
+            logger=self._logger,
+            max_writers=self._max_writers
         )
 
     def _make_directories(self):
         os.makedirs(self._checkpoint_directory, exist_ok=True)
-        os.makedirs(self._checkpoint_metadata_directory, exist_ok=True)
-        os.makedirs(self._checkpoint_data_directory, exist_ok=True)
         if self._output_directory is not None:
             os.makedirs(self._output_directory, exist_ok=True)
 
     def _remap_checkpoints(self):
-        to_rename = []
+        # Checkpoints are assigned to the steps of the new graph by
+        # updating the manifest; their data is never moved.
+        moves = {}
         for new, old in self._caching_mapping.items():
-            if not os.path.exists(self._get_metadata_filename(old)):
+            entry = self._entries.get(old.get_raw_identifier())
+            if entry is None or not entry.committed or new == old:
                 continue
-            os.rename(
-                self._get_checkpoint_filename(old),
-                self._get_checkpoint_filename(new) + '_temp'
-            )
-            os.rename(
-                self._get_metadata_filename(old),
-                self._get_metadata_filename(new) + '_temp'
-            )
-            to_rename.append(new)
-        for new in to_rename:
-            os.rename(
-                self._get_checkpoint_filename(new) + '_temp',
-                self._get_checkpoint_filename(new)
-            )
-            os.rename(
-                self._get_metadata_filename(new) + '_temp',
-                self._get_metadata_filename(new)
-            )
-
-    def _delete_old_checkpoints(self):
-        keep_files = {
-            self._get_checkpoint_filename(h) for h in self._caching_mapping.values()
-        } | {
-            self._get_metadata_filename(h) for h in self._caching_mapping.values()
-        }
-        self._delete_checkpoints(keep_files)
+            moves[old.get_raw_identifier()] = (new.get_raw_identifier(), entry.location)
+        if not moves:
+            return
+        # Checkpoints of steps which are reassigned another checkpoint
+        self._delete_checkpoints(
+            self._entries.keys() - ({new for new, _ in moves.values()} - moves.keys())
+        )
+        self._manifest.move(moves)
+        self._entries = self._manifest.get_entries()
 
     def _delete_invalidated_checkpoints(self):
-        keep_files = {
-            self._get_checkpoint_filename(h) for h in self._caching_mapping
-        } | {
-            self._get_metadata_filename(h) for h in self._caching_mapping
+        # Checkpoints written during this session are always valid
+        keep = self._caching_mapping.keys() | self._stored_in_session
+        # Partitions of interrupted partitioned writes can be resumed
+        keep |= {
+            node.handle for node in self._graph.vertices
+            if self._has_partial_partitions(node.handle)
         }
-        self._delete_checkpoints(keep_files)
+        self._delete_checkpoints({handle.get_raw_identifier() for handle in keep})
+
+    def _delete_checkpoints(self, keep: set[int]):
+        remove = [step for step in list(self._entries) if step not in keep]
+        if not remove:
+            return
+        # Entries are invalidated before their data is removed,
+        # so that an interruption never leaves entries without data.
+        self._manifest.invalidate(remove)
+        self._remove_data([self._entries[step].location for step in remove])
+        self._manifest.remove(remove)
+        for step in remove:
+            del self._entries[step]
+
+    def _remove_data(self, locations: list[str]):
+        with self._lock_setup():
+            # Other runs may still be reading the data, which
+            # is then left to the garbage collector.
+            if not self._is_only_run():
+                self._logger.info(
+                    f'Keeping data of {len(locations)} removed checkpoint(s), '
+                    f'since other runs are using the checkpoint directory'
+                )
+                return
+            for location in locations:
+                path = self._get_path(location)
+                if os.path.exists(path):
+                    shutil.rmtree(path)
+
+    @contextlib.contextmanager
+    def _lock_setup(self) -> typing.Iterator[None]:
+        """Hold the setup lock of the checkpoint directory (reentrant)."""
+        with self._setup_thread_lock:
+            if self._setup_lock_depth == 0:
+                self._setup_lock.acquire()
+            self._setup_lock_depth += 1
+            try:
+                yield
+            finally:
+                self._setup_lock_depth -= 1
+                if self._setup_lock_depth == 0:
+                    self._setup_lock.release()
 
-    def _delete_checkpoints(self, keep: set[str]):
-        for file in self._get_metadata_files():
-            if file not in keep:
-                os.remove(file)
-        for file in self._get_checkpoint_files():
-            if file not in keep:
-                shutil.rmtree(file)
+    def _is_only_run(self) -> bool:
+        """Check whether no other run is using the checkpoint directory.
+
+        Must be called while holding the setup lock, which all
+        attempts to hold the run lock exclusively require.
+        """
+        only_run = self._run_lock.acquire(blocking=False)
+        self._run_lock.acquire(shared=True)
+        return only_run
+
+    def claim(self, handle: PipelineStepHandle) -> bool:
+        """Claim the computation of a step, waiting while another run
+        sharing the checkpoint directory computes the same step.
+
+        Returns True if the step does not have to be computed, because
+        another run stored a valid checkpoint for it. Otherwise, the claim
+        is held until the checkpoint of the step has been stored.
+        """
+        factory = self._factories_by_handle[handle]
+        # Dynamic checkpoints are only known to be valid once the step has run
+        if factory.has_dynamic_checkpoint():
+            return False
+        fingerprint = self._checkpoint_graph.fingerprints[handle]
+        claim = fileutils.FileLock(
+            os.path.join(self._checkpoint_directory, _CLAIMS_DIRECTORY, f'{fingerprint}.lock')
+        )
+        if not claim.acquire(blocking=False):
+            self._logger.info(f'Waiting for step {handle}, which is being computed by another run')
+            claim.acquire()
+        if self._adopt_checkpoint(handle):
+            claim.release()
+            return True
+        with self._claims_lock:
+            self._claims[handle] = claim
+        return False
+
+    def _adopt_checkpoint(self, handle: PipelineStepHandle) -> bool:
+        # The checkpoint may have been stored by another run
+        step = handle.get_raw_identifier()
+        entry = self._manifest.get_entry(step)
+        if entry is None or not entry.committed:
+            return False
+        if entry.fingerprint != self._checkpoint_graph.fingerprints[handle]:
+            return False
+        instance = self._factories_by_handle[handle](self._config_by_step[handle], self._logger)
+        if not instance.checkpoint_is_valid(json.loads(entry.metadata)):
+            return False
+        self._logger.info(f'Using checkpoint of step {handle} stored by another run')
+        with self._entries_lock:
+            self._entries[step] = entry
+        self._stored_in_session.add(handle)
+        self._apply_early_cutoff(handle, entry.digest)
+        return True
+
+    def _release_claim(self, handle: PipelineStepHandle):
+        with self._claims_lock:
+            claim = self._claims.pop(handle, None)
+        if claim is not None:
+            claim.release()
 
     def mark_checkpoint(self, handle: PipelineStepHandle, tainted: bool):
         if handle not in self._dynamic_checkpoints:
@@ -162,40 +538,786 @@ class ResultStore:
         elif self._dynamic_checkpoints[handle]:
             raise ValueError(f'Checkpoint {handle} already marked')
         self._dynamic_checkpoints[handle] = True
-        if not tainted:
+        if tainted:
             return
-        self._valid_dynamic_endpoints.add(handle)
-        self._caching_mapping = self._checkpoint_graph.update_checkpoint_mapping(
-            self._caching_mapping,
-            self._valid_static_checkpoints | self._valid_dynamic_endpoints,
-            self._logger
+        # Only the checkpoints depending on this step are affected
+        invalidated = self._checkpoint_graph.get_descendants(handle) & self._caching_mapping.keys()
+        for step in invalidated:
+            del self._caching_mapping[step]
+        self._logger.info(
+            f'Dynamic checkpoint {handle} is invalid; '
+            f'invalidated {len(invalidated)} dependent checkpoint(s)'
         )
-        self._delete_invalidated_checkpoints()
+        # Checkpoints written during this session are always valid
+        remove = {step.get_raw_identifier() for step in invalidated - self._stored_in_session}
+        self._delete_checkpoints(self._entries.keys() - remove)
+
+    async def wait_for_input_changes(self,
+                                     handle: PipelineStepHandle, *,
+                                     streamed: typing.Collection[PipelineStepHandle] = ()):
+        """Wait until it is known whether the inputs of a step which are
+        being recomputed have changed, which decides whether the
+        checkpoint of the step remains valid.
+        """
+        if handle not in self._caching_mapping:
+            return
+        for _, source in self._checkpoint_graph.inputs[handle]:
+            if source not in self._previous_digests:
+                continue
+            # The output of a streamed input is only complete after the step has run
+            if source not in streamed:
+                await self.wait_until_stored(source)
+            with self._cutoff_lock:
+                if source in self._previous_digests:
+                    self._invalidate_checkpoints({handle})
+                    return
+
+    def _apply_early_cutoff(self, handle: PipelineStepHandle, digest: str | None):
+        with self._cutoff_lock:
+            previous = self._previous_digests.pop(handle, None)
+            if previous is None:
+                return
+            if digest == previous:
+                self._logger.info(
+                    f'Output of step {handle} is unchanged; keeping checkpoints depending on it'
+                )
+                return
+            self._invalidate_checkpoints(self._checkpoint_graph.get_consumers(handle))
+
+    def _invalidate_checkpoints(self, handles: typing.Iterable[PipelineStepHandle]):
+        invalidated = {
+            handle for handle in handles
+            if handle in self._caching_mapping and handle not in self._stored_in_session
+        }
+        for handle in invalidated:
+            # Consumers are recomputed in turn, and may still produce the same output
+            entry = self._entries.get(handle.get_raw_identifier())
+            if entry is not None and entry.committed and entry.digest is not None:
+                self._previous_digests[handle] = entry.digest
+            del self._caching_mapping[handle]
+            self._logger.info(f'Invalidated checkpoint of step {handle}, since its inputs changed')
+        self._delete_checkpoints(
+            self._entries.keys() - {handle.get_raw_identifier() for handle in invalidated}
+        )
+
+    def _load_step_durations(self) -> dict[str, float]:
+        if not os.path.exists(self._statistics_file):
+            return {}
+        with open(self._statistics_file, 'r') as file:
+            return json.load(file).get('durations', {})
+
+    def get_step_durations(self) -> dict[str, float]:
+        return dict(self._step_durations)
+
+    def record_step_duration(self, factory: type[PipelineStep], seconds: float):
+        key = scheduling.get_factory_key(factory)
+        self._measured_durations.setdefault(key, []).append(seconds)
+        self._step_durations[key] = _update_duration(self._step_durations.get(key), seconds)
+
+    def _save_step_durations(self):
+        """Merge the durations measured in this session into the
+        statistics file, which may have been updated by other runs.
+        """
+        if not self._measured_durations:
+            return
+        with self._lock_setup():
+            durations = self._load_step_durations()
+            for key, measurements in self._measured_durations.items():
+                for seconds in measurements:
+                    durations[key] = _update_duration(durations.get(key), seconds)
+            fileutils.write_json_atomically(self._statistics_file, {'durations': durations})
+        self._measured_durations.clear()
 
     def store(self,
               handle: PipelineStepHandle,
               factory: type[PipelineStep],
               value: typing.Any,
               metadata: typing.Any) -> None:
+        self._wait_for_pending_write(handle)
+        self._stored_in_session.add(handle)
+        self._write(handle, factory, value, metadata)
+
+    def store_in_background(self,
+                            handle: PipelineStepHandle,
+                            factory: type[PipelineStep],
+                            value: typing.Any,
+                            metadata: typing.Any) -> concurrent.futures.Future:
+        """Store a result using a background writer.
+
+        The checkpoint only becomes visible once both data and metadata
+        have been written. Until then, attempts to access the checkpoint
+        wait for the write to finish.
+        """
+        self._wait_for_pending_write(handle)
+        self._stored_in_session.add(handle)
+        future = self._get_writer_pool().submit(self._write, handle, factory, value, metadata)
+        with self._pending_writes_lock:
+            self._pending_writes[handle] = future
+        future.add_done_callback(
+            lambda f, h=handle: self._finish_pending_write(h, f)
+        )
+        return future
+
+    def _get_writer_pool(self) -> concurrent.futures.ThreadPoolExecutor:
+        if self._writer_pool is None:
+            self._writer_pool = concurrent.futures.ThreadPoolExecutor(
+                max_workers=self._max_writers,
+                thread_name_prefix='checkpoint-writer'
+            )
+        return self._writer_pool
+
+    def store_stream_in_background(self,
+                                   handle: PipelineStepHandle,
+                                   factory: type[PipelineStep],
+                                   batches: typing.Iterator[list],
+                                   metadata: concurrent.futures.Future) -> concurrent.futures.Future:
+        """Store a result while it is being produced as a stream of batches.
+
+        `batches` is consumed on a dedicated writer thread, and `metadata`
+        must resolve once the producing step has finished. The write
+        fails if the stream is aborted.
+        """
+        self._wait_for_pending_write(handle)
+        self._stored_in_session.add(handle)
+        future = concurrent.futures.Future()
+
+        def write():
+            if not future.set_running_or_notify_cancel():
+                return
+            try:
+                self._write(handle, factory, batches, metadata, streamed=True)
+            except BaseException as e:
+                future.set_exception(e)
+            else:
+                future.set_result(None)
+
+        # Streams are not written using the writer pool, because a writer
+        # waiting for its stream could otherwise block the writers of the
+        # steps producing that stream.
+        with self._pending_writes_lock:
+            self._pending_writes[handle] = future
+        future.add_done_callback(
+            lambda f, h=handle: self._finish_pending_write(h, f)
+        )
+        threading.Thread(
+            target=write, name=f'checkpoint-stream-writer-{handle.get_raw_identifier()}', daemon=True
+        ).start()
+        return future
+
+    def begin_partitioned_write(self, handle: PipelineStepHandle, partitions: int):
+        """Prepare the checkpoint of a step for storing its result
+        as `partitions` separately written partitions.
+
+        Partitions from an earlier, interrupted write with the
+        same number of partitions are kept, so that they can be reused.
+        """
+        self._wait_for_pending_write(handle)
+        self._stored_in_session.add(handle)
+        filename = self._begin_write(handle)
+        marker = os.path.join(filename, _PARTITIONS_FILE)
+        if os.path.exists(marker):
+            with open(marker) as file:
+                if json.load(file)['partitions'] == partitions:
+                    return
+        prepare_checkpoint(filename)
+        fileutils.write_json_atomically(marker, {'partitions': partitions})
+
+    def load_partition(self,
+                       handle: PipelineStepHandle,
+                       factory: type[PipelineStep],
+                       index: int,
+                       digest: str | None) -> tuple[bool, typing.Any]:
+        """Load a partition stored by an earlier write, if it was
+        computed from inputs with the given digest.
+
+        Returns a tuple (found, value).
+        """
+        if digest is None:
+            return False, None
+        marker = self._get_partition_filename(handle, index) + '.json'
+        if not os.path.exists(marker):
+            return False, None
+        with open(marker) as file:
+            if json.load(file)['digest'] != digest:
+                return False, None
         formatter = data_format.get_format(factory.get_output_storage_format())
-        if handle in self._output_file_by_step:
-            # Store result
-            filename = self._get_output_filename(handle)
-            if os.path.exists(filename):
-                shutil.rmtree(filename)
-            os.makedirs(filename)
+        return True, formatter.load(self._get_partition_filename(handle, index))
+
+    def store_partition_in_background(self,
+                                      handle: PipelineStepHandle,
+                                      factory: type[PipelineStep],
+                                      index: int,
+                                      value: typing.Any,
+                                      digest: str | None) -> concurrent.futures.Future:
+        return self._get_writer_pool().submit(
+            self._write_partition, handle, factory, index, value, digest
+        )
+
+    def commit_partitions_in_background(self,
+                                        handle: PipelineStepHandle,
+                                        factory: type[PipelineStep],
+                                        writes: list[concurrent.futures.Future],
+                                        metadata: typing.Any) -> concurrent.futures.Future:
+        """Make a partitioned checkpoint visible once all of
+        its partitions have been written.
+        """
+        def commit():
+            for write in writes:
+                write.result()
+            size = fileutils.tree_size(
+                self._get_checkpoint_filename(handle), exclude=_RESERVED_CHECKPOINT_ENTRIES
+            )
+            self._commit_write(handle, factory, metadata, size)
+
+        # Submitted after the partitions, so the writers never wait on queued work
+        future = self._get_writer_pool().submit(commit)
+        with self._pending_writes_lock:
+            self._pending_writes[handle] = future
+        future.add_done_callback(
+            lambda f, h=handle: self._finish_pending_write(h, f)
+        )
+        return future
+
+    def _write_partition(self,
+                         handle: PipelineStepHandle,
+                         factory: type[PipelineStep],
+                         index: int,
+                         value: typing.Any,
+                         digest: str | None):
+        formatter = data_format.get_format(factory.get_output_storage_format())
+        filename = self._get_partition_filename(handle, index)
+        marker = filename + '.json'
+        if os.path.exists(marker):
+            os.remove(marker)
+        if os.path.exists(filename):
+            shutil.rmtree(filename)
+        os.makedirs(filename)
+        with compression.compressed(self.get_compression(handle, factory)):
             formatter.store(filename, value)
+        fileutils.sync_tree(filename)
+        fileutils.write_json_atomically(marker, {'digest': digest})
+
+    def _has_partial_partitions(self, handle: PipelineStepHandle) -> bool:
+        entry = self._entries.get(handle.get_raw_identifier())
+        return (
+            entry is not None
+            and not entry.committed
+            and os.path.exists(os.path.join(self._get_path(entry.location), _PARTITIONS_FILE))
+        )
+
+    def _get_partition_filename(self, handle: PipelineStepHandle, index: int) -> str:
+        return _get_partition_filename(self._get_checkpoint_filename(handle), index)
+
+    def begin_external_write(self, handle: PipelineStepHandle) -> str:
+        """Prepare the checkpoint of a step for being written by another
+        process sharing the checkpoint directory (e.g. a remote worker).
+
+        Returns the checkpoint filename to write the data to.
+        `finish_external_write` must be called once the write is complete.
+        """
+        self._wait_for_pending_write(handle)
+        self._stored_in_session.add(handle)
+        filename = self._begin_write(handle)
+        prepare_checkpoint(filename)
+        return os.path.abspath(filename)
+
+    def finish_external_write(self,
+                              handle: PipelineStepHandle,
+                              factory: type[PipelineStep],
+                              metadata: typing.Any):
+        if handle in self._output_file_by_step:
+            self._link_output(handle, self._get_checkpoint_filename(handle))
+        size = fileutils.tree_size(
+            self._get_checkpoint_filename(handle), exclude=_RESERVED_CHECKPOINT_ENTRIES
+        )
+        self._commit_write(handle, factory, metadata, size)
+
+    def _finish_pending_write(self, handle: PipelineStepHandle, future: concurrent.futures.Future):
+        # Failed writes are kept, so that the error is reported by `flush`
+        if future.exception() is not None:
+            return
+        with self._pending_writes_lock:
+            if self._pending_writes.get(handle) is future:
+                del self._pending_writes[handle]
+
+    def _get_pending_write(self, handle: PipelineStepHandle) -> concurrent.futures.Future | None:
+        with self._pending_writes_lock:
+            return self._pending_writes.get(handle)
+
+    def _wait_for_pending_write(self, handle: PipelineStepHandle):
+        future = self._get_pending_write(handle)
+        if future is not None:
+            future.result()
+
+    async def wait_until_stored(self, handle: PipelineStepHandle):
+        future = self._get_pending_write(handle)
+        if future is not None:
+            await asyncio.wrap_future(future)
+
+    async def flush(self, *, raise_errors=True):
+        """Wait until all background writes have finished."""
+        with self._pending_writes_lock:
+            futures = list(self._pending_writes.values())
+        results = await asyncio.gather(
+            *(asyncio.wrap_future(f) for f in futures), return_exceptions=True
+        )
+        with self._pending_writes_lock:
+            for handle, future in list(self._pending_writes.items()):
+                if future in futures:
+                    del self._pending_writes[handle]
+        # Writes promote their checkpoints once they have finished
+        with self._promotions_lock:
+            promotions = list(self._promotions.values())
+        results += await asyncio.gather(
+            *(asyncio.wrap_future(f) for f in promotions), return_exceptions=True
+        )
+        errors = [r for r in results if isinstance(r, BaseException)]
+        for error in errors:
+            self._logger.error(f'Error while storing checkpoint: {error}')
+        if errors and raise_errors:
+            raise errors[0]
+
+    def close(self):
+        if self._writer_pool is not None:
+            self._writer_pool.shutdown()
+            self._writer_pool = None
+        if self._promotion_pool is not None:
+            self._promotion_pool.shutdown()
+            self._promotion_pool = None
+        self._save_step_durations()
+        # Claims of steps whose checkpoint was never stored (e.g. after an error)
+        for handle in list(self._claims):
+            self._release_claim(handle)
+        self._manifest.close()
+        self._run_lock.release()
+
+    def _write(self,
+               handle: PipelineStepHandle,
+               factory: type[PipelineStep],
+               value: typing.Any,
+               metadata: typing.Any, *,
+               streamed=False) -> None:
+        formatter = data_format.get_format(factory.get_output_storage_format())
+        # Invalidate the old checkpoint before overwriting its data
+        filename = self._begin_write(handle)
+        placement = tiering.get_placement(factory.get_output_storage_format())
+        hot = self._hot_tier is not None and placement != tiering.COLD
+        if hot:
+            location = self._entries[handle.get_raw_identifier()].location
+            filename = self._hot_tier.prepare(location)
+        prepare_checkpoint(filename)
         # Store checkpoint
-        filename = self._get_checkpoint_filename(handle)
-        os.makedirs(filename, exist_ok=True)
-        formatter.store(filename, value)
-        # Store metadata
-        with open(self._get_metadata_filename(handle), 'w') as file:
-            json.dump(metadata, file)
+        with compression.compressed(self.get_compression(handle, factory)):
+            if streamed:
+                formatter.store_stream(filename, value)
+                metadata = metadata.result()
+            else:
+                formatter.store(filename, value)
+        # Nested checkpoints are accounted for by their own manifest
+        size = fileutils.sync_tree(filename, exclude=_RESERVED_CHECKPOINT_ENTRIES)
+        # Outputs are materialised from the checkpoint, instead of serialising twice
+        if handle in self._output_file_by_step:
+            self._link_output(handle, filename)
+        if hot:
+            self._promote_in_background(handle, factory, metadata, size, placement)
+            return
+        # Store metadata; only committed once the data is durable
+        self._commit_write(handle, factory, metadata, size)
+
+    def _promote_in_background(self,
+                               handle: PipelineStepHandle,
+                               factory: type[PipelineStep],
+                               metadata: typing.Any,
+                               size: int,
+                               placement: str):
+        """Promote a checkpoint written to the hot tier to the checkpoint directory.
+
+        Until it has been promoted, the checkpoint is only
+        visible to this run, which reads it from the hot tier.
+        """
+        step = handle.get_raw_identifier()
+        location = self._entries[step].location
+        codec = self.get_compression(handle, factory)
+        digest = fileutils.tree_digest(
+            self._hot_tier.get_path(location), exclude=_RESERVED_CHECKPOINT_ENTRIES
+        )
+        self._hot_tier.add(location, digest, size, placement=placement, promoted=False)
+        self._entries[step] = manifest.Entry(
+            step, location, True, factory.get_output_storage_format(), json.dumps(metadata),
+            size, None, None, digest, None if codec is None else str(codec),
+            self._checkpoint_graph.fingerprints[handle]
+        )
+        self._apply_early_cutoff(handle, digest)
+
+        def promote():
+            filename = self._get_path(location)
+            prepare_checkpoint(filename)
+            fileutils.link_tree(self._hot_tier.get_path(location), filename)
+            fileutils.sync_tree(filename, exclude=_RESERVED_CHECKPOINT_ENTRIES)
+            entry = self._entries[step]
+            self._entries[step] = self._manifest.commit(
+                step, location, entry.format, metadata, size, digest, entry.codec, entry.fingerprint
+            )
+            self._hot_tier.mark_promoted(location)
+            self._release_claim(handle)
+
+        if self._promotion_pool is None:
+            self._promotion_pool = concurrent.futures.ThreadPoolExecutor(
+                max_workers=self._max_writers,
+                thread_name_prefix='checkpoint-promotion'
+            )
+        future = self._promotion_pool.submit(promote)
+        with self._promotions_lock:
+            self._promotions[handle] = future
+        future.add_done_callback(lambda f, h=handle: self._finish_promotion(h, f))
+
+    def _finish_promotion(self, handle: PipelineStepHandle, future: concurrent.futures.Future):
+        # Failed promotions are kept, so that the error is reported by `flush`
+        if future.exception() is not None:
+            return
+        with self._promotions_lock:
+            if self._promotions.get(handle) is future:
+                del self._promotions[handle]
+
+    def _wait_for_promotion(self, handle: PipelineStepHandle):
+        with self._promotions_lock:
+            future = self._promotions.get(handle)
+        if future is not None:
+            future.result()
+
+    async def wait_until_durable(self, handle: PipelineStepHandle):
+        """Wait until the checkpoint of a step has been stored in the
+        checkpoint directory, rather than only in the hot tier.
+        """
+        await self.wait_until_stored(handle)
+        with self._promotions_lock:
+            future = self._promotions.get(handle)
+        if future is not None:
+            await asyncio.wrap_future(future)
+
+    def _begin_write(self, handle: PipelineStepHandle) -> str:
+        """Invalidate the checkpoint of a step, returning the
+        filename its new data is to be written to.
+        """
+        step = handle.get_raw_identifier()
+        # The location of the checkpoint may be reused
+        self._wait_for_promotion(handle)
+        with self._lock_setup(), self._entries_lock:
+            entry = self._entries.get(step)
+            if entry is None:
+                location = _new_location()
+            elif entry.committed and not self._is_only_run():
+                # Other runs may be reading the current data, which
+                # is left to the garbage collector.
+                location = _new_location()
+            else:
+                location = entry.location
+            self._entries[step] = self._manifest.begin(step, location)
+        return self._get_path(location)
+
+    def _commit_write(self,
+                      handle: PipelineStepHandle,
+                      factory: type[PipelineStep],
+                      metadata: typing.Any,
+                      size: int):
+        step = handle.get_raw_identifier()
+        location = self._entries[step].location
+        codec = self.get_compression(handle, factory)
+        self._entries[step] = self._manifest.commit(
+            step,
+            location,
+            factory.get_output_storage_format(),
+            metadata,
+            size,
+            fileutils.tree_digest(self._get_path(location), exclude=_RESERVED_CHECKPOINT_ENTRIES),
+            None if codec is None else str(codec),
+            self._checkpoint_graph.fingerprints[handle]
+        )
+        self._release_claim(handle)
+        self._apply_early_cutoff(handle, self._entries[step].digest)
+
+    def get_compression(self,
+                        handle: PipelineStepHandle,
+                        factory: type[PipelineStep]) -> Compression | None:
+        """Return the compression used for the checkpoint of a step,
+        as configured for the step, or else for its storage format.
+
+        Checkpoints of output steps are never compressed, since
+        the output files are materialised from the checkpoint.
+        """
+        if handle in self._output_file_by_step:
+            return None
+        codec = factory.get_compression()
+        if codec is None:
+            codec = data_format.get_compression(factory.get_output_storage_format())
+        return compression.resolve(codec)
+
+    @property
+    def uses_shared_cache(self) -> bool:
+        return self._shared_cache is not None
+
+    def get_content_key(self, handle: PipelineStepHandle) -> str | None:
+        """Key of the result of a step in the shared cache (and of its
+        partitions), computed from its type, its configuration,
+        and the contents of its inputs.
+
+        Returns None if the result of the step cannot be shared,
+        or the contents of some of its inputs are not known.
+        """
+        factory = self._factories_by_handle[handle]
+        if factory.has_dynamic_checkpoint():
+            return None
+        digest = hashlib.sha256()
+        digest.update(scheduling.get_factory_key(factory).encode())
+        digest.update(b'\0')
+        digest.update(checkpointing.hash_config(self._config_by_step[handle]).encode())
+        for label, source in sorted(self._checkpoint_graph.inputs[handle]):
+            self._wait_for_pending_write(source)
+            entry = self._entries.get(source.get_raw_identifier())
+            if entry is None or not entry.committed or entry.digest is None:
+                return None
+            digest.update(f'\0{label}={entry.digest}'.encode())
+        return digest.hexdigest()
+
+    def restore_from_shared_cache(self, handle: PipelineStepHandle) -> bool:
+        """Use the result of a step from the shared cache as its checkpoint,
+        if the cache holds a valid result for it.
+        """
+        if self._shared_cache is None:
+            return False
+        key = self.get_content_key(handle)
+        if key is None:
+            return False
+        self._wait_for_pending_write(handle)
+        filename = self._begin_write(handle)
+        prepare_checkpoint(filename)
+        try:
+            result = self._shared_cache.restore(key, self._get_cache_owner(), filename)
+        except FileNotFoundError:
+            # Removed by another process while it was being linked
+            result = None
+        if result is None:
+            return False
+        factory = self._factories_by_handle[handle]
+        instance = factory(self._config_by_step[handle], self._logger)
+        metadata = json.loads(result.metadata)
+        if not instance.checkpoint_is_valid(metadata):
+            return False
+        step = handle.get_raw_identifier()
+        self._entries[step] = self._manifest.commit(
+            step,
+            self._entries[step].location,
+            result.format,
+            metadata,
+            result.size,
+            result.digest,
+            fingerprint=self._checkpoint_graph.fingerprints[handle]
+        )
+        self._apply_early_cutoff(handle, result.digest)
+        self._stored_in_session.add(handle)
+        if handle in self._output_file_by_step:
+            self._link_output(handle)
+        return True
+
+    def publish_to_shared_cache(self):
+        """Add the results of all steps to the shared cache, and
+        release the results in the cache which are no longer used.
+
+        Results of steps outside the scope of the run have not been
+        validated, so these are not added, but remain referenced.
+        """
+        if self._shared_cache is None:
+            return
+        keys = []
+        for vertex in self._graph.vertices:
+            entry = self._entries.get(vertex.handle.get_raw_identifier())
+            if entry is None or not entry.committed:
+                continue
+            key = self.get_content_key(vertex.handle)
+            if key is None:
+                continue
+            if self._scope is not None and vertex.handle not in self._scope:
+                keys.append(key)
+                continue
+            self._shared_cache.publish(
+                key,
+                self._get_cache_owner(),
+                self._get_path(entry.location),
+                entry.format,
+                entry.metadata,
+                entry.size,
+                entry.digest,
+                exclude=_RESERVED_CHECKPOINT_ENTRIES
+            )
+            keys.append(key)
+        self._shared_cache.set_references(self._get_cache_owner(), keys)
+
+    def export_checkpoints(self,
+                           filename: str,
+                           pipeline: str, *,
+                           targets: typing.Iterable[PipelineStepHandle] | None = None,
+                           codec: Compression | None = None) -> list[PipelineStepHandle]:
+        """Export the valid checkpoints of the steps in `targets` and the
+        steps they depend on (by default, of all steps) to a bundle.
+
+        Checkpoints are only exported along with the checkpoints of their
+        inputs, since they cannot be used otherwise.
+        """
+        if targets is None:
+            steps = set(self._caching_mapping)
+        else:
+            steps = self._checkpoint_graph.get_ancestors(targets) & self._caching_mapping.keys()
+        steps = {handle for handle in steps if self.have_checkpoint_for(handle)}
+        inputs = self._checkpoint_graph.inputs
+        while unusable := {
+            handle for handle in steps
+            if any(source not in steps for _, source in inputs[handle])
+        }:
+            steps -= unusable
+        exported = sorted(steps, key=lambda h: h.get_raw_identifier())
+        checkpoints = []
+        for handle in exported:
+            entry = self._entries[handle.get_raw_identifier()]
+            checkpoint = bundles.BundledCheckpoint(
+                self._checkpoint_graph.fingerprints[handle],
+                entry.format,
+                entry.metadata,
+                entry.size,
+                entry.digest,
+                entry.codec
+            )
+            checkpoints.append((checkpoint, self._get_path(entry.location)))
+        size = bundles.write_bundle(filename, pipeline, checkpoints, codec=codec)
+        self._logger.info(f'Exported {len(exported)} checkpoint(s) to {filename} ({size} bytes)')
+        return exported
+
+    def import_checkpoints(self, filename: str) -> list[PipelineStepHandle]:
+        """Import the checkpoints in a bundle for the steps which do not
+        have a valid checkpoint, assigning them to steps by fingerprint.
+
+        No other runs may be using the checkpoint directory.
+        """
+        with self._lock_setup():
+            if not self._is_only_run():
+                raise RuntimeError(
+                    f'Cannot import checkpoints into {self._checkpoint_directory}, '
+                    f'since other runs are using it'
+                )
+            missing = collections.defaultdict(list)
+            for handle, fingerprint in self._checkpoint_graph.fingerprints.items():
+                if handle not in self._caching_mapping:
+                    missing[fingerprint].append(handle)
+            locations = {}
+
+            def select(header: bundles.BundleHeader) -> dict[int, str]:
+                self._logger.info(
+                    f'Importing checkpoints of pipeline {header.pipeline} from {filename}'
+                )
+                selected = {}
+                for index, checkpoint in enumerate(header.checkpoints):
+                    if checkpoint.fingerprint in missing:
+                        selected.setdefault(checkpoint.fingerprint, index)
+                locations.update({index: _new_location() for index in selected.values()})
+                return {index: self._get_path(location) for index, location in locations.items()}
+
+            try:
+                header = bundles.read_bundle(filename, select)
+            except BaseException:
+                for location in locations.values():
+                    shutil.rmtree(self._get_path(location), ignore_errors=True)
+                raise
+            imported = []
+            for index, location in locations.items():
+                checkpoint = header.checkpoints[index]
+                metadata = json.loads(checkpoint.metadata)
+                handles = missing[checkpoint.fingerprint]
+                instance = self._factories_by_handle[handles[0]](
+                    self._config_by_step[handles[0]], self._logger
+                )
+                if not instance.checkpoint_is_valid(metadata):
+                    self._logger.info(f'Skipping invalid checkpoint of step {handles[0]}')
+                    shutil.rmtree(self._get_path(location))
+                    continue
+                for i, handle in enumerate(handles):
+                    target = location
+                    if i > 0:
+                        # Steps with the same fingerprint have separate checkpoints
+                        target = _new_location()
+                        fileutils.link_tree(self._get_path(location), self._get_path(target))
+                    step = handle.get_raw_identifier()
+                    if step in self._entries:
+                        self._delete_checkpoints(self._entries.keys() - {step})
+                    size = fileutils.sync_tree(
+                        self._get_path(target), exclude=_RESERVED_CHECKPOINT_ENTRIES
+                    )
+                    self._entries[step] = self._manifest.commit(
+                        step,
+                        target,
+                        checkpoint.format,
+                        metadata,
+                        size,
+                        checkpoint.digest,
+                        checkpoint.codec,
+                        checkpoint.fingerprint
+                    )
+                    imported.append(handle)
+        self._logger.info(f'Imported {len(imported)} checkpoint(s) from {filename}')
+        return imported
+
+    def _get_cache_owner(self) -> str:
+        return os.path.abspath(self._checkpoint_directory)
+
+    def _link_output(self, handle: PipelineStepHandle, source: str | None = None):
+        """Materialise the output of a step from its checkpoint, or from
+        the newly written (uncompressed) data of its checkpoint in `source`.
+        """
+        filename = self._get_output_filename(handle)
+        if os.path.exists(filename):
+            shutil.rmtree(filename)
+        fileutils.link_tree(
+            self._get_checkpoint_filename(handle) if source is None else source,
+            filename,
+            exclude=_RESERVED_CHECKPOINT_ENTRIES
+        )
+        # Checkpoints from elsewhere (e.g. the shared cache) may be compressed
+        if source is None and self._is_compressed(handle):
+            compression.decompress_tree(filename)
+
+    def _is_compressed(self, handle: PipelineStepHandle) -> bool:
+        entry = self._entries.get(handle.get_raw_identifier())
+        return entry is not None and entry.codec is not None
+
+    def restore_output(self, handle: PipelineStepHandle):
+        """Make sure the output of a step with a valid checkpoint
+        is present in the output directory, without loading the checkpoint.
+        """
+        if handle not in self._output_file_by_step:
+            return
+        self._wait_for_pending_write(handle)
+        if self._is_compressed(handle):
+            # Decompressed outputs cannot be compared with the checkpoint
+            matches = os.path.isdir(self._get_output_filename(handle))
+        else:
+            matches = fileutils.trees_match(
+                self._get_checkpoint_filename(handle),
+                self._get_output_filename(handle),
+                exclude=_RESERVED_CHECKPOINT_ENTRIES
+            )
+        if not matches:
+            self._logger.info(f'Restoring output of step {handle} from checkpoint')
+            self._link_output(handle)
 
     def retrieve(self,
                  handle: PipelineStepHandle,
                  factory: type[PipelineStep]) -> typing.Any:
+        return partitioning.concatenate(self.retrieve_partitions(handle, factory))
+
+    def retrieve_partitions(self,
+                            handle: PipelineStepHandle,
+                            factory: type[PipelineStep]) -> typing.Any:
+        """Retrieve a checkpoint, without concatenating
+        the partitions of partitioned checkpoints.
+        """
         for requirement in self._dynamic_checkpoint_requirements.get(handle, set()):
             if not self._dynamic_checkpoints[requirement]:
                 raise RuntimeError(
@@ -203,30 +1325,98 @@ class ResultStore:
                     f'before taint value of dynamic checkpoint '
                     f'{requirement} has been set'
                 )
+        self._wait_for_pending_write(handle)
+        self._manifest.touch([handle.get_raw_identifier()])
+        formatter = data_format.get_format(factory.get_output_storage_format())
         filename = self._get_checkpoint_filename(handle)
+        if self._hot_tier is None:
+            return load_checkpoint(filename, formatter)
+        with self._hot_tier.pinned(self._entries[handle.get_raw_identifier()].location):
+            copy = self._get_readable_filename(handle)
+            try:
+                return load_checkpoint(copy, formatter)
+            except FileNotFoundError:
+                if copy == filename:
+                    raise
+        # The copy has been evicted by another process while it was read
+        self._logger.warning(f'Copy of checkpoint of step {handle} was evicted while loading it; '
+                             f'loading checkpoint from {filename}')
+        return load_checkpoint(filename, formatter)
+
+    def retrieve_stream(self,
+                        handle: PipelineStepHandle,
+                        factory: type[PipelineStep]) -> typing.Iterator[list]:
+        self._wait_for_pending_write(handle)
+        self._manifest.touch([handle.get_raw_identifier()])
         formatter = data_format.get_format(factory.get_output_storage_format())
-        return formatter.load(filename)
+        if self._hot_tier is None:
+            return load_checkpoint_stream(self._get_checkpoint_filename(handle), formatter)
+        return self._stream_from_hot_tier(handle, formatter)
+
+    def _stream_from_hot_tier(self,
+                              handle: PipelineStepHandle,
+                              formatter: type[data_format.DataFormat]) -> typing.Iterator[list]:
+        # Pinned until the stream is exhausted (or closed)
+        with self._hot_tier.pinned(self._entries[handle.get_raw_identifier()].location):
+            yield from load_checkpoint_stream(self._get_readable_filename(handle), formatter)
 
     def retrieve_metadata(self, handle: PipelineStepHandle):
-        with open(self._get_metadata_filename(handle), 'r') as file:
-            return json.load(file)
+        self._wait_for_pending_write(handle)
+        entry = self._entries.get(handle.get_raw_identifier())
+        if entry is None or not entry.committed:
+            raise ValueError(f'No checkpoint for step {handle}')
+        return json.loads(entry.metadata)
+
+    def is_validated(self, handle: PipelineStepHandle) -> bool:
+        """Check whether the checkpoint of a step has been found valid
+        when the run started, and has not been replaced since.
+        """
+        return handle in self._validated_checkpoints and handle not in self._stored_in_session
 
     def have_checkpoint_for(self, handle: PipelineStepHandle) -> bool:
-        return (
-            os.path.exists(self._get_checkpoint_filename(handle)) and
-            os.path.exists(self._get_metadata_filename(handle))
-        )
+        self._wait_for_pending_write(handle)
+        entry = self._entries.get(handle.get_raw_identifier())
+        return entry is not None and entry.committed
+
+    def has_output(self, handle: PipelineStepHandle) -> bool:
+        return handle in self._output_file_by_step
 
     def get_checkpoint_filename_for(self, handle: PipelineStepHandle) -> str:
         return self._get_checkpoint_filename(handle)
 
     def _get_checkpoint_filename(self, handle: PipelineStepHandle) -> str:
-        return os.path.join(
-            self._checkpoint_directory,
-            'data',
-            str(handle.get_raw_identifier())
+        step = handle.get_raw_identifier()
+        with self._entries_lock:
+            entry = self._entries.get(step)
+            if entry is None:
+                # Reserve a location, which is used once data is written
+                entry = self._entries[step] = self._manifest.begin(step, _new_location())
+        return self._get_path(entry.location)
+
+    def _get_readable_filename(self, handle: PipelineStepHandle) -> str:
+        """Return the filename to read the checkpoint of a step from,
+        which is in the hot tier if possible.
+        """
+        filename = self._get_checkpoint_filename(handle)
+        if self._hot_tier is None:
+            return filename
+        entry = self._entries[handle.get_raw_identifier()]
+        copy = self._hot_tier.lookup(entry.location, entry.digest)
+        if copy is not None:
+            return copy
+        # Checkpoints stored by older versions are not copied
+        placement = tiering.get_placement(entry.format)
+        if placement == tiering.COLD or entry.digest is None or not entry.location.startswith('store/'):
+            return filename
+        self._logger.info(f'Copying checkpoint of step {handle} to the hot tier')
+        return self._hot_tier.fetch(
+            entry.location, filename, entry.digest,
+            placement=placement, exclude=_RESERVED_CHECKPOINT_ENTRIES
         )
 
+    def _get_path(self, location: str) -> str:
+        return os.path.join(self._checkpoint_directory, location)
+
     def _get_output_filename(self, handle: PipelineStepHandle) -> str:
         if self._output_directory is None:
             raise ValueError('No output directory is set. '
@@ -236,24 +1426,6 @@ class ResultStore:
             self._output_file_by_step[handle]
         )
 
-    def _get_metadata_filename(self, handle: PipelineStepHandle):
-        return os.path.join(
-            self._checkpoint_metadata_directory,
-            str(handle.get_raw_identifier()) + '.json'
-        )
-
-    def _get_metadata_files(self) -> list[str]:
-        return [
-            os.path.join(self._checkpoint_metadata_directory, filename)
-            for filename in os.listdir(self._checkpoint_metadata_directory)
-        ]
-
-    def _get_checkpoint_files(self) -> list[str]:
-        return [
-            os.path.join(self._checkpoint_data_directory, filename)
-            for filename in os.listdir(self._checkpoint_data_directory)
-        ]
-
     def _get_output_files(self) -> list[str]:
         return [
             os.path.join(self._output_directory, filename)
@@ -0,0 +1,382 @@
+"""Execution of steps by worker processes, possibly on other machines.
+
+A `Coordinator` listens for worker processes, which connect to it
+using `run_worker`. The task executor sends steps which run in
+process mode to the coordinator, which dispatches them to idle workers.
+
+Workers load their inputs from, and store their results in, the
+checkpoint directory, which must therefore be shared between all
+machines (e.g. a network file system mounted at the same path).
+Messages are pickled, and connections are authenticated using
+a shared secret; workers should only be run on trusted networks.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import collections
+import importlib
+import itertools
+import logging
+import multiprocessing
+import multiprocessing.connection
+import os
+import pickle
+import socket
+import threading
+import traceback
+import typing
+
+from . import data_format
+from . import partitioning
+from .compression import Compression
+from .handle import PipelineStepHandle
+from .step import PipelineStep
+
+if typing.TYPE_CHECKING:
+    from .executor import StepOutcome
+
+
+class RemoteTask(typing.NamedTuple):
+    factory: type[PipelineStep]
+    config: dict[str, typing.Any]
+    logger_name: str
+    # Inputs sent along with the task
+    inputs: dict[str, typing.Any]
+    # Inputs loaded from the checkpoint directory, as (filename, format)
+    input_references: dict[str, tuple[str, str]]
+    input_formats: dict[str, str]
+    handle: PipelineStepHandle
+    checkpoint_directory: str
+    # If given, the worker stores the result as checkpoint data
+    # at this filename instead of sending it back.
+    output: str | None
+    output_compression: Compression | None = None
+
+
+class WorkerLostError(RuntimeError):
+    pass
+
+
+class Coordinator:
+    """Dispatches tasks to connected worker processes.
+
+    Every worker executes one task at a time. Tasks of workers which
+    disconnect are sent to another worker, at most `max_attempts` times.
+    """
+
+    def __init__(self,
+                 address: tuple[str, int] = ('localhost', 0), *,
+                 authkey: bytes,
+                 max_attempts: int = 3,
+                 logger: logging.Logger | None = None):
+        self._listener = multiprocessing.connection.Listener(address, authkey=authkey)
+        self._authkey = authkey
+        self._max_attempts = max_attempts
+        self._logger = logger if logger is not None else logging.getLogger(__name__)
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._idle: collections.deque[_Worker] = collections.deque()
+        self._waiting: collections.deque[asyncio.Future] = collections.deque()
+        self._workers: set[_Worker] = set()
+        # Futures of callers waiting for workers to connect
+        self._worker_waiters: list[asyncio.Future] = []
+        self._task_ids = itertools.count()
+        self._closed = False
+        self._accept_thread: threading.Thread | None = None
+
+    @property
+    def address(self) -> tuple[str, int]:
+        return self._listener.address
+
+    @property
+    def number_of_workers(self) -> int:
+        return len(self._workers)
+
+    def start(self, loop: asyncio.AbstractEventLoop):
+        if self._accept_thread is not None:
+            return
+        self._loop = loop
+        self._accept_thread = threading.Thread(
+            target=self._accept_workers, name='coordinator-accept', daemon=True
+        )
+        self._accept_thread.start()
+
+    def start_local_workers(self,
+                            number: int, *,
+                            preload_modules: typing.Iterable[str] = ()) -> list[multiprocessing.Process]:
+        """Start worker processes on this machine, e.g. for testing."""
+        processes = []
+        for _ in range(number):
+            process = multiprocessing.Process(
+                target=run_worker,
+                args=(self.address,),
+                kwargs={'authkey': self._authkey, 'preload_modules': list(preload_modules)},
+                daemon=True
+            )
+            process.start()
+            processes.append(process)
+        return processes
+
+    async def wait_for_workers(self, number: int, timeout: float | None = None):
+        async def wait():
+            while len(self._workers) < number:
+                waiter = asyncio.get_running_loop().create_future()
+                self._worker_waiters.append(waiter)
+                await waiter
+        await asyncio.wait_for(wait(), timeout)
+
+    async def execute(self, task: RemoteTask) -> StepOutcome:
+        for attempt in range(1, self._max_attempts + 1):
+            worker = await self._acquire_worker()
+            try:
+                return await worker.run(next(self._task_ids), task)
+            except WorkerLostError:
+                self._logger.warning(
+                    f'Lost worker {worker.name} while running {task.handle} '
+                    f'(attempt {attempt} of {self._max_attempts})'
+                )
+                if attempt == self._max_attempts:
+                    raise
+            except asyncio.CancelledError:
+                # The worker is still running the task, so it only
+                # becomes idle again once it has sent its reply.
+                if worker.busy:
+                    worker.release_on_reply = True
+                raise
+            finally:
+                if worker.alive and not worker.release_on_reply:
+                    self._release_worker(worker)
+
+    def shutdown(self):
+        self._closed = True
+        for worker in list(self._workers):
+            worker.close()
+        self._listener.close()
+
+    def _accept_workers(self):
+        while not self._closed:
+            try:
+                connection = self._listener.accept()
+            except (OSError, multiprocessing.AuthenticationError) as e:
+                if self._closed:
+                    return
+                self._logger.warning(f'Rejected worker connection: {e}')
+                continue
+            try:
+                _, name = connection.recv()
+            except (EOFError, OSError):
+                continue
+            worker = _Worker(self, connection, name)
+            self._loop.call_soon_threadsafe(self._add_worker, worker)
+
+    def _add_worker(self, worker: _Worker):
+        self._logger.info(f'Worker {worker.name} connected')
+        self._workers.add(worker)
+        worker.start()
+        self._release_worker(worker)
+        waiters, self._worker_waiters = self._worker_waiters, []
+        for waiter in waiters:
+            if not waiter.done():
+                waiter.set_result(None)
+
+    def _remove_worker(self, worker: _Worker):
+        self._workers.discard(worker)
+        if worker in self._idle:
+            self._idle.remove(worker)
+
+    async def _acquire_worker(self) -> _Worker:
+        if self._idle:
+            return self._idle.popleft()
+        waiter = self._loop.create_future()
+        self._waiting.append(waiter)
+        return await waiter
+
+    def _release_worker(self, worker: _Worker):
+        while self._waiting:
+            waiter = self._waiting.popleft()
+            if not waiter.done():
+                waiter.set_result(worker)
+                return
+        self._idle.append(worker)
+
+
+class _Worker:
+
+    def __init__(self,
+                 coordinator: Coordinator,
+                 connection: multiprocessing.connection.Connection,
+                 name: str):
+        self._coordinator = coordinator
+        self._connection = connection
+        self.name = name
+        self.alive = True
+        self._closed = False
+        # Set if the caller of the current task no longer waits for it,
+        # in which case the worker is released once its reply arrives.
+        self.release_on_reply = False
+        self._current: asyncio.Future | None = None
+        self._current_id: int | None = None
+        self._send_lock = threading.Lock()
+
+    def start(self):
+        threading.Thread(
+            target=self._receive, name=f'coordinator-{self.name}', daemon=True
+        ).start()
+
+    @property
+    def busy(self) -> bool:
+        return self.alive and self._current_id is not None
+
+    async def run(self, task_id: int, task: RemoteTask) -> StepOutcome:
+        if not self.alive:
+            raise WorkerLostError(self.name)
+        self._current = self._coordinator._loop.create_future()
+        self._current_id = task_id
+        try:
+            # Tasks may carry their inputs, so do not block the event loop
+            await asyncio.to_thread(self._send, ('task', (task_id, task)))
+        except OSError:
+            self._lost()
+        return await self._current
+
+    def _send(self, message: tuple[str, typing.Any]):
+        with self._send_lock:
+            self._connection.send(message)
+
+    def close(self):
+        self._closed = True
+        try:
+            self._send(('shutdown', None))
+        except OSError:
+            pass
+        self._connection.close()
+
+    def _receive(self):
+        loop = self._coordinator._loop
+        while True:
+            try:
+                kind, payload = self._connection.recv()
+            except Exception:
+                # Connections closed by `close` fail in various ways
+                if not self._closed:
+                    loop.call_soon_threadsafe(self._lost)
+                return
+            loop.call_soon_threadsafe(self._resolve, kind, payload)
+
+    def _resolve(self, kind: str, reply: tuple[int, typing.Any]):
+        task_id, payload = reply
+        # Replies are only expected for the current task
+        if task_id != self._current_id:
+            self._coordinator._logger.warning(
+                f'Ignoring reply of worker {self.name} to task {task_id}'
+            )
+            return
+        future, self._current, self._current_id = self._current, None, None
+        if self.release_on_reply:
+            self.release_on_reply = False
+            self._coordinator._release_worker(self)
+        if future is None or future.done():
+            return
+        if kind == 'result':
+            future.set_result(payload)
+        else:
+            future.set_exception(payload)
+
+    def _lost(self):
+        if not self.alive:
+            return
+        self.alive = False
+        self._coordinator._remove_worker(self)
+        future, self._current, self._current_id = self._current, None, None
+        if future is not None and not future.done():
+            future.set_exception(WorkerLostError(self.name))
+
+
+def run_worker(address: tuple[str, int], *,
+               authkey: bytes,
+               preload_modules: typing.Iterable[str] = ()):
+    """Connect to a coordinator, and execute tasks until it shuts down."""
+    for module in preload_modules:
+        importlib.import_module(module)
+    connection = multiprocessing.connection.Client(address, authkey=authkey)
+    connection.send(('hello', f'{socket.gethostname()}:{os.getpid()}'))
+    with connection:
+        while True:
+            try:
+                kind, payload = connection.recv()
+            except EOFError:
+                return
+            if kind == 'shutdown':
+                return
+            # Replies carry the identifier of their task
+            task_id, task = payload
+            try:
+                outcome = execute_remote_task(task)
+            except Exception as e:
+                connection.send(('error', (task_id, _make_transferable(e))))
+            else:
+                connection.send(('result', (task_id, outcome)))
+
+
+def execute_remote_task(task: RemoteTask) -> StepOutcome:
+    from . import data_store
+    from .executor import StepOutcome, _execute_in_worker
+    if not data_format.is_initialised():
+        data_format.initialise_format_registry()
+    inputs = dict(task.inputs)
+    for name, (filename, format_name) in task.input_references.items():
+        inputs[name] = partitioning.concatenate(
+            data_store.load_checkpoint(filename, data_format.get_format(format_name))
+        )
+    outcome = _execute_in_worker(
+        task.factory,
+        task.config,
+        task.logger_name,
+        inputs,
+        task.input_formats,
+        task.handle,
+        task.checkpoint_directory
+    )
+    if task.output is None:
+        return outcome
+    data_store.write_checkpoint(
+        task.output,
+        data_format.get_format(task.factory.get_output_storage_format()),
+        outcome.result,
+        task.output_compression
+    )
+    return StepOutcome(None, outcome.metadata, outcome.dynamic_checkpoint_is_valid)
+
+
+def _make_transferable(error: Exception) -> Exception:
+    tb = ''.join(traceback.format_exception(type(error), error, error.__traceback__))
+    try:
+        pickle.dumps(error)
+    except Exception:
+        return RuntimeError(f'{type(error).__name__}: {error}\n\nRemote traceback:\n{tb}')
+    if hasattr(error, 'add_note'):     # Python 3.11+
+        error.add_note(f'Remote traceback:\n{tb}')
+    return error
+
+
+def main(argv: list[str] | None = None):
+    """Run a worker, connecting to the coordinator at HOST:PORT.
+
+    The secret shared with the coordinator is read from
+    the CHECKPOINTED_AUTHKEY environment variable.
+    """
+    import sys
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv:
+        raise SystemExit(
+            'usage: python -m checkpointed_core.distributed HOST:PORT [MODULE ...]'
+        )
+    host, port = argv[0].rsplit(':', 1)
+    authkey = os.environ.get('CHECKPOINTED_AUTHKEY')
+    if authkey is None:
+        raise SystemExit('CHECKPOINTED_AUTHKEY is not set')
+    run_worker((host, int(port)), authkey=authkey.encode(), preload_modules=argv[1:])
+
+
+if __name__ == '__main__':
+    main()
@@ -1,26 +1,140 @@
 import asyncio
+import collections
+import concurrent.futures
+import heapq
+import importlib
 import logging
+import os
+import time
 import traceback
 import typing
 
 from .parameters import ConfigFactory
 from .handle import PipelineStepHandle
-from .instructions import Instruction, Start, Sync
+from .instructions import InstructionGraph, Start
 from .data_store import ResultStore
+from .distributed import Coordinator, RemoteTask
+from .handoff import HandoffCache
+from .resources import ResourceManager, validate_requirements
+from . import scheduling
+from . import partitioning
+from . import streaming
 from .step import PipelineStep
 
 
+EXECUTION_MODES = ('inline', 'thread', 'process')
+
+
+class StepOutcome(typing.NamedTuple):
+    result: typing.Any
+    metadata: typing.Any
+    dynamic_checkpoint_is_valid: bool | None
+
+
 class TaskExecutor:
 
-    def __init__(self, loop=None):
+    def __init__(self, loop=None, *,
+                 execution_mode: str = 'inline',
+                 max_workers: int | None = None,
+                 preload_modules: typing.Iterable[str] = (),
+                 resources: dict[str, float] | None = None,
+                 handoff_memory_limit: int | None = 2**30,
+                 stream_buffer_size: int = 8,
+                 partitions: int = 1,
+                 coordinator: Coordinator | None = None,
+                 allow_processes: bool | None = None):
+        if execution_mode not in EXECUTION_MODES:
+            raise ValueError(f'Invalid execution mode: {execution_mode!r}')
         self._loop = loop if loop is not None else asyncio.get_event_loop()
+        self._execution_mode = execution_mode
+        self._max_workers = max_workers if max_workers is not None else os.cpu_count()
+        self._preload_modules = set(preload_modules)
+        self._resource_manager = ResourceManager(resources)
+        self._handoff_memory_limit = handoff_memory_limit
+        self._stream_buffer_size = stream_buffer_size
+        if partitions < 1:
+            raise ValueError('Number of partitions must be at least 1')
+        self._partitions = partitions
+        self._coordinator = coordinator
+        if coordinator is not None:
+            coordinator.start(self._loop)
+        # Steps requesting process mode only run in worker processes
+        # if the caller configured the executor for it.
+        if allow_processes is None:
+            allow_processes = execution_mode == 'process' or coordinator is not None
+        self._allow_processes = allow_processes
+        self._thread_pool: concurrent.futures.ThreadPoolExecutor | None = None
+        self._process_pool: concurrent.futures.ProcessPoolExecutor | None = None
 
     @property
     def loop(self):
         return self._loop
 
+    @property
+    def execution_mode(self) -> str:
+        return self._execution_mode
+
+    @property
+    def resource_manager(self) -> ResourceManager:
+        return self._resource_manager
+
+    @property
+    def handoff_memory_limit(self) -> int | None:
+        return self._handoff_memory_limit
+
+    @property
+    def stream_buffer_size(self) -> int:
+        """Maximum number of batches buffered per streaming connection."""
+        return self._stream_buffer_size
+
+    @property
+    def allow_processes(self) -> bool:
+        """If False, steps requesting process mode run in worker threads."""
+        return self._allow_processes
+
+    @property
+    def coordinator(self) -> Coordinator | None:
+        """If set, steps running in process mode are executed by the
+        workers connected to the coordinator, instead of local processes.
+        """
+        return self._coordinator
+
+    @property
+    def partitions(self) -> int:
+        """Number of partitions for steps supporting partitioned execution."""
+        return self._partitions
+
+    def get_execution_mode(self, factory: type[PipelineStep]) -> str:
+        mode = factory.get_execution_mode()
+        if mode is None:
+            return self._execution_mode
+        if mode not in EXECUTION_MODES:
+            raise ValueError(
+                f'Step {factory.__name__} requested invalid execution mode: {mode!r}'
+            )
+        if mode == 'process' and not self._allow_processes:
+            return 'thread'
+        return mode
+
+    def prepare(self, factories: typing.Iterable[type[PipelineStep]]):
+        """Register the modules of all steps which will run in
+        process mode, so that they are imported when the worker
+        processes are started.
+        """
+        for factory in factories:
+            if self.get_execution_mode(factory) == 'process':
+                self._preload_modules.add(factory.__module__)
+
+    def shutdown(self):
+        if self._thread_pool is not None:
+            self._thread_pool.shutdown()
+            self._thread_pool = None
+        if self._process_pool is not None:
+            self._process_pool.shutdown()
+            self._process_pool = None
+
     async def run_session(self, *,
-                          instructions: list[Instruction],
+                          instructions: InstructionGraph,
                           result_store: ResultStore,
                           config_by_step: dict[PipelineStepHandle, dict[str, typing.Any]],
                           preloaded_inputs_by_step: dict[PipelineStepHandle, dict[str, typing.Any]],
@@ -36,13 +150,75 @@ class TaskExecutor:
         )
         await session.run()
 
+    async def execute_step(self, *,
+                           mode: str,
+                           factory: type[PipelineStep],
+                           config: dict[str, typing.Any],
+                           logger: logging.Logger,
+                           inputs: dict[str, typing.Any],
+                           input_formats: dict[str, str],
+                           handle: PipelineStepHandle,
+                           checkpoint_directory: str,
+                           context) -> StepOutcome:
+        if mode == 'process' and self._coordinator is not None:
+            return await self._coordinator.execute(
+                RemoteTask(
+                    factory=factory,
+                    config=config,
+                    logger_name=logger.name,
+                    inputs=inputs,
+                    input_references={},
+                    input_formats=input_formats,
+                    handle=handle,
+                    checkpoint_directory=os.path.abspath(checkpoint_directory),
+                    output=None
+                )
+            )
+        if mode == 'process':
+            return await self._loop.run_in_executor(
+                self._get_process_pool(),
+                _execute_in_worker,
+                factory,
+                config,
+                logger.name,
+                inputs,
+                input_formats,
+                handle,
+                checkpoint_directory
+            )
+        instance = factory(config, logger)
+        instance.input_storage_formats = input_formats
+        instance.execution_context = context
+        if mode == 'thread':
+            return await self._loop.run_in_executor(
+                self._get_thread_pool(), _run_instance, instance, inputs
+            )
+        result = await instance.execute(**inputs)
+        return _collect_outcome(instance, result)
+
+    def _get_thread_pool(self) -> concurrent.futures.ThreadPoolExecutor:
+        if self._thread_pool is None:
+            self._thread_pool = concurrent.futures.ThreadPoolExecutor(
+                max_workers=self._max_workers
+            )
+        return self._thread_pool
+
+    def _get_process_pool(self) -> concurrent.futures.ProcessPoolExecutor:
+        if self._process_pool is None:
+            self._process_pool = concurrent.futures.ProcessPoolExecutor(
+                max_workers=self._max_workers,
+                initializer=_initialise_worker,
+                initargs=(sorted(self._preload_modules),)
+            )
+        return self._process_pool
+
 
 class Session:
 
     def __init__(self,
                  loop,
                  executor: TaskExecutor, *,
-                 instructions: list[Instruction],
+                 instructions: InstructionGraph,
                  result_store: ResultStore,
                  config_by_step: dict[PipelineStepHandle, dict[str, typing.Any]],
                  preloaded_inputs_by_step: dict[PipelineStepHandle, dict[str, typing.Any]],
@@ -53,17 +229,47 @@ class Session:
         self._config_by_step = config_by_step
         self._preloaded_inputs_by_step = preloaded_inputs_by_step
         self._logger = logger
-        self._pending: list[Start] = []
-        self._blocked: list[Sync] = []
-        for instruction in instructions:
-            if isinstance(instruction, Start):
-                self._pending.append(instruction)
-            elif isinstance(instruction, Sync):
-                self._blocked.append(instruction)
-            else:
-                raise NotImplementedError(f"Instruction {instruction} is not supported")
-        self._active = set()
-        self._done = set()
+        self._graph = instructions
+        self._executor.prepare(start.factory for start in self._graph.starts)
+        self._priorities = scheduling.compute_critical_path_priorities(
+            self._graph,
+            scheduling.estimate_costs(
+                [start.factory for start in self._graph.starts],
+                self._result_store.get_step_durations()
+            )
+        )
+        # Steps connected through streams are scheduled as a single
+        # group, with the combined resource requirements of its steps.
+        self._group_priorities = [
+            max(self._priorities[i] for i in group) for group in self._graph.groups
+        ]
+        self._partitions = [self._get_partition_count(i) for i in range(len(self._graph))]
+        self._requirements = []
+        for group in self._graph.groups:
+            requirements = collections.Counter()
+            for i in group:
+                # The partitions of a step run in parallel
+                requirements.update({
+                    name: amount * self._partitions[i]
+                    for name, amount in self._get_resource_requirements(self._graph.starts[i]).items()
+                })
+            self._requirements.append(dict(requirements))
+        # Number of unfinished dependencies per group
+        self._remaining_dependencies = list(self._graph.group_in_degree)
+        # Ready groups are kept in one heap of (-priority, group) per
+        # distinct set of resource requirements, so that finding the
+        # next task which fits in the budget does not require
+        # looking at every ready task.
+        self._pending: dict[tuple, list[tuple[float, int]]] = collections.defaultdict(list)
+        self._number_pending = 0
+        self._running = 0
+        self._running_tasks: set[asyncio.Task] = set()
+        self._completed: asyncio.Queue[asyncio.Task] = asyncio.Queue()
+        # Results produced in this session, kept in memory for their consumers
+        self._handoff = HandoffCache(executor.handoff_memory_limit, logger)
+        for index, degree in enumerate(self._remaining_dependencies):
+            if degree == 0:
+                self._push_pending(index)
 
     @staticmethod
     def _get_config_factory() -> ConfigFactory:
@@ -75,36 +281,50 @@ class Session:
         config_factory.register('system.step.storage.current-checkpoint-directory')
         config_factory.register('system.step.handle')
         config_factory.register_namespace('system.executor')
-        # config_factory.register('system.executor.resource-manager')    # maybe in the future
+        config_factory.register('system.executor.resource-manager')
         config_factory.register('system.executor.storage-manager')
         config_factory.register('system.executor.current-executor')
+        config_factory.register('system.executor.execution-mode')
         return config_factory
 
+    def _push_pending(self, index: int):
+        key = tuple(sorted(self._requirements[index].items()))
+        heapq.heappush(self._pending[key], (-self._group_priorities[index], index))
+        self._number_pending += 1
+
     async def run(self):
-        while self._pending or self._blocked or self._active:
-            self._unblock_pending_tasks()
-            self._start_pending_tasks()
-            await self._handle_done_tasks()
-
-    def _unblock_pending_tasks(self):
-        for task in self._blocked.copy():
-            if task.steps <= self._done:
-                self._logger.info(f"Unblocking {len(task.then)} tasks")
-                self._blocked.remove(task)
-                self._pending.extend(task.then)
-
-    async def _handle_done_tasks(self):
-        done, self._active = await asyncio.wait(
-            self._active, return_when=asyncio.FIRST_COMPLETED
-        )
-        exceptions = []
-        for data in done:
-            if (exc := data.exception()) is not None:
-                self._emit_task_error(exc, do_raise=False)
-                exceptions.append(exc)
-            handle, factory = data.result()
-            self._logger.info(f'Task {handle} finished')
-            self._done.add(handle)
+        try:
+            while self._number_pending or self._running:
+                self._start_pending_tasks()
+                if not self._running:
+                    # All resources are held by another session sharing the executor
+                    await self._executor.resource_manager.wait_for_release()
+                    continue
+                self._handle_done_task(await self._completed.get())
+        except BaseException:
+            # Running tasks may be feeding streams which are being written
+            for task in self._running_tasks:
+                task.cancel()
+            await asyncio.gather(*self._running_tasks, return_exceptions=True)
+            await self._result_store.flush(raise_errors=False)
+            raise
+        finally:
+            self._handoff.clear()
+        # Do not finish before all checkpoints have been persisted
+        await self._result_store.flush()
+
+    def _handle_done_task(self, task: asyncio.Task):
+        self._running -= 1
+        self._running_tasks.discard(task)
+        if (exc := task.exception()) is not None:
+            self._emit_task_error(exc)
+        group = task.result()
+        for index in self._graph.groups[group]:
+            self._logger.info(f'Task {self._graph.starts[index].step} finished')
+        for successor in self._graph.group_successors[group]:
+            self._remaining_dependencies[successor] -= 1
+            if self._remaining_dependencies[successor] == 0:
+                self._push_pending(successor)
 
     def _emit_task_error(self, exc: BaseException, *, do_raise=True):
         self._logger.error(f'Error in task: {exc}')
@@ -116,22 +336,76 @@ class Session:
             raise exc
 
     def _start_pending_tasks(self):
-        while self._pending:
-            task = self._pending.pop()
-            self._logger.info(f"Starting pending task {task.step}")
-            self._active.add(asyncio.Task(self._build_task_wrapper(task), loop=self._loop))
+        # Tasks are considered in order of their remaining critical path length.
+        # Tasks which do not fit in the resource budget are skipped,
+        # so that cheaper tasks can use the remaining resources.
+        resource_manager = self._executor.resource_manager
+        candidates = {key for key, heap in self._pending.items() if heap}
+        while candidates:
+            key = min(candidates, key=lambda k: self._pending[k][0])
+            requirements = dict(key)
+            if not resource_manager.can_acquire(requirements):
+                candidates.discard(key)
+                continue
+            priority, index = heapq.heappop(self._pending[key])
+            if not self._pending[key]:
+                candidates.discard(key)
+            self._number_pending -= 1
+            resource_manager.acquire(requirements)
+            steps = ', '.join(str(self._graph.starts[i].step) for i in self._graph.groups[index])
+            self._logger.info(
+                f"Starting pending task {steps} "
+                f"(priority: {-priority:.2f}, "
+                f"resources: {resource_manager.describe(requirements)})"
+            )
+            self._running += 1
+            wrapper = asyncio.Task(self._build_task_wrapper(index), loop=self._loop)
+            self._running_tasks.add(wrapper)
+            wrapper.add_done_callback(self._completed.put_nowait)
+        if self._number_pending:
+            self._logger.info(
+                f"{self._number_pending} task(s) waiting for resources "
+                f"(in use: {resource_manager.describe(resource_manager.in_use)})"
+            )
+
+    @staticmethod
+    def _get_resource_requirements(task: Start) -> dict[str, float]:
+        return validate_requirements(
+            f'step {task.step}', task.factory.get_resource_requirements()
+        )
+
+    def _get_partition_count(self, index: int) -> int:
+        start = self._graph.starts[index]
+        if self._executor.partitions == 1 or not start.factory.get_partitioned_inputs():
+            return 1
+        # Streams, outputs, and dynamic checkpoints require the complete result
+        if len(self._graph.groups[self._graph.group_of[index]]) > 1:
+            return 1
+        if self._result_store.has_output(start.step) or start.factory.has_dynamic_checkpoint():
+            return 1
+        return self._executor.partitions
 
     def _prepare_task_inputs(self,
                              task_handle: PipelineStepHandle,
                              inputs: list[tuple[PipelineStepHandle, type[PipelineStep], str]],
-                             logger: logging.Logger):
+                             logger: logging.Logger, *,
+                             partitioned: typing.Collection[str] = ()):
         args = {}
         input_formats = {}
         for handle, factory, name in inputs:
             if name not in self._preloaded_inputs_by_step.get(handle, {}):
-                logger.info(f'Loading input {name} ({handle}, type {factory.__name__}) '
-                            f'for task {task_handle}')
-                args[name] = self._result_store.retrieve(handle, factory)
+                found, value = self._handoff.get(handle)
+                if found:
+                    logger.info(f'Using in-memory input {name} ({handle}, type {factory.__name__}) '
+                                f'for task {task_handle}')
+                else:
+                    logger.info(f'Loading input {name} ({handle}, type {factory.__name__}) '
+                                f'for task {task_handle}')
+                    value = self._result_store.retrieve_partitions(handle, factory)
+                # Partitions are only kept for steps partitioned over the same input
+                if name not in partitioned:
+                    value = partitioning.concatenate(value)
+                args[name] = value
                 input_formats[name] = factory.get_output_storage_format()
             else:
                 logger.info(f'Loading input {name} ({handle}, type {factory.__name__}) '
@@ -147,42 +421,422 @@ class Session:
         )
         config.set('system.executor.storage-manager', self._result_store)
         config.set('system.executor.current-executor', self._executor)
+        config.set('system.executor.resource-manager', self._executor.resource_manager)
         return args, input_formats, config
 
-    def _build_task_wrapper(self, task: Start):
-        async def wrapper(_handle=task.step,
-                          _factory=task.factory,
-                          _inputs=tuple(task.inputs)):
-            logger = self._logger.getChild(str(_handle))
-            logger.info('Checking checkpoint...')
-            if self._can_skip(_handle, _factory):
-                logger.info(f'Skipping task (found valid checkpoint)')
-                return _handle, _factory
-            logger.info(f'Running task (no valid checkpoint)')
-            instance = _factory(self._config_by_step[_handle], logger)
-            inputs, input_formats, config = self._prepare_task_inputs(
-                _handle, _inputs, logger
-            )
-            instance.input_storage_formats = input_formats
-            instance.execution_context = config
-            result = await instance.execute(**dict(inputs))
+    def _build_task_wrapper(self, group: int):
+
+        async def wrapper():
+            try:
+                if len(self._graph.groups[group]) == 1:
+                    index, = self._graph.groups[group]
+                    await self._run_task(index)
+                else:
+                    await self._run_streaming_group(group)
+            finally:
+                self._executor.resource_manager.release(self._requirements[group])
+            return group
+
+        return wrapper()
+
+    async def _run_streaming_group(self, group: int):
+        members = self._graph.groups[group]
+        in_channels = {i: {} for i in members}
+        out_channels = {i: [] for i in members}
+        for target in members:
+            start = self._graph.starts[target]
+            for source, _, label in start.inputs:
+                if label in start.streamed_inputs:
+                    channel = streaming.Channel(self._executor.stream_buffer_size)
+                    in_channels[target][label] = channel
+                    out_channels[self._graph.index_by_step[source]].append(channel)
+        tasks = [
+            asyncio.ensure_future(
+                self._run_task(i, in_channels=in_channels[i], out_channels=out_channels[i])
+            )
+            for i in members
+        ]
+        try:
+            await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+
+    async def _run_task(self,
+                        index: int, *,
+                        in_channels: dict[str, streaming.Channel] | None = None,
+                        out_channels: list[streaming.Channel] | None = None):
+        start = self._graph.starts[index]
+        handle, factory, inputs = start.step, start.factory, start.inputs
+        in_channels = in_channels or {}
+        out_channels = out_channels or []
+        logger = self._logger.getChild(str(handle))
+        logger.info('Checking checkpoint...')
+        await self._result_store.wait_for_input_changes(
+            handle, streamed={source for source, _, name in inputs if name in in_channels}
+        )
+        if self._can_skip(handle, factory):
+            logger.info(f'Skipping task (found valid checkpoint)')
+            await self._skip_task(index, in_channels, out_channels, logger)
+            return
+        if not in_channels and await self._restore_from_shared_cache(index, logger):
+            logger.info(f'Skipping task (found valid result in shared cache)')
+            await self._skip_task(index, in_channels, out_channels, logger)
+            return
+        # Runs sharing the checkpoint directory never compute the same step
+        # at the same time. Steps which stream are always computed.
+        if not (in_channels or out_channels) and await self._claim(index):
+            logger.info(f'Skipping task (computed by another run)')
+            await self._skip_task(index, in_channels, out_channels, logger)
+            return
+        materialised_inputs = [entry for entry in inputs if entry[2] not in in_channels]
+        for source, _, _ in materialised_inputs:
+            if source not in self._handoff:
+                await self._result_store.wait_until_stored(source)
+        if self._partitions[index] > 1:
+            await self._run_partitioned_task(index, logger)
+            return
+        mode = self._executor.get_execution_mode(factory)
+        if mode == 'process' and self._executor.coordinator is not None and not (in_channels or out_channels):
+            await self._run_remote_task(index, logger)
+            return
+        args, input_formats, config = self._prepare_task_inputs(
+            handle, materialised_inputs, logger
+        )
+        if in_channels or out_channels:
+            await self._run_streamed_task(
+                index, args, input_formats, config, in_channels, out_channels, logger
+            )
+            return
+        logger.info(f'Running task (no valid checkpoint, mode: {mode})')
+        config.set('system.executor.execution-mode', mode)
+        started = time.monotonic()
+        outcome = await self._executor.execute_step(
+            mode=mode,
+            factory=factory,
+            config=self._config_by_step[handle],
+            logger=logger,
+            inputs=dict(args),
+            input_formats=input_formats,
+            handle=handle,
+            checkpoint_directory=config.get(
+                'system.step.storage.current-checkpoint-directory'
+            ),
+            context=config
+        )
+        self._result_store.record_step_duration(factory, time.monotonic() - started)
+        # Consumers receive the result immediately, while the
+        # checkpoint is written in the background.
+        self._handoff.put(handle, outcome.result, consumers=self._count_consumers(index))
+        logger.info(f'Storing result')
+        self._result_store.store_in_background(handle,
+                                               factory,
+                                               outcome.result,
+                                               outcome.metadata)
+        self._finish_task(handle, factory, outcome, logger)
+
+    async def _skip_task(self,
+                         index: int,
+                         in_channels: dict[str, streaming.Channel],
+                         out_channels: list[streaming.Channel],
+                         logger: logging.Logger):
+        start = self._graph.starts[index]
+        self._result_store.restore_output(start.step)
+        for source, _, name in start.inputs:
+            if name not in in_channels:
+                self._handoff.release(source)
+        for channel in in_channels.values():
+            channel.detach()
+        if out_channels:
+            await self._replay_checkpoint(start.step, start.factory, out_channels, logger)
+
+    async def _restore_from_shared_cache(self, index: int, logger: logging.Logger) -> bool:
+        if not self._result_store.uses_shared_cache:
+            return False
+        start = self._graph.starts[index]
+        # Results in the cache are addressed by the contents of their inputs
+        for source, _, _ in start.inputs:
+            await self._result_store.wait_until_stored(source)
+        logger.info('Checking shared cache...')
+        return await asyncio.to_thread(self._result_store.restore_from_shared_cache, start.step)
+
+    async def _claim(self, index: int) -> bool:
+        return await asyncio.to_thread(self._result_store.claim, self._graph.starts[index].step)
+
+    async def _run_remote_task(self, index: int, logger: logging.Logger):
+        # Only references to the inputs are sent; the worker loads them
+        # from the shared checkpoint directory, and stores its result there.
+        start = self._graph.starts[index]
+        handle, factory = start.step, start.factory
+        logger.info(f'Running task (no valid checkpoint, mode: process, remote)')
+        preloaded = self._preloaded_inputs_by_step.get(handle, {})
+        input_formats = {
+            name: source_factory.get_output_storage_format()
+            for _, source_factory, name in start.inputs
+        }
+        references = {}
+        for source, _, name in start.inputs:
+            if name in preloaded:
+                continue
+            await self._result_store.wait_until_durable(source)
+            self._handoff.release(source)
+            references[name] = (
+                os.path.abspath(self._result_store.get_checkpoint_filename_for(source)),
+                input_formats[name]
+            )
+        checkpoint_directory = self._result_store.get_checkpoint_filename_for(handle)
+        output = self._result_store.begin_external_write(handle)
+        started = time.monotonic()
+        outcome = await self._executor.coordinator.execute(
+            RemoteTask(
+                factory=factory,
+                config=self._config_by_step[handle],
+                logger_name=logger.name,
+                inputs={name: value for name, value in preloaded.items()},
+                input_references=references,
+                input_formats=input_formats,
+                handle=handle,
+                checkpoint_directory=os.path.abspath(checkpoint_directory),
+                output=output,
+                output_compression=self._result_store.get_compression(handle, factory)
+            )
+        )
+        self._result_store.record_step_duration(factory, time.monotonic() - started)
+        self._result_store.finish_external_write(handle, factory, outcome.metadata)
+        self._finish_task(handle, factory, outcome, logger)
+
+    async def _run_streamed_task(self,
+                                 index: int,
+                                 args: dict[str, typing.Any],
+                                 input_formats: dict[str, str],
+                                 config,
+                                 in_channels: dict[str, streaming.Channel],
+                                 out_channels: list[streaming.Channel],
+                                 logger: logging.Logger):
+        start = self._graph.starts[index]
+        handle, factory = start.step, start.factory
+        logger.info(f'Running task (no valid checkpoint, mode: inline, streamed)')
+        config.set('system.executor.execution-mode', 'inline')
+        for source, source_factory, name in start.inputs:
+            if name in in_channels:
+                args[name] = in_channels[name]
+                input_formats[name] = source_factory.get_output_storage_format()
+        instance = factory(self._config_by_step[handle], logger)
+        instance.input_storage_formats = input_formats
+        instance.execution_context = config
+        instance.streamed_inputs = set(in_channels)
+        started = time.monotonic()
+        if not factory.supports_streamed_output():
+            # Consumer only; the step itself materialises its output
+            try:
+                result = await instance.execute(**args)
+            finally:
+                for channel in in_channels.values():
+                    channel.detach()
+            outcome = _collect_outcome(instance, result)
+            self._result_store.record_step_duration(factory, time.monotonic() - started)
+            self._handoff.put(handle, outcome.result, consumers=self._count_consumers(index))
             logger.info(f'Storing result')
-            self._result_store.store(_handle,
-                                     _factory,
-                                     result,
-                                     instance.get_checkpoint_metadata())
-            if _factory.has_dynamic_checkpoint():
-                self._result_store.mark_checkpoint(
-                    _handle, instance.dynamic_checkpoint_is_valid()
+            self._result_store.store_in_background(handle,
+                                                   factory,
+                                                   outcome.result,
+                                                   outcome.metadata)
+            self._finish_task(handle, factory, outcome, logger)
+            return
+        # The stream is teed to all consumers and the checkpoint writer.
+        # It is only materialised if some consumer needs the complete result.
+        consumers = self._count_consumers(index)
+        collected = [] if consumers else None
+        writer_channel = streaming.Channel(self._executor.stream_buffer_size)
+        channels = out_channels + [writer_channel]
+        metadata = concurrent.futures.Future()
+        logger.info(f'Storing result (streamed)')
+        self._result_store.store_stream_in_background(
+            handle,
+            factory,
+            streaming.iterate_blocking(writer_channel, self._loop),
+            metadata
+        )
+        try:
+            async for batch in instance.execute_streamed(**args):
+                batch = list(batch)
+                for channel in channels:
+                    await channel.put(batch)
+                if collected is not None:
+                    collected.extend(batch)
+            outcome = _collect_outcome(instance, collected)
+        except BaseException as e:
+            for channel in channels:
+                channel.fail(e)
+            metadata.set_exception(e)
+            raise
+        finally:
+            for channel in in_channels.values():
+                channel.detach()
+        for channel in channels:
+            await channel.close()
+        metadata.set_result(outcome.metadata)
+        self._result_store.record_step_duration(factory, time.monotonic() - started)
+        if collected is not None:
+            self._handoff.put(handle, collected, consumers=consumers)
+        self._finish_task(handle, factory, outcome, logger)
+
+    async def _run_partitioned_task(self, index: int, logger: logging.Logger):
+        start = self._graph.starts[index]
+        handle, factory = start.step, start.factory
+        partitioned = factory.get_partitioned_inputs()
+        args, input_formats, config = self._prepare_task_inputs(
+            handle, start.inputs, logger, partitioned=partitioned
+        )
+        mode = self._executor.get_execution_mode(factory)
+        config.set('system.executor.execution-mode', mode)
+        shards = partitioning.split_inputs(args, partitioned, self._partitions[index])
+        # Preloaded inputs are not part of the key
+        key = None
+        if not self._preloaded_inputs_by_step.get(handle):
+            key = await asyncio.to_thread(self._result_store.get_content_key, handle)
+        digests = partitioning.compute_digests(key, len(shards))
+        logger.info(f'Running task (no valid checkpoint, mode: {mode}, partitions: {len(shards)})')
+        self._result_store.begin_partitioned_write(handle, len(shards))
+        started = time.monotonic()
+
+        async def run_partition(i: int):
+            found, value = await asyncio.to_thread(
+                self._result_store.load_partition, handle, factory, i, digests[i]
+            )
+            if found:
+                logger.info(f'Reusing checkpoint of partition {i}')
+                return value, None, None
+            outcome = await self._executor.execute_step(
+                mode=mode,
+                factory=factory,
+                config=self._config_by_step[handle],
+                logger=logger,
+                inputs=shards[i],
+                input_formats=input_formats,
+                handle=handle,
+                checkpoint_directory=config.get(
+                    'system.step.storage.current-checkpoint-directory'
+                ),
+                context=config
+            )
+            if not isinstance(outcome.result, list):
+                raise TypeError(
+                    f'Partitioned step {handle} must return a list, '
+                    f'got {type(outcome.result).__name__}'
                 )
-            logger.info(f'Finished task')
-            return _handle, _factory
+            # Every partition is checkpointed as soon as it is done,
+            # so that an interrupted run only recomputes missing partitions.
+            write = self._result_store.store_partition_in_background(
+                handle, factory, i, outcome.result, digests[i]
+            )
+            return outcome.result, outcome, write
 
-        return wrapper()
+        results = await asyncio.gather(*(run_partition(i) for i in range(len(shards))))
+        outcomes = [outcome for _, outcome, _ in results if outcome is not None]
+        if outcomes:
+            self._result_store.record_step_duration(factory, time.monotonic() - started)
+            metadata = outcomes[0].metadata
+        else:
+            metadata = factory(self._config_by_step[handle], logger).get_checkpoint_metadata()
+        self._handoff.put(
+            handle,
+            partitioning.Partitions(value for value, _, _ in results),
+            consumers=self._count_consumers(index)
+        )
+        logger.info(f'Storing result')
+        self._result_store.commit_partitions_in_background(
+            handle, factory, [write for _, _, write in results if write is not None], metadata
+        )
+        logger.info(f'Finished task')
+
+    async def _replay_checkpoint(self,
+                                 handle: PipelineStepHandle,
+                                 factory: type[PipelineStep],
+                                 channels: list[streaming.Channel],
+                                 logger: logging.Logger):
+        logger.info(f'Streaming result from checkpoint')
+        batches = self._result_store.retrieve_stream(handle, factory)
+        try:
+            while (batch := await asyncio.to_thread(next, batches, None)) is not None:
+                for channel in channels:
+                    await channel.put(batch)
+        except BaseException as e:
+            for channel in channels:
+                channel.fail(e)
+            raise
+        for channel in channels:
+            await channel.close()
+
+    def _count_consumers(self, index: int) -> int:
+        # Consumers which receive the result through a stream do not
+        # retrieve it from the hand-off cache.
+        return sum(
+            1 for successor in self._graph.successors[index]
+            if (index, successor) not in self._graph.streaming_edges
+        )
+
+    def _finish_task(self,
+                     handle: PipelineStepHandle,
+                     factory: type[PipelineStep],
+                     outcome: StepOutcome,
+                     logger: logging.Logger):
+        if factory.has_dynamic_checkpoint():
+            self._result_store.mark_checkpoint(
+                handle, outcome.dynamic_checkpoint_is_valid
+            )
+        logger.info(f'Finished task')
 
     def _can_skip(self, handle: PipelineStepHandle, factory: type[PipelineStep]) -> bool:
         if not self._result_store.have_checkpoint_for(handle):
             return False
+        # Checkpoints validated when the run started are not validated again
+        if self._result_store.is_validated(handle):
+            return True
         instance = factory(self._config_by_step[handle], self._logger)
         metadata = self._result_store.retrieve_metadata(handle)
         return instance.checkpoint_is_valid(metadata)
+
+
+def _collect_outcome(instance: PipelineStep, result: typing.Any) -> StepOutcome:
+    if instance.has_dynamic_checkpoint():
+        dynamic_checkpoint_is_valid = instance.dynamic_checkpoint_is_valid()
+    else:
+        dynamic_checkpoint_is_valid = None
+    return StepOutcome(
+        result=result,
+        metadata=instance.get_checkpoint_metadata(),
+        dynamic_checkpoint_is_valid=dynamic_checkpoint_is_valid
+    )
+
+
+def _run_instance(instance: PipelineStep, inputs: dict[str, typing.Any]) -> StepOutcome:
+    result = asyncio.run(instance.execute(**inputs))
+    return _collect_outcome(instance, result)
+
+
+def _initialise_worker(modules: list[str]):
+    # Import the (typically heavy) modules containing the steps
+    # up front, so that individual tasks do not pay for them.
+    for module in modules:
+        importlib.import_module(module)
+
+
+def _execute_in_worker(factory: type[PipelineStep],
+                       config: dict[str, typing.Any],
+                       logger_name: str,
+                       inputs: dict[str, typing.Any],
+                       input_formats: dict[str, str],
+                       handle: PipelineStepHandle,
+                       checkpoint_directory: str) -> StepOutcome:
+    instance = factory(config, logging.getLogger(logger_name))
+    instance.input_storage_formats = input_formats
+    # The storage manager and executor only exist in the parent process
+    context = Session._get_config_factory().build_config('system')
+    context.set('system.step.handle', handle)
+    context.set('system.step.storage.current-checkpoint-directory', checkpoint_directory)
+    context.set('system.executor.execution-mode', 'process')
+    instance.execution_context = context
+    return _run_instance(instance, inputs)
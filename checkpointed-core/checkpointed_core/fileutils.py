@@ -0,0 +1,250 @@
+from __future__ import annotations
+
+import concurrent.futures
+import hashlib
+import json
+import mmap
+import os
+import shutil
+import typing
+
+try:
+    import fcntl
+except ImportError:     # Windows
+    fcntl = None
+
+
+def sync_tree(path: str, *, exclude: typing.Container[str] = ()) -> int:
+    """Flush all files in the given directory tree to disk.
+
+    Returns the total size of the files, in bytes.
+    Top-level entries whose name is in `exclude` are skipped.
+    """
+    size = 0
+    for directory, _, filenames in _walk(path, exclude):
+        for filename in filenames:
+            fd = os.open(os.path.join(directory, filename), os.O_RDONLY)
+            try:
+                os.fsync(fd)
+                size += os.fstat(fd).st_size
+            finally:
+                os.close(fd)
+    return size
+
+
+def tree_size(path: str, *, exclude: typing.Container[str] = ()) -> int:
+    """Return the total size of the files in a directory tree, in bytes.
+
+    Top-level entries whose name is in `exclude` are skipped.
+    """
+    return sum(
+        os.stat(os.path.join(directory, filename), follow_symlinks=False).st_size
+        for directory, _, filenames in _walk(path, exclude)
+        for filename in filenames
+    )
+
+
+def tree_digest(path: str, *, exclude: typing.Container[str] = ()) -> str:
+    """Compute a digest of the names and contents of the files
+    in a directory tree. Top-level entries whose name is in
+    `exclude` are skipped.
+    """
+    digest = hashlib.blake2b(digest_size=32)
+    for directory, directories, filenames in _walk(path, exclude):
+        directories.sort()
+        for filename in sorted(filenames):
+            full_path = os.path.join(directory, filename)
+            digest.update(os.path.relpath(full_path, path).replace(os.sep, '/').encode())
+            digest.update(b'\0%d\0' % os.path.getsize(full_path))
+            with open(full_path, 'rb') as file:
+                while chunk := file.read(1 << 20):
+                    digest.update(chunk)
+    return digest.hexdigest()
+
+
+def stat_signature(filename: str) -> list[int] | None:
+    """Return a signature of a file which changes whenever the file
+    is replaced or modified, or None if the file does not exist.
+    """
+    try:
+        stat = os.stat(filename)
+    except FileNotFoundError:
+        return None
+    return [stat.st_dev, stat.st_ino, stat.st_size, stat.st_mtime_ns]
+
+
+# Size of the chunks hashed in parallel by `file_digest`
+FILE_DIGEST_CHUNK_SIZE = 64 << 20
+
+
+def file_digest(filename: str, *, workers: int | None = None) -> str:
+    """Compute a digest of the contents of a (large) file.
+
+    The file is memory mapped, and its chunks are hashed in parallel
+    using `workers` threads; the digest is the SHA-256 digest of the
+    digests of the chunks, so it differs from the SHA-256 digest of the file.
+    """
+    with open(filename, 'rb') as file:
+        size = os.fstat(file.fileno()).st_size
+        digest = hashlib.sha256(b'%d\0' % size)
+        # Empty files cannot be memory mapped
+        if size == 0:
+            return digest.hexdigest()
+        offsets = range(0, size, FILE_DIGEST_CHUNK_SIZE)
+        if workers is None:
+            workers = os.cpu_count() or 1
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            with memoryview(mapped) as view:
+                # hashlib releases the GIL while hashing large buffers
+                def hash_chunk(offset: int) -> bytes:
+                    return hashlib.sha256(view[offset:offset + FILE_DIGEST_CHUNK_SIZE]).digest()
+                with concurrent.futures.ThreadPoolExecutor(min(workers, len(offsets))) as pool:
+                    for chunk_digest in pool.map(hash_chunk, offsets):
+                        digest.update(chunk_digest)
+    return digest.hexdigest()
+
+
+def _walk(path: str, exclude: typing.Container[str]) -> typing.Iterator[tuple[str, list[str], list[str]]]:
+    for directory, directories, filenames in os.walk(path):
+        if directory == path:
+            directories[:] = [d for d in directories if d not in exclude]
+            filenames = [f for f in filenames if f not in exclude]
+        yield directory, directories, filenames
+
+
+class FileLock:
+    """Advisory lock on a file, for coordinating processes.
+
+    Used as a context manager, the lock is held exclusively, using a
+    separate file descriptor for every use, so that it also excludes
+    other threads. Without `fcntl` (Windows), locks always succeed.
+    """
+
+    def __init__(self, filename: str):
+        self._filename = filename
+        self._fd: int | None = None
+
+    def acquire(self, *, shared=False, blocking=True) -> bool:
+        """Acquire (or convert) the lock, returning whether it was acquired.
+
+        A failed attempt to convert a lock may release it.
+        """
+        if self._fd is None:
+            os.makedirs(os.path.dirname(self._filename) or '.', exist_ok=True)
+            self._fd = os.open(self._filename, os.O_RDWR | os.O_CREAT, 0o666)
+        if fcntl is None:
+            return True
+        flags = fcntl.LOCK_SH if shared else fcntl.LOCK_EX
+        if not blocking:
+            flags |= fcntl.LOCK_NB
+        try:
+            fcntl.flock(self._fd, flags)
+        except BlockingIOError:
+            return False
+        return True
+
+    def release(self):
+        if self._fd is not None:
+            # Closing the file releases the lock
+            os.close(self._fd)
+            self._fd = None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.release()
+
+
+def write_json_atomically(filename: str, data: typing.Any):
+    """Write a JSON file such that readers either see the old
+    contents, or the complete new contents.
+    """
+    temp = f'{filename}.{os.getpid()}.tmp'
+    with open(temp, 'w') as file:
+        json.dump(data, file)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temp, filename)
+
+
+def link_tree(source: str, target: str, *, exclude: typing.Container[str] = ()):
+    """Materialise the files in `source` at `target` without copying
+    data where possible.
+
+    Every file is reflinked (copy-on-write clone) if the filesystem
+    supports it, hardlinked otherwise, and copied as a last resort.
+    Top-level entries of `source` whose name is in `exclude` are skipped.
+    """
+    os.makedirs(target, exist_ok=True)
+    for entry in os.scandir(source):
+        if entry.name in exclude:
+            continue
+        destination = os.path.join(target, entry.name)
+        if entry.is_dir(follow_symlinks=False):
+            link_tree(entry.path, destination)
+        else:
+            link_file(entry.path, destination)
+
+
+def link_file(source: str, target: str):
+    if _try_reflink(source, target):
+        return
+    try:
+        os.link(source, target)
+        return
+    except OSError:
+        pass
+    shutil.copy2(source, target)
+
+
+def trees_match(source: str, target: str, *, exclude: typing.Container[str] = ()) -> bool:
+    """Check whether `target` still holds the files materialised
+    from `source` by `link_tree`.
+    """
+    if not os.path.isdir(target):
+        return False
+    expected = {e.name: e for e in os.scandir(source) if e.name not in exclude}
+    actual = {e.name: e for e in os.scandir(target)}
+    if expected.keys() != actual.keys():
+        return False
+    for name, entry in expected.items():
+        other = actual[name]
+        if entry.is_dir(follow_symlinks=False):
+            if not other.is_dir(follow_symlinks=False) or not trees_match(entry.path, other.path):
+                return False
+            continue
+        if other.is_dir(follow_symlinks=False):
+            return False
+        a, b = entry.stat(follow_symlinks=False), other.stat(follow_symlinks=False)
+        if (a.st_dev, a.st_ino) == (b.st_dev, b.st_ino):
+            continue
+        if (a.st_size, a.st_mtime_ns) != (b.st_size, b.st_mtime_ns):
+            return False
+    return True
+
+
+# Linux ioctl to clone a file (see ioctl_ficlone(2))
+_FICLONE = 0x40049409
+
+
+def _try_reflink(source: str, target: str) -> bool:
+    if fcntl is None:
+        return False
+    with open(source, 'rb') as src:
+        try:
+            dst = open(target, 'xb')
+        except OSError:
+            return False
+        with dst:
+            try:
+                fcntl.ioctl(dst.fileno(), _FICLONE, src.fileno())
+                cloned = True
+            except OSError:
+                cloned = False
+    if not cloned:
+        os.remove(target)
+        return False
+    shutil.copystat(source, target)
+    return True
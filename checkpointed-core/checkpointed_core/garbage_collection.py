@@ -0,0 +1,354 @@
+"""Garbage collection of checkpoint directories.
+
+Checkpoints are only deleted when the pipeline owning them runs again,
+so checkpoint directories of pipelines which are no longer run (and the
+checkpoints of their sub-pipelines) are kept forever. The garbage
+collector removes checkpoints across all pipelines in a checkpoint
+directory, including nested checkpoint directories of sub-pipelines:
+
+- data which is not indexed by any manifest (e.g. left behind by
+  an interrupted run) is always removed;
+- checkpoints which have not been used for longer than `max_age`
+  seconds are removed;
+- the least recently used checkpoints are removed until the total size
+  of all checkpoints is within `quota` bytes.
+
+When a checkpoint is removed, the checkpoints depending on it are
+removed as well, since these can no longer be reused. Checkpoints in
+protected directories (e.g. those of the pipeline which is being run)
+are never removed. Directories of pipelines without any checkpoints
+left are removed entirely.
+
+Checkpoint directories of pipelines which are being run
+(by any process) are skipped.
+"""
+
+from __future__ import annotations
+
+import argparse
+import logging
+import os
+import shutil
+import time
+import typing
+
+from . import fileutils
+from . import manifest
+from .data_store import NESTED_CHECKPOINT_DIRECTORY, lock_checkpoint_directory
+
+
+class RemovedCheckpoint(typing.NamedTuple):
+    # Checkpoint directory whose manifest indexed the checkpoint
+    store: str
+    # None for data which was not indexed by the manifest
+    step: int | None
+    location: str
+    size: int
+
+
+class GarbageCollectionReport(typing.NamedTuple):
+    removed: list[RemovedCheckpoint]
+    # Checkpoint directories of pipelines which have been removed
+    removed_stores: list[str]
+    # Total size of the removed checkpoints, in bytes
+    reclaimed: int
+    # Total size of the remaining checkpoints, in bytes
+    remaining: int
+
+    def __str__(self):
+        return (
+            f'Removed {len(self.removed)} checkpoint(s) and '
+            f'{len(self.removed_stores)} pipeline directory(s), '
+            f'reclaiming {format_size(self.reclaimed)}; '
+            f'{format_size(self.remaining)} remaining'
+        )
+
+
+class _Store:
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        # Data is listed before the manifest is read, so that
+        # data written in the meantime is never considered unindexed
+        self.locations = _list_locations(directory)
+        self.manifest = manifest.Manifest(os.path.join(directory, manifest.MANIFEST_FILENAME))
+        self.entries = self.manifest.get_entries()
+        _, inputs = self.manifest.load_graph()
+        self.consumers = {}
+        for step, step_inputs in inputs.items():
+            for _, source in step_inputs:
+                self.consumers.setdefault(source, set()).add(step)
+        # Stores of sub-pipelines, by the step running the sub-pipeline
+        self.children: dict[int, _Store] = {}
+
+    def get_path(self, location: str) -> str:
+        return os.path.join(self.directory, location)
+
+    def is_protected(self, protected: list[str]) -> bool:
+        return any(
+            self.directory == directory or self.directory.startswith(directory + os.sep)
+            for directory in protected
+        )
+
+    def walk(self) -> typing.Iterator[_Store]:
+        yield self
+        for child in self.children.values():
+            yield from child.walk()
+
+
+def collect_garbage(checkpoint_directory: str, *,
+                    quota: int | None = None,
+                    max_age: float | None = None,
+                    protected: typing.Iterable[str] = (),
+                    dry_run: bool = False,
+                    logger: logging.Logger | None = None) -> GarbageCollectionReport:
+    """Remove checkpoints from a checkpoint directory, as described above.
+
+    `protected` contains the checkpoint directories (of pipelines, or
+    of sub-pipelines) whose checkpoints must not be removed. With
+    `dry_run`, nothing is removed, but the report describes what
+    would have been removed.
+    """
+    if logger is None:
+        logger = logging.getLogger(__name__)
+    protected = [os.path.abspath(directory) for directory in protected]
+    directories = _find_stores(os.path.abspath(checkpoint_directory))
+    locks = []
+    in_use = []
+    for directory in directories:
+        lock = lock_checkpoint_directory(directory)
+        if lock is None:
+            logger.info(f'Skipping {directory}, which is being used by another run')
+            in_use.append(directory)
+        else:
+            locks.append(lock)
+    protected += in_use
+    roots = [_open_store(directory) for directory in directories]
+    try:
+        stores = [store for root in roots for store in root.walk()]
+        removed = []
+        for store in stores:
+            if not store.is_protected(in_use):
+                removed.extend(_find_unindexed_data(store))
+        remaining = sum(
+            entry.size or 0
+            for store in stores
+            for entry in store.entries.values()
+            if entry.committed
+        )
+        # Least recently used checkpoints are evicted first
+        candidates = sorted(
+            (entry.accessed or 0.0, index, step)
+            for index, store in enumerate(stores)
+            if not store.is_protected(protected)
+            for step, entry in store.entries.items()
+            if entry.committed
+        )
+        deadline = None if max_age is None else time.time() - max_age
+        evicted = set()
+        evictions = []
+        for accessed, index, step in candidates:
+            expired = deadline is not None and accessed < deadline
+            if not expired and (quota is None or remaining <= quota):
+                break
+            if (stores[index].directory, step) in evicted:
+                continue
+            closure = [
+                (store, s) for store, s in _get_eviction_closure(stores[index], step)
+                if (store.directory, s) not in evicted
+            ]
+            if any(store.is_protected(protected) for store, _ in closure):
+                continue
+            evicted |= {(store.directory, s) for store, s in closure}
+            evictions.append((stores[index], step, closure))
+            for store, s in closure:
+                entry = store.entries[s]
+                size = (entry.size or 0) if entry.committed else 0
+                remaining -= size
+                removed.append(RemovedCheckpoint(store.directory, s, entry.location, size))
+        if quota is not None and remaining > quota:
+            logger.warning(
+                f'Checkpoints in {checkpoint_directory} exceed the quota of {format_size(quota)} '
+                f'after garbage collection ({format_size(remaining)}), '
+                f'since the remaining checkpoints are protected'
+            )
+        # Pipelines without checkpoints left are removed entirely; those
+        # which did not have any checkpoints (e.g. a new pipeline) are kept
+        removed_stores = [
+            root.directory for root in roots
+            if not root.is_protected(protected)
+            and root.directory != os.path.abspath(checkpoint_directory)
+            and root.entries
+            and root.entries.keys() <= {s for d, s in evicted if d == root.directory}
+        ]
+        if not dry_run:
+            _remove(removed, evictions, roots, removed_stores)
+    finally:
+        for root in roots:
+            for store in root.walk():
+                store.manifest.close()
+        for lock in locks:
+            lock.release()
+    report = GarbageCollectionReport(
+        removed, removed_stores, sum(checkpoint.size for checkpoint in removed), remaining
+    )
+    logger.info(f'Garbage collection of {checkpoint_directory}: {report}')
+    return report
+
+
+def _find_stores(directory: str) -> list[str]:
+    """Find the checkpoint directories of the pipelines in a directory."""
+    if os.path.exists(os.path.join(directory, manifest.MANIFEST_FILENAME)):
+        return [directory]
+    # Directories of older versions are only imported when they are used
+    if os.path.exists(os.path.join(directory, 'metadata', 'graph.pickle')):
+        return []
+    if not os.path.isdir(directory):
+        return []
+    return [
+        store
+        for entry in sorted(os.scandir(directory), key=lambda e: e.name)
+        if entry.is_dir(follow_symlinks=False)
+        for store in _find_stores(entry.path)
+    ]
+
+
+def _open_store(directory: str) -> _Store:
+    store = _Store(directory)
+    for step, entry in store.entries.items():
+        nested = os.path.join(store.get_path(entry.location), NESTED_CHECKPOINT_DIRECTORY)
+        if os.path.exists(os.path.join(nested, manifest.MANIFEST_FILENAME)):
+            store.children[step] = _open_store(nested)
+    return store
+
+
+def _list_locations(directory: str) -> list[str]:
+    locations = []
+    store_directory = os.path.join(directory, 'store')
+    if os.path.isdir(store_directory):
+        for shard in os.scandir(store_directory):
+            if shard.is_dir(follow_symlinks=False):
+                locations.extend(
+                    f'store/{shard.name}/{entry.name}' for entry in os.scandir(shard.path)
+                )
+    # Data stored by older versions
+    data_directory = os.path.join(directory, 'data')
+    if os.path.isdir(data_directory):
+        locations.extend(f'data/{entry.name}' for entry in os.scandir(data_directory))
+    return locations
+
+
+def _find_unindexed_data(store: _Store) -> list[RemovedCheckpoint]:
+    indexed = {entry.location for entry in store.entries.values()}
+    return [
+        RemovedCheckpoint(
+            store.directory, None, location, fileutils.tree_size(store.get_path(location))
+        )
+        for location in store.locations
+        if location not in indexed
+    ]
+
+
+def _get_eviction_closure(store: _Store, step: int) -> list[tuple[_Store, int]]:
+    """Return the checkpoints removed along with a checkpoint: those
+    depending on it, and those of the sub-pipelines they ran.
+    """
+    closure = []
+    todo = [step]
+    seen = {step}
+    while todo:
+        current = todo.pop()
+        if current in store.entries:
+            closure.append((store, current))
+            if current in store.children:
+                closure.extend(
+                    (nested, s) for nested in store.children[current].walk() for s in nested.entries
+                )
+        for consumer in store.consumers.get(current, ()):
+            if consumer not in seen:
+                seen.add(consumer)
+                todo.append(consumer)
+    return closure
+
+
+def _remove(removed: list[RemovedCheckpoint],
+            evictions: list[tuple[_Store, int, list[tuple[_Store, int]]]],
+            roots: list[_Store],
+            removed_stores: list[str]):
+    for checkpoint in removed:
+        if checkpoint.step is None:
+            path = os.path.join(checkpoint.store, checkpoint.location)
+            if os.path.exists(path):
+                shutil.rmtree(path)
+    for store, _, closure in evictions:
+        # Checkpoints of sub-pipelines are removed along with their parent
+        steps = [s for s_store, s in closure if s_store is store]
+        # Entries are invalidated before their data is removed,
+        # so that an interruption never leaves entries without data.
+        store.manifest.invalidate(steps)
+        for step in steps:
+            path = store.get_path(store.entries[step].location)
+            if os.path.exists(path):
+                shutil.rmtree(path)
+        store.manifest.remove(steps)
+    for root in roots:
+        if root.directory in removed_stores:
+            for store in root.walk():
+                store.manifest.close()
+            shutil.rmtree(root.directory)
+
+
+_SIZE_UNITS = {'': 1, 'K': 1 << 10, 'M': 1 << 20, 'G': 1 << 30, 'T': 1 << 40}
+
+
+def parse_size(text: str) -> int:
+    """Parse a size in bytes, with an optional unit (e.g. '500M', '20G')."""
+    text = text.strip().upper().removesuffix('B')
+    unit = text[-1:] if text[-1:] in _SIZE_UNITS else ''
+    try:
+        return int(float(text[:len(text) - len(unit)]) * _SIZE_UNITS[unit])
+    except ValueError:
+        raise ValueError(f'Invalid size: {text!r}') from None
+
+
+def format_size(size: int) -> str:
+    for unit in ('B', 'KiB', 'MiB', 'GiB'):
+        if size < 1024:
+            return f'{size:.1f} {unit}' if unit != 'B' else f'{size} B'
+        size /= 1024
+    return f'{size:.1f} TiB'
+
+
+def main(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(
+        prog='python -m checkpointed_core.garbage_collection',
+        description='Remove checkpoints from a checkpoint directory.'
+    )
+    parser.add_argument('checkpoint_directory')
+    parser.add_argument('--quota', type=parse_size,
+                        help='maximum total size of the checkpoints (e.g. 20G)')
+    parser.add_argument('--max-age', type=float,
+                        help='remove checkpoints not used for this many days')
+    parser.add_argument('--protect', action='append', default=[],
+                        help='checkpoint directory whose checkpoints must be kept')
+    parser.add_argument('--dry-run', action='store_true',
+                        help='only report what would be removed')
+    args = parser.parse_args(argv)
+    report = collect_garbage(
+        args.checkpoint_directory,
+        quota=args.quota,
+        max_age=None if args.max_age is None else args.max_age * 24 * 60 * 60,
+        protected=args.protect,
+        dry_run=args.dry_run
+    )
+    for checkpoint in report.removed:
+        step = 'unindexed' if checkpoint.step is None else f'step {checkpoint.step}'
+        path = os.path.join(checkpoint.store, checkpoint.location)
+        print(f'{path} ({step}, {format_size(checkpoint.size)})')
+    for store in report.removed_stores:
+        print(store)
+    print(report)
+
+
+if __name__ == '__main__':
+    main()
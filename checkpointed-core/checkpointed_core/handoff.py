@@ -0,0 +1,148 @@
+from __future__ import annotations
+
+import collections
+import itertools
+import logging
+import sys
+import typing
+
+from .handle import PipelineStepHandle
+
+
+class HandoffCache:
+    """In-memory store for results produced during the current session.
+
+    Every result is kept until all of its consumers have retrieved it,
+    or until it is evicted because the memory limit has been reached.
+    Consumers of evicted results fall back to loading the checkpoint.
+
+    Values are handed to consumers as-is, except for objects
+    supporting read-only views (e.g. numpy arrays), which are handed
+    out as such to prevent consumers from modifying each other's inputs.
+    Other values are shared, and must not be modified by consumers
+    (see `PipelineStep.execute`).
+    """
+
+    def __init__(self, memory_limit: int | None, logger: logging.Logger):
+        self._memory_limit = memory_limit
+        self._logger = logger
+        # Insertion order doubles as eviction order
+        self._entries: collections.OrderedDict[PipelineStepHandle, _Entry] = collections.OrderedDict()
+        self._memory_in_use = 0
+
+    @property
+    def memory_in_use(self) -> int:
+        return self._memory_in_use
+
+    def __contains__(self, handle: PipelineStepHandle) -> bool:
+        return handle in self._entries
+
+    def put(self, handle: PipelineStepHandle, value: typing.Any, *, consumers: int):
+        if consumers <= 0:
+            return
+        self.discard(handle)
+        size = estimate_size(value)
+        if self._memory_limit is not None:
+            if size > self._memory_limit:
+                self._logger.info(
+                    f'Not keeping result of {handle} in memory '
+                    f'(estimated size {size} exceeds memory limit)'
+                )
+                return
+            while self._memory_in_use + size > self._memory_limit:
+                evicted, entry = self._entries.popitem(last=False)
+                self._memory_in_use -= entry.size
+                self._logger.info(f'Evicted in-memory result of {evicted}')
+        self._entries[handle] = _Entry(value, size, consumers)
+        self._memory_in_use += size
+
+    def get(self, handle: PipelineStepHandle) -> tuple[bool, typing.Any]:
+        """Retrieve a value for one of its consumers.
+
+        Returns a tuple (found, value).
+        """
+        entry = self._entries.get(handle)
+        if entry is None:
+            return False, None
+        value = _read_only_view(entry.value)
+        self.release(handle)
+        return True, value
+
+    def release(self, handle: PipelineStepHandle):
+        """Signal that one of the consumers of the value no longer needs it."""
+        entry = self._entries.get(handle)
+        if entry is None:
+            return
+        entry.consumers -= 1
+        if entry.consumers <= 0:
+            self.discard(handle)
+
+    def discard(self, handle: PipelineStepHandle):
+        entry = self._entries.pop(handle, None)
+        if entry is not None:
+            self._memory_in_use -= entry.size
+
+    def clear(self):
+        self._entries.clear()
+        self._memory_in_use = 0
+
+
+class _Entry:
+
+    __slots__ = ('value', 'size', 'consumers')
+
+    def __init__(self, value: typing.Any, size: int, consumers: int):
+        self.value = value
+        self.size = size
+        self.consumers = consumers
+
+
+def _read_only_view(value: typing.Any) -> typing.Any:
+    # numpy arrays (and other objects following the same protocol)
+    if hasattr(value, 'view') and hasattr(value, 'flags') and hasattr(value.flags, 'writeable'):
+        view = value.view()
+        view.flags.writeable = False
+        return view
+    return value
+
+
+_SAMPLE_SIZE = 64
+
+
+def estimate_size(value: typing.Any, _depth: int = 0) -> int:
+    """Cheaply estimate the memory footprint of a value in bytes.
+
+    Buffer-like objects (numpy arrays, scipy sparse matrices, pandas
+    data frames) report their size directly. For large containers,
+    the size is extrapolated from a sample of the items.
+    """
+    nbytes = getattr(value, 'nbytes', None)
+    if isinstance(nbytes, int):
+        return nbytes
+    if hasattr(value, 'memory_usage') and callable(value.memory_usage):
+        try:
+            return int(value.memory_usage(deep=False).sum())
+        except (TypeError, AttributeError, ValueError):
+            pass
+    if all(hasattr(getattr(value, name, None), 'nbytes') for name in ('data', 'indices', 'indptr')):
+        return value.data.nbytes + value.indices.nbytes + value.indptr.nbytes
+    size = sys.getsizeof(value, 0)
+    if _depth > 8:
+        return size
+    if isinstance(value, dict):
+        items = list(itertools.islice(value.items(), _SAMPLE_SIZE))
+        sample = sum(
+            estimate_size(k, _depth + 1) + estimate_size(v, _depth + 1) for k, v in items
+        )
+        return size + _extrapolate(sample, len(items), len(value))
+    if isinstance(value, (list, tuple, set, frozenset)):
+        items = list(itertools.islice(value, _SAMPLE_SIZE))
+        sample = sum(estimate_size(item, _depth + 1) for item in items)
+        return size + _extrapolate(sample, len(items), len(value))
+    return size
+
+
+def _extrapolate(sample_size: int, sample_count: int, total_count: int) -> int:
+    if sample_count == 0:
+        return 0
+    return sample_size * total_count // sample_count
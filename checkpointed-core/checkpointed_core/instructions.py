@@ -1,5 +1,8 @@
 from __future__ import annotations
 
+import graphlib
+import typing
+
 from .handle import PipelineStepHandle
 from .step import PipelineStep
 
@@ -13,14 +16,115 @@ class Start(Instruction):
     def __init__(self,
                  step: PipelineStepHandle,
                  factory: type[PipelineStep],
-                 inputs: list[tuple[PipelineStepHandle, type[PipelineStep], str]]):
+                 inputs: list[tuple[PipelineStepHandle, type[PipelineStep], str]],
+                 streamed_inputs: frozenset[str] = frozenset()):
         self.step = step
         self.factory = factory
         self.inputs = inputs
+        self.streamed_inputs = streamed_inputs
+
+
+class InstructionGraph:
+    """Compact adjacency representation of an execution plan.
+
+    Steps are identified by their index in `starts`, which is
+    ordered topologically. `successors[i]` contains the indices
+    of all steps consuming the output of step `i`, and
+    `in_degree[i]` the number of steps step `i` depends on.
+
+    Steps connected through streaming connections must run
+    concurrently, and are therefore scheduled as a single group.
+    `groups[g]` contains the (topologically ordered) steps in group `g`,
+    and `group_of[i]` the group of step `i`. `group_successors[g]`
+    contains one entry for every (non-streaming) connection from
+    group `g` to another group, and `group_in_degree[g]` the
+    number of connections into group `g`.
+    """
+
+    def __init__(self, starts: list[Start], successors: list[tuple[int, ...]]):
+        if len(starts) != len(successors):
+            raise ValueError('Every step must have an entry in the successor list')
+        self.starts = starts
+        self.successors = successors
+        self.in_degree = [0] * len(starts)
+        for targets in successors:
+            for target in targets:
+                self.in_degree[target] += 1
+        self.index_by_step = {start.step: i for i, start in enumerate(starts)}
+        self.streaming_edges: set[tuple[int, int]] = {
+            (self.index_by_step[source], target)
+            for target, start in enumerate(starts)
+            for source, _, label in start.inputs
+            if label in start.streamed_inputs
+        }
+        self._build_groups()
+
+    def __len__(self):
+        return len(self.starts)
+
+    def restrict(self, steps: set[PipelineStepHandle]) -> InstructionGraph:
+        """Return the instruction graph of the given steps, which
+        must include all steps they depend on.
+        """
+        kept = [i for i, start in enumerate(self.starts) if start.step in steps]
+        index = {old: new for new, old in enumerate(kept)}
+        return InstructionGraph(
+            [self.starts[i] for i in kept],
+            [tuple(index[t] for t in self.successors[i] if t in index) for i in kept]
+        )
+
+    def get_ancestors(self, steps: typing.Iterable[PipelineStepHandle]) -> set[PipelineStepHandle]:
+        """Return the given steps, and all steps they (indirectly) depend on."""
+        ancestors = set(steps)
+        todo = list(ancestors)
+        while todo:
+            current = todo.pop()
+            for source, _, _ in self.starts[self.index_by_step[current]].inputs:
+                if source not in ancestors:
+                    ancestors.add(source)
+                    todo.append(source)
+        return ancestors
 
+    def _build_groups(self):
+        parent = list(range(len(self.starts)))
 
-class Sync(Instruction):
+        def find(i: int) -> int:
+            while parent[i] != i:
+                parent[i] = parent[parent[i]]
+                i = parent[i]
+            return i
 
-    def __init__(self, steps: list[PipelineStepHandle], then: list[Start]):
-        self.steps = frozenset(steps)
-        self.then = then
+        for source, target in self.streaming_edges:
+            parent[find(target)] = find(source)
+        group_by_root = {}
+        self.group_of = []
+        self.groups: list[list[int]] = []
+        for i in range(len(self.starts)):
+            root = find(i)
+            if root not in group_by_root:
+                group_by_root[root] = len(self.groups)
+                self.groups.append([])
+            self.group_of.append(group_by_root[root])
+            self.groups[group_by_root[root]].append(i)
+        self.group_successors: list[list[int]] = [[] for _ in self.groups]
+        self.group_in_degree = [0] * len(self.groups)
+        for source, targets in enumerate(self.successors):
+            for target in targets:
+                if (source, target) in self.streaming_edges:
+                    continue
+                if self.group_of[source] == self.group_of[target]:
+                    raise ValueError(
+                        f'Step {self.starts[target].step} cannot have both streaming '
+                        f'and non-streaming connections to steps it shares '
+                        f'a stream with (connection from {self.starts[source].step})'
+                    )
+                self.group_successors[self.group_of[source]].append(self.group_of[target])
+                self.group_in_degree[self.group_of[target]] += 1
+        try:
+            graphlib.TopologicalSorter(
+                {g: set(targets) for g, targets in enumerate(self.group_successors)}
+            ).prepare()
+        except graphlib.CycleError:
+            raise ValueError(
+                'Streaming connections would require steps to wait for their own results'
+            )
@@ -0,0 +1,258 @@
+"""Index of the checkpoints in a checkpoint directory.
+
+The manifest is a SQLite database holding the fingerprints of the
+steps of the pipeline which last used the directory, and an entry for
+every checkpoint: where its data is stored, its metadata, format,
+size, and when it was created and last accessed. Entries are
+committed only once the data of a checkpoint is durable.
+"""
+
+from __future__ import annotations
+
+import contextlib
+import json
+import sqlite3
+import threading
+import time
+import typing
+
+# Name of the manifest in a checkpoint directory
+MANIFEST_FILENAME = 'manifest.sqlite'
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS steps (
+    step INTEGER PRIMARY KEY,
+    fingerprint TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS inputs (
+    step INTEGER NOT NULL,
+    label TEXT NOT NULL,
+    source INTEGER NOT NULL,
+    PRIMARY KEY (step, label)
+);
+CREATE TABLE IF NOT EXISTS checkpoints (
+    step INTEGER PRIMARY KEY,
+    location TEXT NOT NULL UNIQUE,
+    committed INTEGER NOT NULL,
+    format TEXT,
+    metadata TEXT,
+    size INTEGER,
+    created REAL,
+    accessed REAL,
+    digest TEXT,
+    codec TEXT,
+    fingerprint TEXT,
+    validation TEXT
+);
+'''
+
+
+class Entry(typing.NamedTuple):
+    step: int
+    # Path of the data, relative to the checkpoint directory
+    location: str
+    # False while the checkpoint is being written
+    committed: bool
+    format: str | None
+    # Metadata as a JSON string
+    metadata: str | None
+    size: int | None
+    created: float | None
+    accessed: float | None
+    # Digest of the contents of the checkpoint
+    digest: str | None
+    # Compression of the files of the checkpoint (e.g. 'zstd:3')
+    codec: str | None
+    # Fingerprint of the step which produced the checkpoint
+    fingerprint: str | None
+    # Signatures of the files the validity of the checkpoint depends on
+    # (as a JSON string), recorded when the checkpoint was found valid
+    validation: str | None = None
+
+
+class Manifest:
+    """Transactional index of checkpoints, safe for use from multiple threads."""
+
+    def __init__(self, filename: str):
+        self._connection = sqlite3.connect(
+            filename, check_same_thread=False, isolation_level=None, timeout=60
+        )
+        self._lock = threading.Lock()
+        with self._lock:
+            self._connection.execute('PRAGMA journal_mode=WAL')
+            self._connection.execute('PRAGMA synchronous=NORMAL')
+            self._connection.executescript(_SCHEMA)
+            # Columns added after the first version of the manifest
+            columns = {
+                row[1] for row in self._connection.execute('PRAGMA table_info(checkpoints)')
+            }
+            for column in ('digest', 'codec', 'fingerprint', 'validation'):
+                if column not in columns:
+                    self._connection.execute(f'ALTER TABLE checkpoints ADD COLUMN {column} TEXT')
+
+    def load_graph(self) -> tuple[dict[int, str], dict[int, list[tuple[str, int]]]]:
+        """Return the fingerprints and inputs of the steps of the stored graph."""
+        with self._lock:
+            fingerprints = dict(
+                self._connection.execute('SELECT step, fingerprint FROM steps')
+            )
+            inputs = {step: [] for step in fingerprints}
+            for step, label, source in self._connection.execute(
+                    'SELECT step, label, source FROM inputs'):
+                inputs[step].append((label, source))
+        return fingerprints, inputs
+
+    def store_graph(self,
+                    fingerprints: dict[int, str],
+                    inputs: dict[int, list[tuple[str, int]]]):
+        with self._transaction() as cursor:
+            cursor.execute('DELETE FROM steps')
+            cursor.execute('DELETE FROM inputs')
+            cursor.executemany(
+                'INSERT INTO steps (step, fingerprint) VALUES (?, ?)',
+                fingerprints.items()
+            )
+            cursor.executemany(
+                'INSERT INTO inputs (step, label, source) VALUES (?, ?, ?)',
+                [
+                    (step, label, source)
+                    for step, step_inputs in inputs.items()
+                    for label, source in step_inputs
+                ]
+            )
+
+    def get_entries(self) -> dict[int, Entry]:
+        with self._lock:
+            cursor = self._connection.execute(
+                f'SELECT {", ".join(Entry._fields)} FROM checkpoints'
+            )
+            return {row[0]: _make_entry(row) for row in cursor}
+
+    def get_entry(self, step: int) -> Entry | None:
+        """Read the entry of a checkpoint, which may have been
+        changed by other processes using the manifest.
+        """
+        with self._lock:
+            row = self._connection.execute(
+                f'SELECT {", ".join(Entry._fields)} FROM checkpoints WHERE step = ?', (step,)
+            ).fetchone()
+        return None if row is None else _make_entry(row)
+
+    def begin(self, step: int, location: str) -> Entry:
+        """Record that the checkpoint of a step is being (re)written,
+        invalidating its current contents.
+        """
+        entry = Entry(step, location, False, None, None, None, None, None, None, None, None)
+        with self._transaction() as cursor:
+            cursor.execute(
+                'INSERT OR REPLACE INTO checkpoints (step, location, committed) VALUES (?, ?, 0)',
+                (step, location)
+            )
+        return entry
+
+    def commit(self,
+               step: int,
+               location: str,
+               format_name: str | None,
+               metadata: typing.Any,
+               size: int,
+               digest: str | None,
+               codec: str | None = None,
+               fingerprint: str | None = None) -> Entry:
+        now = time.time()
+        entry = Entry(
+            step, location, True, format_name, json.dumps(metadata),
+            size, now, now, digest, codec, fingerprint
+        )
+        with self._transaction() as cursor:
+            cursor.execute(
+                f'INSERT OR REPLACE INTO checkpoints ({", ".join(Entry._fields)}) '
+                f'VALUES ({", ".join("?" * len(Entry._fields))})',
+                entry
+            )
+        return entry
+
+    def set_validations(self, validations: dict[int, str]):
+        """Record the signatures of the files the validity of checkpoints depends on."""
+        with self._transaction() as cursor:
+            cursor.executemany(
+                'UPDATE checkpoints SET validation = ? WHERE step = ?',
+                [(validation, step) for step, validation in validations.items()]
+            )
+
+    def touch(self, steps: typing.Iterable[int]):
+        """Record that checkpoints have been accessed."""
+        now = time.time()
+        with self._transaction() as cursor:
+            cursor.executemany(
+                'UPDATE checkpoints SET accessed = ? WHERE step = ?', [(now, step) for step in steps]
+            )
+
+    def move(self, moves: dict[int, tuple[int, str]]):
+        """Atomically assign checkpoints to other steps, and locations.
+
+        `moves` maps the current step of every moved checkpoint
+        to its new step and location.
+        """
+        with self._transaction() as cursor:
+            rows = {
+                step: cursor.execute(
+                    f'SELECT {", ".join(Entry._fields)} FROM checkpoints WHERE step = ?', (step,)
+                ).fetchone()
+                for step in moves
+            }
+            cursor.executemany(
+                'DELETE FROM checkpoints WHERE step = ?', [(step,) for step in moves]
+            )
+            cursor.executemany(
+                'DELETE FROM checkpoints WHERE step = ?',
+                [(step,) for step, _ in moves.values()]
+            )
+            cursor.executemany(
+                f'INSERT INTO checkpoints ({", ".join(Entry._fields)}) '
+                f'VALUES ({", ".join("?" * len(Entry._fields))})',
+                [
+                    (new, location) + tuple(rows[old][2:])
+                    for old, (new, location) in moves.items()
+                    if rows[old] is not None
+                ]
+            )
+
+    def invalidate(self, steps: typing.Iterable[int]):
+        with self._transaction() as cursor:
+            cursor.executemany(
+                'UPDATE checkpoints SET committed = 0 WHERE step = ?', [(step,) for step in steps]
+            )
+
+    def remove(self, steps: typing.Iterable[int]):
+        with self._transaction() as cursor:
+            cursor.executemany(
+                'DELETE FROM checkpoints WHERE step = ?', [(step,) for step in steps]
+            )
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+    def _transaction(self):
+        return transaction(self._lock, self._connection)
+
+
+@contextlib.contextmanager
+def transaction(lock: threading.Lock,
+                connection: sqlite3.Connection) -> typing.Iterator[sqlite3.Cursor]:
+    """Run statements in a (write) transaction, which is
+    rolled back if an exception occurs.
+    """
+    with lock:
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            yield connection.cursor()
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        connection.execute('COMMIT')
+
+
+def _make_entry(row: tuple) -> Entry:
+    return Entry(row[0], row[1], bool(row[2]), *row[3:])
@@ -0,0 +1,87 @@
+from __future__ import annotations
+
+import hashlib
+import itertools
+import typing
+
+
+class Partitions(list):
+    """Result of a partitioned step, as a list of per-partition results.
+
+    Partitions are passed as-is to consumers which are partitioned
+    over the same input, and concatenated for all other consumers.
+    """
+
+
+def concatenate(value: typing.Any) -> typing.Any:
+    if isinstance(value, Partitions):
+        return list(itertools.chain.from_iterable(value))
+    return value
+
+
+def balanced_sizes(length: int, partitions: int) -> list[int]:
+    partitions = max(1, min(partitions, length))
+    size, remainder = divmod(length, partitions)
+    return [size + (i < remainder) for i in range(partitions)]
+
+
+def split(value: typing.Any, sizes: list[int]) -> Partitions:
+    if isinstance(value, Partitions):
+        if [len(part) for part in value] == sizes:
+            return value
+        value = concatenate(value)
+    if len(value) != sum(sizes):
+        raise ValueError(
+            f'Cannot split input of length {len(value)} into partitions of sizes {sizes}'
+        )
+    result = Partitions()
+    start = 0
+    for size in sizes:
+        result.append(value[start:start + size])
+        start += size
+    return result
+
+
+def split_inputs(inputs: dict[str, typing.Any],
+                 partitioned: typing.Collection[str],
+                 partitions: int) -> list[dict[str, typing.Any]]:
+    """Split the partitioned inputs of a step, returning the
+    inputs for every partition.
+
+    Inputs which are already partitioned keep their partitions,
+    so that chains of partitioned steps never need to concatenate
+    their intermediate results. Inputs which are not partitioned are
+    passed to every partition.
+    """
+    names = [name for name in partitioned if name in inputs]
+    if not names:
+        raise ValueError('Step has none of its partitioned inputs')
+    existing = [inputs[name] for name in names if isinstance(inputs[name], Partitions)]
+    if existing:
+        sizes = [len(part) for part in existing[0]]
+    else:
+        sizes = balanced_sizes(len(inputs[names[0]]), partitions)
+    parts = {name: split(inputs[name], sizes) for name in names}
+    return [
+        {
+            name: parts[name][i] if name in parts else value
+            for name, value in inputs.items()
+        }
+        for i in range(len(sizes))
+    ]
+
+
+def compute_digests(key: str | None, partitions: int) -> list[str | None]:
+    """Compute a digest of the inputs of every partition of a step, used
+    to decide whether the checkpoint of a partition can be reused.
+
+    `key` identifies the step, its configuration, and the contents of
+    its inputs (see `ResultStore.get_content_key`). Without a key,
+    returns None for every partition, which are then never reused.
+    """
+    if key is None:
+        return [None] * partitions
+    return [
+        hashlib.sha256(f'{key}\0{index}/{partitions}'.encode()).hexdigest()
+        for index in range(partitions)
+    ]
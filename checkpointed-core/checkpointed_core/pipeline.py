@@ -7,7 +7,7 @@ import typing
 from .graph import *
 from .handle import PipelineStepHandle
 from .step import PipelineStep
-from .instructions import Instruction, Start, Sync
+from .instructions import InstructionGraph, Start
 from .plan import ExecutionPlan
 
 __all__ = ['Pipeline']
@@ -19,6 +19,7 @@ class Pipeline:
         self.name = name
         self._nodes: dict[PipelineStepHandle, PipelineNode] = {}
         self._edges: dict[PipelineStepHandle, dict[PipelineStepHandle, str]] = {}
+        self._streaming_edges: set[tuple[PipelineStepHandle, PipelineStepHandle]] = set()
 
     def as_graph(self) -> PipelineGraph:
         return PipelineGraph(
@@ -108,6 +109,8 @@ class Pipeline:
         if source == sink:
             raise ValueError(f"source and sink nodes cannot be the same")
         if streaming:
+            if not self._nodes[source].factory.supports_streamed_output():
+                raise ValueError(f"source node {source} does not support streamed output")
             supported = self._nodes[sink].factory.supported_streamed_inputs()
         else:
             supported = self._nodes[sink].factory.supported_inputs()
@@ -136,6 +139,10 @@ class Pipeline:
         if source not in self._edges:
             self._edges[source] = {}
         self._edges[source][sink] = label
+        if streaming:
+            self._streaming_edges.add((source, sink))
+        else:
+            self._streaming_edges.discard((source, sink))
 
     def build(self,
               config_by_step: dict[PipelineStepHandle, dict[str, typing.Any]]) -> ExecutionPlan:
@@ -143,7 +150,7 @@ class Pipeline:
         self._check_reachability()
         self._check_incoming_connections()
         self._check_source_sink_constraints()
-        instructions = self._build_instruction_list()
+        instructions = self._build_instruction_graph()
         return ExecutionPlan(
             name=self.name,
             instructions=instructions,
@@ -151,35 +158,39 @@ class Pipeline:
             graph=self.as_graph()
         )
 
-    def _build_instruction_list(self) -> list[Instruction]:
+    def _build_instruction_graph(self) -> InstructionGraph:
         incoming_per_node = self._get_incoming_by_node()
-        steps_per_group = collections.defaultdict(set)
-        for handle in self._nodes:
-            incoming = incoming_per_node.get(handle, set())
-            steps_per_group[tuple(sorted(incoming))].add(handle)
-        instructions = []
-        for dependencies, handles in steps_per_group.items():
-            instructions.append(
-                Sync(
-                    list(dependencies),
-                    [
-                        Start(
-                            node.handle,
-                            node.factory,
-                            [
-                                (
-                                    handle,
-                                    self._nodes[handle].factory,
-                                    self._edges[handle][node.handle]
-                                )
-                                for handle in incoming_per_node.get(node.handle, set())
-                            ]
-                        )
-                        for node in map(lambda h: self._nodes[h], handles)
-                    ]
+        order = list(
+            graphlib.TopologicalSorter(
+                {handle: incoming_per_node.get(handle, set()) for handle in self._nodes}
+            ).static_order()
+        )
+        index_by_handle = {handle: i for i, handle in enumerate(order)}
+        starts = [
+            Start(
+                handle,
+                self._nodes[handle].factory,
+                [
+                    (
+                        source,
+                        self._nodes[source].factory,
+                        self._edges[source][handle]
+                    )
+                    for source in sorted(incoming_per_node.get(handle, set()))
+                ],
+                frozenset(
+                    self._edges[source][handle]
+                    for source in incoming_per_node.get(handle, set())
+                    if (source, handle) in self._streaming_edges
                 )
             )
-        return instructions
+            for handle in order
+        ]
+        successors = [
+            tuple(sorted(index_by_handle[target] for target in self._edges.get(handle, {})))
+            for handle in order
+        ]
+        return InstructionGraph(starts, successors)
 
     def _get_incoming_by_node(self) -> dict[PipelineStepHandle, set[PipelineStepHandle]]:
         incoming_by_node = collections.defaultdict(set)
@@ -1,12 +1,18 @@
 import asyncio
+import contextlib
 import logging
 import os.path
 import typing
 
+from .compression import Compression
 from .data_store import ResultStore
+from .garbage_collection import collect_garbage
 from .graph import PipelineGraph
 from .handle import PipelineStepHandle
-from .instructions import Instruction
+from .shared_cache import SharedCache
+from .storage import StorageBackend
+from .tiering import HotTier
+from .instructions import InstructionGraph
 from .executor import TaskExecutor
 
 
@@ -14,7 +20,7 @@ class ExecutionPlan:
 
     def __init__(self, *,
                  name: str,
-                 instructions: list[Instruction],
+                 instructions: InstructionGraph,
                  graph: PipelineGraph,
                  config_by_step: dict[PipelineStepHandle, dict[str, typing.Any]]):
         self.name = name
@@ -22,22 +28,104 @@ class ExecutionPlan:
         self._graph = graph
         self._config_by_step = config_by_step
 
+    def export_checkpoints(self,
+                           filename: str, *,
+                           checkpoint_directory='',
+                           targets: typing.Iterable[PipelineStepHandle] | None = None,
+                           compression: Compression | None = Compression('auto'),
+                           logger: logging.Logger | None = None) -> list[PipelineStepHandle]:
+        """Export the valid checkpoints of the pipeline (or of the steps in
+        `targets`, and the steps they depend on) to a bundle, which can be
+        imported into a pipeline containing the same steps using `import_checkpoints`.
+
+        Returns the steps whose checkpoints have been exported.
+        """
+        with self._open_result_store(checkpoint_directory, logger) as result_store:
+            return result_store.export_checkpoints(
+                filename, self.name, targets=targets, codec=compression
+            )
+
+    def import_checkpoints(self,
+                           filename: str, *,
+                           checkpoint_directory='',
+                           logger: logging.Logger | None = None) -> list[PipelineStepHandle]:
+        """Import the checkpoints in a bundle, for the steps of the pipeline
+        without a valid checkpoint.
+
+        Returns the steps whose checkpoints have been imported.
+        """
+        with self._open_result_store(checkpoint_directory, logger) as result_store:
+            return result_store.import_checkpoints(filename)
+
+    def _resolve_targets(self,
+                         targets: typing.Iterable[PipelineStepHandle | str]) -> set[PipelineStepHandle]:
+        handles_by_name = {}
+        for node in self._graph.vertices:
+            if node.name is not None:
+                handles_by_name.setdefault(node.name, []).append(node.handle)
+        steps = {node.handle for node in self._graph.vertices}
+        resolved = set()
+        for target in targets:
+            if isinstance(target, str):
+                handles = handles_by_name.get(target, [])
+                if len(handles) != 1:
+                    raise ValueError(
+                        f'Target {target!r} does not name exactly one step '
+                        f'(found {len(handles)})'
+                    )
+                resolved.add(handles[0])
+            elif target in steps:
+                resolved.add(target)
+            else:
+                raise ValueError(f'Target {target} is not a step of pipeline {self.name}')
+        return resolved
+
+    @contextlib.contextmanager
+    def _open_result_store(self,
+                           checkpoint_directory: str,
+                           logger: logging.Logger | None) -> typing.Iterator[ResultStore]:
+        result_store = ResultStore(
+            graph=self._graph,
+            output_directory=None,
+            checkpoint_directory=os.path.join(checkpoint_directory, self.name),
+            config_by_step=self._config_by_step,
+            logger=logging.getLogger(__name__) if logger is None else logger
+        )
+        try:
+            yield result_store
+        finally:
+            result_store.close()
+
     def execute(self, *,
                 output_directory='',
                 checkpoint_directory='',
+                cache_directory: str | None = None,
+                cache_backend: StorageBackend | None = None,
+                checkpoint_quota: int | None = None,
+                hot_directory: str | None = None,
+                hot_quota: int | None = None,
+                targets: typing.Iterable[PipelineStepHandle | str] | None = None,
                 logger: logging.Logger | None = None,
                 _precomputed_inputs: dict[PipelineStepHandle, typing.Any] | None = None,
                 _return_values: set[PipelineStepHandle] | None = None,
+                executor: TaskExecutor | None = None,
                 loop: asyncio.AbstractEventLoop | None = None):
         if loop is None:
-            loop = asyncio.get_event_loop()
+            loop = asyncio.get_event_loop() if executor is None else executor.loop
         return loop.run_until_complete(
             self.execute_async(
                 output_directory=output_directory,
                 checkpoint_directory=checkpoint_directory,
+                cache_directory=cache_directory,
+                cache_backend=cache_backend,
+                checkpoint_quota=checkpoint_quota,
+                hot_directory=hot_directory,
+                hot_quota=hot_quota,
+                targets=targets,
                 logger=logger,
                 _precomputed_inputs=_precomputed_inputs,
                 _return_values=_return_values,
+                executor=executor,
                 loop=loop
             )
         )
@@ -45,10 +133,17 @@ class ExecutionPlan:
     async def execute_async(self, *,
                             output_directory='',
                             checkpoint_directory='',
+                            cache_directory: str | None = None,
+                            cache_backend: StorageBackend | None = None,
+                            checkpoint_quota: int | None = None,
+                            hot_directory: str | None = None,
+                            hot_quota: int | None = None,
+                            targets: typing.Iterable[PipelineStepHandle | str] | None = None,
                             logger: logging.Logger | None = None,
                             _precomputed_inputs: dict[PipelineStepHandle, typing.Any] | None = None,
                             _return_values: set[PipelineStepHandle] | None = None,
                             _sub_store: ResultStore | None = None,
+                            executor: TaskExecutor | None = None,
                             loop: asyncio.AbstractEventLoop):
         if logger is None:
             logger = logging.getLogger(__name__)
@@ -56,27 +151,74 @@ class ExecutionPlan:
             _precomputed_inputs = {}
         if _return_values is None:
             _return_values = set()
+        if cache_backend is not None and cache_directory is None:
+            raise ValueError('A cache directory is required for using a cache backend')
+        # Only the targets and the steps they depend on are run (and validated)
+        instructions = self._instructions
+        scope = None
+        if targets is not None:
+            scope = instructions.get_ancestors(self._resolve_targets(targets))
+            instructions = instructions.restrict(scope)
+            logger.info(f'Running {len(instructions)} of {len(self._instructions)} steps')
+        shared_cache = None
         if _sub_store is None:
+            # Results are shared between pipelines using a cache directory
+            if cache_directory is not None:
+                shared_cache = SharedCache(cache_directory, cache_backend)
+            # Checkpoints are written to (and read from) a hot tier on fast
+            # local storage, and promoted to the checkpoint directory.
+            hot_tier = None
+            if hot_directory is not None:
+                hot_tier = HotTier(hot_directory, quota=hot_quota, logger=logger)
             result_store = ResultStore(
                 graph=self._graph,
                 output_directory=os.path.join(output_directory, self.name),
                 checkpoint_directory=os.path.join(checkpoint_directory, self.name),
                 config_by_step=self._config_by_step,
                 logger=logger,
+                shared_cache=shared_cache,
+                hot_tier=hot_tier,
+                scope=scope
             )
         else:
             result_store = _sub_store
-        executor = TaskExecutor(loop)
-        await executor.run_session(
-            instructions=self._instructions,
-            result_store=result_store,
-            config_by_step=self._config_by_step,
-            preloaded_inputs_by_step=_precomputed_inputs,
-            logger=logger
-        )
-        if _return_values is not None:
-            steps = {
-                node.handle: node.factory for node in self._graph.vertices
-            }
-            return {step: result_store.retrieve(step, steps[step])
-                    for step in _return_values}
+        # An executor passed in by the caller is owned by the caller,
+        # which allows its worker pools to stay warm between runs.
+        owns_executor = executor is None
+        if owns_executor:
+            executor = TaskExecutor(loop)
+        try:
+            try:
+                await executor.run_session(
+                    instructions=instructions,
+                    result_store=result_store,
+                    config_by_step=self._config_by_step,
+                    preloaded_inputs_by_step=_precomputed_inputs,
+                    logger=logger
+                )
+                result_store.publish_to_shared_cache()
+            finally:
+                if owns_executor:
+                    executor.shutdown()
+            values = None
+            if _return_values is not None:
+                steps = {
+                    node.handle: node.factory for node in self._graph.vertices
+                }
+                values = {step: result_store.retrieve(step, steps[step])
+                          for step in _return_values}
+        finally:
+            # Also after errors, so that the locks of the run are released
+            if _sub_store is None:
+                result_store.close()
+            if shared_cache is not None:
+                shared_cache.close()
+        if checkpoint_quota is not None and _sub_store is None:
+            # The checkpoints of this pipeline are never evicted
+            collect_garbage(
+                checkpoint_directory,
+                quota=checkpoint_quota,
+                protected=[os.path.join(checkpoint_directory, self.name)],
+                logger=logger
+            )
+        return values
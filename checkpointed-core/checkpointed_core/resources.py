@@ -0,0 +1,87 @@
+from __future__ import annotations
+
+import asyncio
+import collections
+import typing
+
+
+class ResourceManager:
+    """Keeps track of the resources used by the currently running tasks.
+
+    The budget maps resource names to the total amount available,
+    e.g. `{'cores': 8, 'memory': 16 * 2**30, 'model': 1}`.
+    Resources which are not part of the budget are unlimited.
+
+    A task which requires more of a resource than the total budget
+    is only admitted when none of that resource is in use,
+    so that it can never block the pipeline indefinitely.
+    """
+
+    def __init__(self, budget: dict[str, float] | None = None):
+        self._budget = dict(budget) if budget is not None else {}
+        for name, amount in self._budget.items():
+            if amount < 0:
+                raise ValueError(f'Budget for resource {name!r} must be non-negative')
+        self._in_use: dict[str, float] = collections.defaultdict(float)
+        # Futures of sessions waiting for resources to be released
+        self._waiters: list[asyncio.Future] = []
+
+    @property
+    def budget(self) -> dict[str, float]:
+        return dict(self._budget)
+
+    @property
+    def in_use(self) -> dict[str, float]:
+        return {key: value for key, value in self._in_use.items() if value}
+
+    def can_acquire(self, requirements: dict[str, float]) -> bool:
+        for name, amount in requirements.items():
+            if name not in self._budget or amount <= 0:
+                continue
+            if self._in_use[name] + amount <= self._budget[name]:
+                continue
+            if amount > self._budget[name] and not self._in_use[name]:
+                continue
+            return False
+        return True
+
+    def acquire(self, requirements: dict[str, float]):
+        if not self.can_acquire(requirements):
+            raise RuntimeError(f'Cannot acquire resources: {requirements}')
+        for name, amount in requirements.items():
+            self._in_use[name] += amount
+
+    def release(self, requirements: dict[str, float]):
+        for name, amount in requirements.items():
+            self._in_use[name] -= amount
+            if self._in_use[name] < 0:
+                raise RuntimeError(f'Released more of resource {name!r} than acquired')
+        waiters, self._waiters = self._waiters, []
+        for waiter in waiters:
+            if not waiter.done():
+                waiter.set_result(None)
+
+    async def wait_for_release(self):
+        """Wait until resources are released (by any session)."""
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        await waiter
+
+    def describe(self, requirements: dict[str, float]) -> str:
+        return ', '.join(
+            f'{name}={amount}' for name, amount in sorted(requirements.items())
+        ) or 'none'
+
+
+def validate_requirements(owner: str,
+                          requirements: typing.Any) -> dict[str, float]:
+    if not isinstance(requirements, dict):
+        raise TypeError(f'Resource requirements of {owner} must be a dict')
+    for name, amount in requirements.items():
+        if not isinstance(name, str):
+            raise TypeError(f'Resource names of {owner} must be strings, got {name!r}')
+        if not isinstance(amount, (int, float)) or amount < 0:
+            raise ValueError(
+                f'Requirement for resource {name!r} of {owner} must be a non-negative number'
+            )
+    return requirements
@@ -0,0 +1,38 @@
+from __future__ import annotations
+
+import statistics
+
+from .instructions import InstructionGraph
+from .step import PipelineStep
+
+
+def get_factory_key(factory: type[PipelineStep]) -> str:
+    return f'{factory.__module__}.{factory.__qualname__}'
+
+
+def estimate_costs(factories: list[type[PipelineStep]],
+                   durations: dict[str, float]) -> list[float]:
+    """Estimate the cost of every step from previously recorded durations.
+
+    Steps without a recorded duration are assumed to take the mean
+    of all known durations. Without any recorded durations,
+    every step costs 1, so that priorities fall back to graph depth.
+    """
+    keys = [get_factory_key(factory) for factory in factories]
+    known = [durations[key] for key in keys if key in durations]
+    default = statistics.fmean(known) if known else 1.0
+    return [durations.get(key, default) for key in keys]
+
+
+def compute_critical_path_priorities(graph: InstructionGraph,
+                                     costs: list[float]) -> list[float]:
+    """Compute, for every step, the length of the longest (most expensive)
+    path from that step to any sink, including the step itself.
+    """
+    priorities = [0.0] * len(graph)
+    # Steps are ordered topologically, so successors are handled first.
+    for i in reversed(range(len(graph))):
+        priorities[i] = costs[i] + max(
+            (priorities[j] for j in graph.successors[i]), default=0.0
+        )
+    return priorities
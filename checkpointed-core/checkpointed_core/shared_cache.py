@@ -0,0 +1,231 @@
+"""Cache of step results shared between pipelines.
+
+Results are addressed by a content key, computed from the type and
+configuration of a step, and the digests of the contents of its inputs.
+A pipeline whose step has the same content key as a step of another
+pipeline can therefore reuse its result, even if the pipelines differ.
+
+Results are linked (not copied) between the checkpoint directories of
+pipelines and the cache. Every pipeline holds references to the results
+it uses; results are removed once no pipeline references them.
+The cache may be used by multiple processes at the same time.
+
+Results can additionally be stored in a storage backend (e.g. an object
+store), shared between machines. The cache directory then serves as a
+local read-through cache of the backend. Results are never removed
+from the backend by the cache.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import shutil
+import sqlite3
+import threading
+import time
+import typing
+
+from . import fileutils
+from . import manifest
+from .storage import StorageBackend
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS results (
+    key TEXT PRIMARY KEY,
+    format TEXT,
+    metadata TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    digest TEXT,
+    created REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS refs (
+    key TEXT NOT NULL,
+    owner TEXT NOT NULL,
+    PRIMARY KEY (key, owner)
+);
+CREATE INDEX IF NOT EXISTS refs_by_owner ON refs (owner);
+'''
+
+
+class CachedResult(typing.NamedTuple):
+    key: str
+    format: str | None
+    # Metadata as a JSON string
+    metadata: str
+    size: int
+    digest: str | None
+    created: float
+
+
+class SharedCache:
+
+    def __init__(self, directory: str, backend: StorageBackend | None = None):
+        self._directory = os.path.abspath(directory)
+        self._backend = backend
+        os.makedirs(self._directory, exist_ok=True)
+        self._connection = sqlite3.connect(
+            os.path.join(self._directory, 'cache.sqlite'),
+            check_same_thread=False,
+            isolation_level=None,
+            timeout=60
+        )
+        self._lock = threading.Lock()
+        with self._lock:
+            self._connection.execute('PRAGMA journal_mode=WAL')
+            self._connection.executescript(_SCHEMA)
+
+    @property
+    def directory(self) -> str:
+        return self._directory
+
+    def restore(self, key: str, owner: str, target: str) -> CachedResult | None:
+        """Link the files of a cached result into the (empty) directory
+        `target`, and add a reference to it for `owner`.
+
+        Returns None if there is no result with the given key.
+        """
+        with manifest.transaction(self._lock, self._connection) as cursor:
+            row = cursor.execute(
+                f'SELECT {", ".join(CachedResult._fields)} FROM results WHERE key = ?', (key,)
+            ).fetchone()
+            if row is not None:
+                # The reference prevents the result from being removed while it is linked
+                cursor.execute(
+                    'INSERT OR IGNORE INTO refs (key, owner) VALUES (?, ?)', (key, owner)
+                )
+        if row is not None:
+            result = CachedResult(*row)
+        elif self._backend is not None:
+            result = self._download(key, owner)
+            if result is None:
+                return None
+        else:
+            return None
+        fileutils.link_tree(self._get_path(key), target)
+        return result
+
+    def _download(self, key: str, owner: str) -> CachedResult | None:
+        prefix = self._get_backend_prefix(key)
+        if not self._backend.exists(f'{prefix}/result.json'):
+            return None
+        result = CachedResult(key=key, **json.loads(self._backend.get(f'{prefix}/result.json')))
+        path = self._get_path(key)
+        temp = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        self._backend.download_tree(f'{prefix}/data', temp)
+        try:
+            os.rename(temp, path)
+        except OSError:
+            # Downloaded by another process in the meantime
+            shutil.rmtree(temp)
+        with manifest.transaction(self._lock, self._connection) as cursor:
+            cursor.execute(
+                f'INSERT OR IGNORE INTO results ({", ".join(CachedResult._fields)}) '
+                f'VALUES ({", ".join("?" * len(CachedResult._fields))})',
+                result
+            )
+            cursor.execute('INSERT OR IGNORE INTO refs (key, owner) VALUES (?, ?)', (key, owner))
+        return result
+
+    def publish(self,
+                key: str,
+                owner: str,
+                source: str,
+                format_name: str | None,
+                metadata: str,
+                size: int,
+                digest: str | None, *,
+                exclude: typing.Container[str] = ()):
+        """Add the files in `source` to the cache (if there is
+        no result with the given key yet), and add a reference
+        to the result for `owner`.
+        """
+        with self._lock:
+            exists = self._connection.execute(
+                'SELECT 1 FROM results WHERE key = ?', (key,)
+            ).fetchone() is not None
+        if not exists:
+            # Files are linked into a private directory first,
+            # since other processes may publish the same result.
+            path = self._get_path(key)
+            temp = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+            fileutils.link_tree(source, temp, exclude=exclude)
+            try:
+                os.rename(temp, path)
+            except OSError:
+                # Published by another process in the meantime
+                shutil.rmtree(temp)
+        with manifest.transaction(self._lock, self._connection) as cursor:
+            cursor.execute(
+                f'INSERT OR IGNORE INTO results ({", ".join(CachedResult._fields)}) '
+                f'VALUES ({", ".join("?" * len(CachedResult._fields))})',
+                (key, format_name, metadata, size, digest, time.time())
+            )
+            cursor.execute('INSERT OR IGNORE INTO refs (key, owner) VALUES (?, ?)', (key, owner))
+        if self._backend is not None:
+            self._upload(key, format_name, metadata, size, digest)
+
+    def _upload(self,
+                key: str,
+                format_name: str | None,
+                metadata: str,
+                size: int,
+                digest: str | None):
+        prefix = self._get_backend_prefix(key)
+        if self._backend.exists(f'{prefix}/result.json'):
+            return
+        self._backend.upload_tree(self._get_path(key), f'{prefix}/data')
+        # Written last, so that other machines only see complete results
+        self._backend.put(f'{prefix}/result.json', json.dumps({
+            'format': format_name,
+            'metadata': metadata,
+            'size': size,
+            'digest': digest,
+            'created': time.time()
+        }).encode())
+
+    def set_references(self, owner: str, keys: typing.Iterable[str]):
+        """Replace the references held by `owner`, and remove the
+        results which are no longer referenced.
+        """
+        with manifest.transaction(self._lock, self._connection) as cursor:
+            cursor.execute('DELETE FROM refs WHERE owner = ?', (owner,))
+            cursor.executemany(
+                'INSERT OR IGNORE INTO refs (key, owner) VALUES (?, ?)',
+                [(key, owner) for key in keys]
+            )
+        self.collect()
+
+    def collect(self) -> list[str]:
+        """Remove all results which are no longer referenced.
+
+        References of owners (checkpoint directories) which
+        no longer exist are dropped first.
+        """
+        with manifest.transaction(self._lock, self._connection) as cursor:
+            owners = [row[0] for row in cursor.execute('SELECT DISTINCT owner FROM refs')]
+            cursor.executemany(
+                'DELETE FROM refs WHERE owner = ?',
+                [(owner,) for owner in owners if not os.path.exists(owner)]
+            )
+            keys = [
+                row[0] for row in cursor.execute(
+                    'SELECT key FROM results WHERE key NOT IN (SELECT key FROM refs)'
+                )
+            ]
+            cursor.executemany('DELETE FROM results WHERE key = ?', [(key,) for key in keys])
+        for key in keys:
+            path = self._get_path(key)
+            if os.path.exists(path):
+                shutil.rmtree(path)
+        return keys
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+    def _get_path(self, key: str) -> str:
+        return os.path.join(self._directory, 'store', key[:2], key)
+
+    def _get_backend_prefix(self, key: str) -> str:
+        return f'results/{key[:2]}/{key}'
@@ -4,6 +4,7 @@ import abc
 import logging
 import typing
 
+from .compression import Compression
 from .parameters import ArgumentConsumer, Config
 
 
@@ -104,8 +105,95 @@ class PipelineStep(ArgumentConsumer, abc.ABC):
     async def execute(self, *,
                       streamed_inputs: list[str] | None = None,
                       **inputs) -> typing.Any:
+        """Compute the output of the step from its inputs.
+
+        Inputs must not be modified: results are handed to all of their
+        consumers as the same object (numpy arrays as read-only views),
+        while their checkpoint may still be written in the background.
+        Likewise, the returned value must not be modified afterwards.
+        """
         pass
 
+    @classmethod
+    def supports_streamed_output(cls) -> bool:
+        """Return whether the step implements `execute_streamed`,
+        which allows its output to be connected to streamed inputs.
+        """
+        return False
+
+    async def execute_streamed(self, **inputs) -> typing.AsyncIterator[list]:
+        """Produce the output of the step as a stream of batches (lists).
+
+        The output of the step is the concatenation of all batches.
+        This method is used instead of `execute` when the step has
+        streamed inputs or outputs. Inputs listed in `streamed_inputs`
+        are asynchronous iterators over batches; the helpers in
+        `checkpointed_core.streaming` accept both streamed and
+        materialised inputs.
+
+        Streamed steps always run on the event loop, because
+        their inputs and outputs are shared with other steps.
+        """
+        raise NotImplementedError(
+            f'{self.__class__.__name__} does not support streamed output'
+        )
+        yield
+
+    @classmethod
+    def get_execution_mode(cls) -> str | None:
+        """Return the mode in which the `execute` method should be run.
+
+        Supported modes are:
+            - 'inline': run `execute` directly on the event loop
+            - 'thread': run `execute` in a worker thread
+            - 'process': run `execute` in a (warm) worker process.
+                This requires the step class, its configuration,
+                its inputs, and its result to be picklable.
+                Only used if the task executor allows processes;
+                otherwise, `execute` is run in a worker thread.
+
+        Returning `None` means the step has no preference,
+        in which case the default mode of the task executor is used.
+        """
+        return None
+
+    @classmethod
+    def get_resource_requirements(cls) -> dict[str, float]:
+        """Return the resources needed while this step is executing.
+
+        Keys are resource names, values the amount required.
+        Commonly used resources are 'cores', 'memory' (in bytes),
+        and tags such as 'model' or 'disk' (typically with amount 1).
+
+        The task executor only starts the step once the configured
+        resource budget allows it. Resources not part of the budget
+        are unlimited.
+        """
+        return {}
+
+    @classmethod
+    def get_compression(cls) -> Compression | None:
+        """Return the compression used for the checkpoint of this step.
+
+        Returning `None` means the compression configured
+        for the output storage format is used (if any).
+        """
+        return None
+
+    @classmethod
+    def get_partitioned_inputs(cls) -> frozenset[str]:
+        """Return the (list-valued) inputs over which the step can be
+        executed in parallel partitions.
+
+        An input can be partitioned if the output of the step is the
+        concatenation of its outputs for consecutive parts of that input,
+        as is the case for steps processing one document at a time.
+        The task executor may then split these inputs, and execute the
+        step once per partition; other inputs are passed to every partition.
+        The checkpoint metadata of the step must not depend on the partition.
+        """
+        return frozenset()
+
     # ========== Storage and Checkpointing Functions ==========
 
     @classmethod
@@ -121,6 +209,16 @@ class PipelineStep(ArgumentConsumer, abc.ABC):
     def checkpoint_is_valid(self, metadata: typing.Any) -> bool:
         pass
 
+    def get_checkpoint_dependencies(self) -> list[str] | None:
+        """Return the files the result of `checkpoint_is_valid` depends on,
+        besides the configuration of the step and the checkpoint metadata.
+
+        Once a checkpoint has been found valid, it remains valid (without
+        instantiating the step again) until one of these files changes.
+        Returning `None` means `checkpoint_is_valid` is called on every run.
+        """
+        return None
+
     @classmethod
     def has_dynamic_checkpoint(cls) -> bool:
         """Special method which is used to enable checkpointing of
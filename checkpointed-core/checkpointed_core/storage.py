@@ -0,0 +1,500 @@
+"""Storage backends for checkpoint data.
+
+A storage backend stores objects (files) under '/'-separated keys.
+Checkpoints are always read and written by data formats in a local
+directory; backends transfer complete directory trees (see
+`StorageBackend.upload_tree` and `StorageBackend.download_tree`),
+so that data formats work unchanged with any backend.
+
+Three backends are provided:
+
+- `LocalBackend`, storing objects as files in a (possibly shared) directory;
+- `ObjectStoreBackend`, storing objects in an object store through a
+  client with the interface of the boto3 S3 client, using parallel
+  multipart uploads and ranged downloads for large objects;
+- `InMemoryObjectStore`, an in-process object store emulating such
+  a client, for tests.
+"""
+
+from __future__ import annotations
+
+import abc
+import bisect
+import concurrent.futures
+import io
+import json
+import os
+import shutil
+import threading
+import typing
+import uuid
+
+# Listing of the files of a tree, written once all files have been written
+_TREE_FILE = '.tree.json'
+
+
+class StorageBackend(abc.ABC):
+
+    # Maximum number of parallel transfers
+    max_concurrency = 8
+
+    @abc.abstractmethod
+    def open_read(self, key: str) -> typing.BinaryIO:
+        pass
+
+    @abc.abstractmethod
+    def open_write(self, key: str) -> typing.BinaryIO:
+        """Open an object for writing. The object only becomes
+        visible once the file is closed without an error.
+        """
+
+    @abc.abstractmethod
+    def exists(self, key: str) -> bool:
+        pass
+
+    @abc.abstractmethod
+    def delete(self, key: str):
+        pass
+
+    @abc.abstractmethod
+    def list_keys(self, prefix: str) -> typing.Iterator[str]:
+        pass
+
+    def get(self, key: str) -> bytes:
+        with self.open_read(key) as file:
+            return file.read()
+
+    def put(self, key: str, data: bytes):
+        with self.open_write(key) as file:
+            file.write(data)
+
+    def upload_file(self, filename: str, key: str):
+        with open(filename, 'rb') as source, self.open_write(key) as target:
+            shutil.copyfileobj(source, target, _CHUNK_SIZE)
+
+    def download_file(self, key: str, filename: str):
+        with self.open_read(key) as source, open(filename, 'wb') as target:
+            shutil.copyfileobj(source, target, _CHUNK_SIZE)
+
+    def upload_tree(self, source: str, prefix: str, *, exclude: typing.Container[str] = ()):
+        """Upload the files in a directory tree, in parallel.
+
+        The tree only becomes visible (see `has_tree`) once all
+        its files have been uploaded. Top-level entries of `source`
+        whose name is in `exclude` are skipped.
+        """
+        files = {}
+        for directory, directories, filenames in os.walk(source):
+            if directory == source:
+                directories[:] = [d for d in directories if d not in exclude]
+                filenames = [f for f in filenames if f not in exclude]
+            for filename in filenames:
+                path = os.path.join(directory, filename)
+                files[os.path.relpath(path, source).replace(os.sep, '/')] = path
+        with concurrent.futures.ThreadPoolExecutor(self.max_concurrency) as pool:
+            for future in [
+                pool.submit(self.upload_file, path, f'{prefix}/{name}')
+                for name, path in files.items()
+            ]:
+                future.result()
+        self.put(f'{prefix}/{_TREE_FILE}', json.dumps(sorted(files)).encode())
+
+    def download_tree(self, prefix: str, target: str):
+        """Download the files of a tree uploaded using `upload_tree`, in parallel."""
+        names = json.loads(self.get(f'{prefix}/{_TREE_FILE}'))
+        os.makedirs(target, exist_ok=True)
+        for name in names:
+            os.makedirs(os.path.dirname(os.path.join(target, name)), exist_ok=True)
+        with concurrent.futures.ThreadPoolExecutor(self.max_concurrency) as pool:
+            for future in [
+                pool.submit(self.download_file, f'{prefix}/{name}', os.path.join(target, name))
+                for name in names
+            ]:
+                future.result()
+
+    def has_tree(self, prefix: str) -> bool:
+        return self.exists(f'{prefix}/{_TREE_FILE}')
+
+    def delete_tree(self, prefix: str):
+        # The listing is removed first, so that the tree is never partially visible
+        if self.has_tree(prefix):
+            self.delete(f'{prefix}/{_TREE_FILE}')
+        for key in list(self.list_keys(f'{prefix}/')):
+            self.delete(key)
+
+    def close(self):
+        pass
+
+
+_CHUNK_SIZE = 1 << 20
+
+
+class LocalBackend(StorageBackend):
+    """Objects stored as files in a directory."""
+
+    def __init__(self, directory: str):
+        self._directory = os.path.abspath(directory)
+
+    @property
+    def directory(self) -> str:
+        return self._directory
+
+    def open_read(self, key: str) -> typing.BinaryIO:
+        return open(self._get_path(key), 'rb')
+
+    def open_write(self, key: str) -> typing.BinaryIO:
+        path = self._get_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        return _AtomicFile(path)
+
+    def exists(self, key: str) -> bool:
+        return os.path.isfile(self._get_path(key))
+
+    def delete(self, key: str):
+        path = self._get_path(key)
+        if os.path.exists(path):
+            os.remove(path)
+
+    def list_keys(self, prefix: str) -> typing.Iterator[str]:
+        # Only the directory containing the prefix has to be scanned
+        directory = os.path.dirname(self._get_path(prefix + 'x'))
+        for root, _, filenames in os.walk(directory):
+            for filename in filenames:
+                if filename.endswith(_AtomicFile.SUFFIX):
+                    continue
+                key = os.path.relpath(os.path.join(root, filename), self._directory)
+                key = key.replace(os.sep, '/')
+                if key.startswith(prefix):
+                    yield key
+
+    def _get_path(self, key: str) -> str:
+        path = os.path.normpath(os.path.join(self._directory, *key.split('/')))
+        if not path.startswith(self._directory + os.sep):
+            raise ValueError(f'Invalid key: {key!r}')
+        return path
+
+
+class _AtomicFile(io.FileIO):
+    # Suffix of files which are being written
+    SUFFIX = '.partial'
+
+    def __init__(self, filename: str):
+        self._filename = filename
+        self._temp = f'{filename}.{uuid.uuid4().hex}{self.SUFFIX}'
+        self._failed = False
+        super().__init__(self._temp, 'wb')
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self._failed = exc_type is not None
+        return super().__exit__(exc_type, exc_val, exc_tb)
+
+    def close(self):
+        if self.closed:
+            return
+        if self._failed:
+            super().close()
+            os.remove(self._temp)
+            return
+        os.fsync(self.fileno())
+        super().close()
+        os.replace(self._temp, self._filename)
+
+
+class ObjectStoreBackend(StorageBackend):
+    """Objects stored in an object store.
+
+    `client` must provide (a subset of) the interface of the boto3 S3
+    client, e.g. `boto3.client('s3')`, or an `InMemoryObjectStore`.
+    Objects larger than `part_size` are uploaded as multipart uploads,
+    and downloaded using ranged requests, transferring up to
+    `max_concurrency` parts in parallel. Object stores typically
+    require parts of at least 5 MiB.
+    """
+
+    def __init__(self,
+                 client: typing.Any,
+                 bucket: str,
+                 prefix: str = '', *,
+                 part_size: int = 8 << 20,
+                 max_concurrency: int = 8):
+        self._client = client
+        self._bucket = bucket
+        self._prefix = prefix
+        self._part_size = part_size
+        self.max_concurrency = max_concurrency
+        self._part_pool: concurrent.futures.ThreadPoolExecutor | None = None
+        self._part_pool_lock = threading.Lock()
+
+    def open_read(self, key: str) -> typing.BinaryIO:
+        return self._client.get_object(Bucket=self._bucket, Key=self._prefix + key)['Body']
+
+    def open_write(self, key: str) -> typing.BinaryIO:
+        return _MultipartWriter(self, self._prefix + key)
+
+    def exists(self, key: str) -> bool:
+        # Listing does not depend on the error types of the client
+        response = self._client.list_objects_v2(
+            Bucket=self._bucket, Prefix=self._prefix + key, MaxKeys=1
+        )
+        return any(obj['Key'] == self._prefix + key for obj in response.get('Contents', ()))
+
+    def delete(self, key: str):
+        self._client.delete_object(Bucket=self._bucket, Key=self._prefix + key)
+
+    def list_keys(self, prefix: str) -> typing.Iterator[str]:
+        arguments = {'Bucket': self._bucket, 'Prefix': self._prefix + prefix}
+        while True:
+            response = self._client.list_objects_v2(**arguments)
+            for obj in response.get('Contents', ()):
+                yield obj['Key'][len(self._prefix):]
+            if not response.get('IsTruncated'):
+                return
+            arguments['ContinuationToken'] = response['NextContinuationToken']
+
+    def upload_file(self, filename: str, key: str):
+        size = os.path.getsize(filename)
+        if size <= self._part_size:
+            with open(filename, 'rb') as file:
+                self._client.put_object(
+                    Bucket=self._bucket, Key=self._prefix + key, Body=file.read()
+                )
+            return
+
+        def read_part(offset: int) -> bytes:
+            with open(filename, 'rb') as file:
+                file.seek(offset)
+                return file.read(self._part_size)
+
+        with _MultipartWriter(self, self._prefix + key) as writer:
+            for offset in range(0, size, self._part_size):
+                writer.submit_part(read_part, offset)
+
+    def download_file(self, key: str, filename: str):
+        size = self._client.head_object(
+            Bucket=self._bucket, Key=self._prefix + key
+        )['ContentLength']
+        if size <= self._part_size:
+            super().download_file(key, filename)
+            return
+        with open(filename, 'wb') as file:
+            file.truncate(size)
+            fd = file.fileno()
+
+            def download_part(offset: int):
+                end = min(offset + self._part_size, size) - 1
+                body = self._client.get_object(
+                    Bucket=self._bucket, Key=self._prefix + key, Range=f'bytes={offset}-{end}'
+                )['Body']
+                os.pwrite(fd, body.read(), offset)
+
+            pool = self._get_part_pool()
+            for future in [
+                pool.submit(download_part, offset) for offset in range(0, size, self._part_size)
+            ]:
+                future.result()
+
+    def close(self):
+        with self._part_pool_lock:
+            if self._part_pool is not None:
+                self._part_pool.shutdown()
+                self._part_pool = None
+
+    def _get_part_pool(self) -> concurrent.futures.ThreadPoolExecutor:
+        # Parts are transferred by a separate pool, since parts are
+        # submitted by the threads transferring files in parallel.
+        with self._part_pool_lock:
+            if self._part_pool is None:
+                self._part_pool = concurrent.futures.ThreadPoolExecutor(
+                    max_workers=self.max_concurrency,
+                    thread_name_prefix='object-store-part'
+                )
+            return self._part_pool
+
+
+class _MultipartWriter(io.RawIOBase):
+    """Streaming upload of an object, using a multipart upload
+    once the data does not fit in a single part.
+    """
+
+    def __init__(self, backend: ObjectStoreBackend, key: str):
+        super().__init__()
+        self._backend = backend
+        self._client = backend._client
+        self._bucket = backend._bucket
+        self._key = key
+        self._buffer = bytearray()
+        self._upload_id = None
+        self._parts: list[concurrent.futures.Future] = []
+        # Bounds the parts held in memory while they are uploaded
+        self._in_flight = threading.BoundedSemaphore(backend.max_concurrency)
+        self._failed = False
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._buffer += data
+        while len(self._buffer) >= self._backend._part_size:
+            part = bytes(self._buffer[:self._backend._part_size])
+            del self._buffer[:self._backend._part_size]
+            self.submit_part(lambda p: p, part)
+        return len(data)
+
+    def submit_part(self, read: typing.Callable[[typing.Any], bytes], argument: typing.Any):
+        """Upload a part, obtained by calling `read(argument)` on an upload thread.
+
+        Blocks while `max_concurrency` parts of the object are being uploaded.
+        """
+        if self._upload_id is None:
+            self._upload_id = self._client.create_multipart_upload(
+                Bucket=self._bucket, Key=self._key
+            )['UploadId']
+        number = len(self._parts) + 1
+
+        def upload():
+            response = self._client.upload_part(
+                Bucket=self._bucket,
+                Key=self._key,
+                PartNumber=number,
+                UploadId=self._upload_id,
+                Body=read(argument)
+            )
+            return {'PartNumber': number, 'ETag': response['ETag']}
+
+        self._in_flight.acquire()
+        try:
+            future = self._backend._get_part_pool().submit(upload)
+        except BaseException:
+            self._in_flight.release()
+            raise
+        future.add_done_callback(lambda _: self._in_flight.release())
+        self._parts.append(future)
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self._failed = exc_type is not None
+        return super().__exit__(exc_type, exc_val, exc_tb)
+
+    def close(self):
+        if self.closed:
+            return
+        try:
+            if self._failed:
+                if self._upload_id is not None:
+                    concurrent.futures.wait(self._parts)
+                    self._client.abort_multipart_upload(
+                        Bucket=self._bucket, Key=self._key, UploadId=self._upload_id
+                    )
+                return
+            if self._upload_id is None:
+                self._client.put_object(
+                    Bucket=self._bucket, Key=self._key, Body=bytes(self._buffer)
+                )
+                return
+            if self._buffer:
+                self.submit_part(lambda p: p, bytes(self._buffer))
+            try:
+                parts = [future.result() for future in self._parts]
+            except BaseException:
+                self._client.abort_multipart_upload(
+                    Bucket=self._bucket, Key=self._key, UploadId=self._upload_id
+                )
+                raise
+            self._client.complete_multipart_upload(
+                Bucket=self._bucket,
+                Key=self._key,
+                UploadId=self._upload_id,
+                MultipartUpload={'Parts': parts}
+            )
+        finally:
+            self._buffer = bytearray()
+            super().close()
+
+
+class InMemoryObjectStore:
+    """In-process emulation of the parts of the interface of
+    the boto3 S3 client used by `ObjectStoreBackend`.
+
+    Objects are lost when the store is garbage collected.
+    """
+
+    def __init__(self):
+        self._objects: dict[tuple[str, str], bytes] = {}
+        self._uploads: dict[str, tuple[str, str, dict[int, bytes]]] = {}
+        self._lock = threading.Lock()
+
+    def put_object(self, *, Bucket: str, Key: str, Body: bytes | typing.BinaryIO):
+        data = Body if isinstance(Body, (bytes, bytearray)) else Body.read()
+        with self._lock:
+            self._objects[(Bucket, Key)] = bytes(data)
+        return {'ETag': f'"{uuid.uuid4().hex}"'}
+
+    def get_object(self, *, Bucket: str, Key: str, Range: str | None = None):
+        data = self._get(Bucket, Key)
+        if Range is not None:
+            start, end = Range.removeprefix('bytes=').split('-')
+            data = data[int(start):int(end) + 1]
+        return {'Body': io.BytesIO(data), 'ContentLength': len(data)}
+
+    def head_object(self, *, Bucket: str, Key: str):
+        return {'ContentLength': len(self._get(Bucket, Key))}
+
+    def delete_object(self, *, Bucket: str, Key: str):
+        with self._lock:
+            self._objects.pop((Bucket, Key), None)
+        return {}
+
+    def list_objects_v2(self, *,
+                        Bucket: str,
+                        Prefix: str = '',
+                        MaxKeys: int = 1000,
+                        ContinuationToken: str | None = None):
+        with self._lock:
+            sizes = {
+                key: len(data) for (bucket, key), data in self._objects.items() if bucket == Bucket
+            }
+        keys = sorted(sizes)
+        start = bisect.bisect_right(keys, ContinuationToken) if ContinuationToken else 0
+        matches = [key for key in keys[start:] if key.startswith(Prefix)]
+        response = {
+            'Contents': [{'Key': key, 'Size': sizes[key]} for key in matches[:MaxKeys]],
+            'IsTruncated': len(matches) > MaxKeys
+        }
+        if response['IsTruncated']:
+            response['NextContinuationToken'] = matches[MaxKeys - 1]
+        return response
+
+    def create_multipart_upload(self, *, Bucket: str, Key: str):
+        upload_id = uuid.uuid4().hex
+        with self._lock:
+            self._uploads[upload_id] = (Bucket, Key, {})
+        return {'UploadId': upload_id}
+
+    def upload_part(self, *, Bucket: str, Key: str, PartNumber: int, UploadId: str, Body: bytes):
+        with self._lock:
+            self._uploads[UploadId][2][PartNumber] = bytes(Body)
+        return {'ETag': f'"{UploadId}-{PartNumber}"'}
+
+    def complete_multipart_upload(self, *,
+                                  Bucket: str,
+                                  Key: str,
+                                  UploadId: str,
+                                  MultipartUpload: dict[str, list[dict[str, typing.Any]]]):
+        with self._lock:
+            _, _, parts = self._uploads.pop(UploadId)
+            numbers = [part['PartNumber'] for part in MultipartUpload['Parts']]
+            if numbers != sorted(parts):
+                raise ValueError(f'Invalid parts for upload {UploadId}')
+            self._objects[(Bucket, Key)] = b''.join(parts[number] for number in numbers)
+        return {}
+
+    def abort_multipart_upload(self, *, Bucket: str, Key: str, UploadId: str):
+        with self._lock:
+            self._uploads.pop(UploadId, None)
+        return {}
+
+    def _get(self, bucket: str, key: str) -> bytes:
+        with self._lock:
+            try:
+                return self._objects[(bucket, key)]
+            except KeyError:
+                raise FileNotFoundError(f'No such object: {bucket}/{key}') from None
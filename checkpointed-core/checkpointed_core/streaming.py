@@ -0,0 +1,109 @@
+from __future__ import annotations
+
+import asyncio
+import typing
+
+DEFAULT_BATCH_SIZE = 256
+
+
+class Channel:
+    """Bounded channel carrying batches (lists of items) from
+    a producing step to a single consumer.
+
+    The producer is suspended while the channel is full,
+    so that a slow consumer limits the memory used by the stream.
+    Consumers iterate over the channel using `async for`.
+    """
+
+    def __init__(self, capacity: int):
+        if capacity < 1:
+            raise ValueError('Channel capacity must be at least 1')
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=capacity)
+        self._end: _End | None = None
+        self._detached = False
+
+    async def put(self, batch: list):
+        if not self._detached:
+            await self._queue.put(batch)
+
+    async def close(self):
+        """Signal the end of the stream."""
+        if not self._detached:
+            await self._queue.put(_End(None))
+
+    def fail(self, error: BaseException):
+        """Abort the stream. The consumer receives `error`
+        instead of any batches it has not yet received.
+        """
+        self._drain()
+        self._queue.put_nowait(_End(error))
+
+    def detach(self):
+        """Signal that the consumer will not read any more batches.
+
+        Batches sent afterwards are discarded, so that the producer
+        never waits for a consumer which has finished.
+        """
+        self._detached = True
+        self._drain()
+
+    def _drain(self):
+        while not self._queue.empty():
+            self._queue.get_nowait()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> list:
+        if self._end is None:
+            item = await self._queue.get()
+            if not isinstance(item, _End):
+                return item
+            self._end = item
+        if self._end.error is not None:
+            raise self._end.error
+        raise StopAsyncIteration
+
+
+class _End(typing.NamedTuple):
+    error: BaseException | None
+
+
+def is_stream(value: typing.Any) -> bool:
+    return hasattr(value, '__aiter__')
+
+
+async def batches(value: typing.Any,
+                  batch_size: int = DEFAULT_BATCH_SIZE) -> typing.AsyncIterator[list]:
+    """Iterate over an input in batches, regardless of whether it is streamed.
+
+    Streamed inputs are passed through as-is; materialised
+    lists are split into batches of at most `batch_size` items.
+    """
+    if is_stream(value):
+        async for batch in value:
+            yield batch
+    else:
+        for start in range(0, len(value), batch_size):
+            yield value[start:start + batch_size]
+
+
+async def collect(value: typing.Any) -> list:
+    """Materialise an input, regardless of whether it is streamed."""
+    if not is_stream(value):
+        return value
+    result = []
+    async for batch in value:
+        result.extend(batch)
+    return result
+
+
+def iterate_blocking(channel: Channel,
+                     loop: asyncio.AbstractEventLoop) -> typing.Iterator[list]:
+    """Iterate over a channel from a thread other than the event loop."""
+    while True:
+        try:
+            batch = asyncio.run_coroutine_threadsafe(channel.__anext__(), loop).result()
+        except StopAsyncIteration:
+            return
+        yield batch
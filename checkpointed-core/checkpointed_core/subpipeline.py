@@ -45,6 +45,7 @@ class SubPipeline(step.PipelineStep, abc.ABC):
             _return_values=...,
             _sub_store=sub_store,
             logger=logger,
+            executor=task_executor,
             loop=task_executor.loop
         )
 
@@ -103,6 +104,12 @@ class SubPipeline(step.PipelineStep, abc.ABC):
     def has_dynamic_checkpoint(cls) -> bool:
         return True
 
+    @classmethod
+    def get_execution_mode(cls) -> str | None:
+        # The inner pipeline needs the storage manager and executor
+        # of the current session, which only exist on the event loop.
+        return 'inline'
+
     def dynamic_checkpoint_is_valid(self) -> bool:
         return self._inner_pipeline_checkpoints_all_valid
 
@@ -0,0 +1,224 @@
+"""Local (hot) tier of checkpoint storage.
+
+Checkpoint directories are often kept on durable, but slow storage
+(e.g. a network file system). A hot tier is a directory on fast local
+storage holding copies of checkpoints: checkpoints are written to the
+hot tier, and promoted to the checkpoint directory in the background,
+and checkpoints are read from the hot tier where possible.
+
+Copies are stored under the location of the checkpoint, and are only
+used if their digest matches the digest of the checkpoint, so that a
+hot tier can be shared by all pipelines (and runs) on a machine. The
+least recently used copies are evicted once the total size of the copies
+exceeds the quota of the tier; which checkpoints are copied, and which
+copies are never evicted, is configured per data format (see `set_placement`).
+"""
+
+from __future__ import annotations
+
+import collections
+import contextlib
+import fnmatch
+import json
+import logging
+import os
+import shutil
+import threading
+import typing
+import uuid
+
+from . import fileutils
+
+# Copies of checkpoints are kept until they are evicted
+CACHE = 'cache'
+# Copies of checkpoints are never evicted
+PINNED = 'pinned'
+# Checkpoints are never copied to the hot tier
+COLD = 'cold'
+
+_PLACEMENTS = (CACHE, PINNED, COLD)
+
+# Placements by data format name, which may be a glob pattern (e.g. 'gensim-*')
+_placement_by_format: dict[str, str] = {}
+
+
+def set_placement(name: str, placement: str | None):
+    """Set the placement of checkpoints stored in the formats
+    matching `name` (a format name or glob pattern) in hot tiers.
+    """
+    if placement is None:
+        _placement_by_format.pop(name, None)
+    elif placement not in _PLACEMENTS:
+        raise ValueError(f'Invalid placement {placement!r}; expected one of {", ".join(_PLACEMENTS)}')
+    else:
+        _placement_by_format[name] = placement
+
+
+def get_placement(name: str | None) -> str:
+    if name in _placement_by_format:
+        return _placement_by_format[name]
+    # Later patterns take precedence
+    for pattern, placement in reversed(_placement_by_format.items()):
+        if name is not None and fnmatch.fnmatchcase(name, pattern):
+            return placement
+    return CACHE
+
+
+class HotTier:
+    """A hot tier in a local directory, safe for use from multiple threads."""
+
+    def __init__(self, directory: str, *,
+                 quota: int | None = None,
+                 logger: logging.Logger | None = None):
+        self.directory = directory
+        self.quota = quota
+        self._logger = logging.getLogger(__name__) if logger is None else logger
+        self._lock = threading.Lock()
+        # Number of readers of every copy, which is not evicted while it is read
+        self._readers = collections.Counter()
+        os.makedirs(directory, exist_ok=True)
+        self._size = sum(info['size'] for _, _, info in self._list_copies())
+
+    def get_path(self, location: str) -> str:
+        return os.path.join(self.directory, location)
+
+    def lookup(self, location: str, digest: str | None) -> str | None:
+        """Return the path of the copy of a checkpoint, if the
+        hot tier holds a copy of its current contents.
+        """
+        if digest is None:
+            return None
+        info = self._load_info(location)
+        if info is None or info['digest'] != digest:
+            return None
+        # The modification time of the description is the time of last use
+        try:
+            os.utime(self._get_info_filename(location))
+        except FileNotFoundError:
+            return None
+        return self.get_path(location)
+
+    @contextlib.contextmanager
+    def pinned(self, location: str):
+        """Keep the copy of a checkpoint from being evicted while it is read.
+
+        Copies are only pinned against eviction by this hot tier; readers
+        must handle copies evicted by other processes.
+        """
+        with self._lock:
+            self._readers[location] += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._readers[location] -= 1
+                if not self._readers[location]:
+                    del self._readers[location]
+
+    def prepare(self, location: str) -> str:
+        """Discard the copy of a checkpoint, returning the path to write
+        its new contents to. The copy must be added using `add`.
+        """
+        with self._lock:
+            self._size -= self._discard(location)
+        return self.get_path(location)
+
+    def add(self, location: str, digest: str, size: int, *, placement: str, promoted: bool):
+        """Register the copy of a checkpoint written to the path returned by `prepare`.
+
+        Copies which have not been promoted are never evicted.
+        """
+        fileutils.write_json_atomically(
+            self._get_info_filename(location),
+            {'digest': digest, 'size': size, 'placement': placement, 'promoted': promoted}
+        )
+        with self._lock:
+            self._size += size
+        self._evict()
+
+    def mark_promoted(self, location: str):
+        info = self._load_info(location)
+        if info is not None:
+            info['promoted'] = True
+            fileutils.write_json_atomically(self._get_info_filename(location), info)
+        # The copy can only be evicted once it has been promoted
+        self._evict()
+
+    def fetch(self, location: str, source: str, digest: str, *,
+              placement: str, exclude: typing.Container[str] = ()) -> str:
+        """Copy a checkpoint to the hot tier, returning the path of the copy."""
+        temp = self.get_path(f'{location}.{uuid.uuid4().hex}.tmp')
+        fileutils.link_tree(source, temp, exclude=exclude)
+        size = fileutils.tree_size(temp)
+        with self._lock:
+            self._size -= self._discard(location)
+        os.replace(temp, self.get_path(location))
+        self.add(location, digest, size, placement=placement, promoted=True)
+        return self.get_path(location)
+
+    def _evict(self):
+        with self._lock:
+            if self.quota is None or self._size <= self.quota:
+                return
+            # Copies may have been added or removed by other processes
+            copies = self._list_copies()
+            self._size = sum(info['size'] for _, _, info in copies)
+            # Least recently used copies are evicted first
+            candidates = sorted(
+                (accessed, location)
+                for accessed, location, info in copies
+                if info['placement'] == CACHE and info['promoted'] and location not in self._readers
+            )
+            for _, location in candidates:
+                if self._size <= self.quota:
+                    break
+                self._size -= self._discard(location)
+            if self._size > self.quota:
+                self._logger.warning(
+                    f'Hot tier {self.directory} exceeds its quota, '
+                    f'since the remaining copies are pinned, being read, or not yet promoted'
+                )
+
+    def _discard(self, location: str) -> int:
+        """Remove the copy of a checkpoint, returning its size."""
+        info = self._load_info(location)
+        # The description is removed first, so that the copy is never used
+        # while it is being removed.
+        try:
+            os.remove(self._get_info_filename(location))
+        except FileNotFoundError:
+            info = None
+        shutil.rmtree(self.get_path(location), ignore_errors=True)
+        return 0 if info is None else info['size']
+
+    def _list_copies(self) -> list[tuple[float, str, dict]]:
+        """Return the time of last use, location and description of every copy."""
+        copies = []
+        store_directory = os.path.join(self.directory, 'store')
+        if not os.path.isdir(store_directory):
+            return copies
+        for shard in os.scandir(store_directory):
+            if not shard.is_dir(follow_symlinks=False):
+                continue
+            for entry in os.scandir(shard.path):
+                if not entry.name.endswith('.json'):
+                    continue
+                location = f'store/{shard.name}/{entry.name.removesuffix(".json")}'
+                info = self._load_info(location)
+                try:
+                    accessed = entry.stat().st_mtime
+                except FileNotFoundError:
+                    continue
+                if info is not None:
+                    copies.append((accessed, location, info))
+        return copies
+
+    def _load_info(self, location: str) -> dict | None:
+        try:
+            with open(self._get_info_filename(location)) as file:
+                return json.load(file)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def _get_info_filename(self, location: str) -> str:
+        return self.get_path(location) + '.json'
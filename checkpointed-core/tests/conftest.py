@@ -0,0 +1,22 @@
+import asyncio
+
+import pytest
+
+import steps
+from checkpointed_core import data_format
+
+
+@pytest.fixture(autouse=True)
+def formats():
+    steps.register_formats()
+    steps.calls.clear()
+    steps.fail_on.clear()
+    yield
+    data_format.initialise_format_registry()
+
+
+@pytest.fixture
+def loop():
+    loop = asyncio.new_event_loop()
+    yield loop
+    loop.close()
@@ -0,0 +1,158 @@
+"""Steps used by the tests.
+
+These are defined in a module of their own, so that
+worker processes can import them.
+"""
+
+import asyncio
+import os
+import pickle
+import time
+
+import checkpointed_core
+from checkpointed_core import data_format
+from checkpointed_core.data_format import DataFormat
+from checkpointed_core.parameters import arguments
+
+FORMAT = 'test-pickle'
+
+
+class PickleFormat(DataFormat):
+
+    @staticmethod
+    def store(path, data):
+        with data_format.open_file(os.path.join(path, 'main.pickle'), 'wb') as file:
+            pickle.dump(data, file)
+
+    @staticmethod
+    def load(path):
+        with data_format.open_file(os.path.join(path, 'main.pickle'), 'rb') as file:
+            return pickle.load(file)
+
+
+def register_formats():
+    data_format.initialise_format_registry()
+    data_format.register_format(FORMAT, PickleFormat)
+
+
+# Worker processes only import this module
+if not data_format.is_initialised() or not data_format.is_registered(FORMAT):
+    register_formats()
+
+# Names of the steps executed in this process, in order of execution
+calls = []
+# Values for which `PartitionedDouble` fails
+fail_on = set()
+
+
+class Step(checkpointed_core.PipelineStep):
+
+    @classmethod
+    def supported_inputs(cls):
+        return {}
+
+    @classmethod
+    def supported_streamed_inputs(cls):
+        return {}
+
+    @classmethod
+    def get_output_storage_format(cls):
+        return FORMAT
+
+    @classmethod
+    def get_arguments(cls):
+        return {
+            'value': arguments.IntArgument('value', 'Value used by the step', default=0),
+            'seconds': arguments.FloatArgument('seconds', 'Duration of the step', default=0.0),
+            'marker': arguments.StringArgument('marker', 'File used by the step', default='')
+        }
+
+    @classmethod
+    def get_constraints(cls):
+        return []
+
+    def get_checkpoint_metadata(self):
+        return {}
+
+    def checkpoint_is_valid(self, metadata):
+        return True
+
+    def get_checkpoint_dependencies(self):
+        return []
+
+
+class Source(Step):
+
+    async def execute(self, **inputs):
+        calls.append('source')
+        return list(range(self.config.get('params.value')))
+
+
+class Double(Step):
+
+    @classmethod
+    def supported_inputs(cls):
+        return {'x': (Step,)}
+
+    async def execute(self, **inputs):
+        calls.append('double')
+        return [2 * x for x in inputs['x']]
+
+
+class PartitionedDouble(Double):
+
+    @classmethod
+    def get_partitioned_inputs(cls):
+        return frozenset({'x'})
+
+    async def execute(self, **inputs):
+        calls.append(f'partition-{inputs["x"][0]}')
+        if fail_on.intersection(inputs['x']):
+            raise RuntimeError('step failed')
+        return [2 * x for x in inputs['x']]
+
+
+class Add(Step):
+
+    @classmethod
+    def supported_inputs(cls):
+        return {'a': (Step,), 'b': (Step,)}
+
+    async def execute(self, **inputs):
+        calls.append('add')
+        return [a + b for a, b in zip(inputs['a'], inputs['b'])]
+
+
+class Fail(Step):
+
+    async def execute(self, **inputs):
+        await asyncio.sleep(self.config.get('params.seconds'))
+        raise RuntimeError('step failed')
+
+
+class Remote(Step):
+    """Sleeps in a worker process, and returns the name of the step."""
+
+    @classmethod
+    def get_execution_mode(cls):
+        return 'process'
+
+    async def execute(self, **inputs):
+        time.sleep(self.config.get('params.seconds'))
+        return [self.config.get('params.marker'), os.getpid()]
+
+
+class Crash(Step):
+    """Kills its worker process, until its marker file exists."""
+
+    @classmethod
+    def get_execution_mode(cls):
+        return 'process'
+
+    async def execute(self, **inputs):
+        marker = self.config.get('params.marker')
+        if not marker or not os.path.exists(marker):
+            if marker:
+                open(marker, 'w').close()
+            os._exit(1)
+        return ['RECOVERED']
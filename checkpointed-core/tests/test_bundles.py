@@ -0,0 +1,67 @@
+import logging
+
+import pytest
+
+import checkpointed_core
+from steps import Double, Source, calls
+
+
+def _pipeline():
+    pipeline = checkpointed_core.Pipeline('pipeline')
+    source = pipeline.add_source(Source)
+    double = pipeline.add_step(Double)
+    sink = pipeline.add_sink(Double, filename='output')
+    pipeline.connect(source, double, 'x')
+    pipeline.connect(double, sink, 'x')
+    return pipeline.build({source: {'value': 3}, double: {}, sink: {}}), double, sink
+
+
+def _run(tmp_path, loop, directory):
+    plan, _, sink = _pipeline()
+    calls.clear()
+    result = plan.execute(
+        output_directory=str(tmp_path / 'output'),
+        checkpoint_directory=str(tmp_path / directory),
+        logger=logging.getLogger(__name__),
+        loop=loop,
+        _return_values={sink}
+    )
+    return result[sink]
+
+
+def test_imported_checkpoints_are_reused(tmp_path, loop):
+    _run(tmp_path, loop, 'first')
+    plan, _, _ = _pipeline()
+    bundle = str(tmp_path / 'checkpoints.bundle')
+    assert len(plan.export_checkpoints(bundle, checkpoint_directory=str(tmp_path / 'first'))) == 3
+    assert len(plan.import_checkpoints(bundle, checkpoint_directory=str(tmp_path / 'second'))) == 3
+    assert _run(tmp_path, loop, 'second') == [0, 4, 8]
+    assert calls == []
+
+
+def test_targets_are_exported_with_their_dependencies(tmp_path, loop):
+    _run(tmp_path, loop, 'first')
+    plan, double, _ = _pipeline()
+    bundle = str(tmp_path / 'checkpoints.bundle')
+    exported = plan.export_checkpoints(
+        bundle, checkpoint_directory=str(tmp_path / 'first'), targets=[double], compression=None
+    )
+    assert len(exported) == 2
+    plan.import_checkpoints(bundle, checkpoint_directory=str(tmp_path / 'second'))
+    assert _run(tmp_path, loop, 'second') == [0, 4, 8]
+    assert calls == ['double']
+
+
+def test_corrupted_bundles_are_rejected(tmp_path, loop):
+    _run(tmp_path, loop, 'first')
+    plan, _, _ = _pipeline()
+    bundle = tmp_path / 'checkpoints.bundle'
+    plan.export_checkpoints(str(bundle), checkpoint_directory=str(tmp_path / 'first'), compression=None)
+    data = bytearray(bundle.read_bytes())
+    # Flips a bit in the data of the first checkpoint
+    data[data.index(b'\x80') + 5] ^= 1
+    bundle.write_bytes(data)
+    with pytest.raises(ValueError):
+        plan.import_checkpoints(str(bundle), checkpoint_directory=str(tmp_path / 'second'))
+    assert _run(tmp_path, loop, 'second') == [0, 4, 8]
+    assert calls == ['source', 'double', 'double']
@@ -0,0 +1,14 @@
+import pytest
+
+from checkpointed_core.checkpointing import hash_config
+
+
+def test_config_hash_does_not_depend_on_order():
+    assert hash_config({'a': 1, 'b': [1, 2]}) == hash_config({'b': [1, 2], 'a': 1})
+    assert hash_config({'x': {3, 1, 2}}) == hash_config({'x': {1, 2, 3}})
+    assert hash_config({'a': [1, 2]}) != hash_config({'a': [2, 1]})
+
+
+def test_config_hash_rejects_unsupported_values():
+    with pytest.raises(ValueError, match='object'):
+        hash_config({'a': object()})
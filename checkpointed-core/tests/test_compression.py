@@ -0,0 +1,128 @@
+import asyncio
+import gzip
+import logging
+import os
+import pickle
+import types
+
+import pytest
+
+import checkpointed_core
+from checkpointed_core import Compression, data_format
+from checkpointed_core.data_format import DataFormat
+
+
+class PickleFormat(DataFormat):
+
+    @staticmethod
+    def store(path, data):
+        with data_format.open_file(os.path.join(path, 'main.pickle'), 'wb') as file:
+            pickle.dump(data, file)
+
+    @staticmethod
+    def load(path):
+        with data_format.open_file(os.path.join(path, 'main.pickle'), 'rb') as file:
+            return pickle.load(file)
+
+
+calls = []
+# Version of the data read by the source
+source = {'version': 0}
+
+
+class Step(checkpointed_core.PipelineStep):
+
+    @classmethod
+    def supported_inputs(cls):
+        return {}
+
+    @classmethod
+    def supported_streamed_inputs(cls):
+        return {}
+
+    @classmethod
+    def get_output_storage_format(cls):
+        return 'test-pickle'
+
+    @classmethod
+    def get_arguments(cls):
+        return {}
+
+    @classmethod
+    def get_constraints(cls):
+        return []
+
+    def get_checkpoint_metadata(self):
+        return {}
+
+    def checkpoint_is_valid(self, metadata):
+        return True
+
+
+class Source(Step):
+
+    def get_checkpoint_metadata(self):
+        return {'version': source['version']}
+
+    def checkpoint_is_valid(self, metadata):
+        return metadata['version'] == source['version']
+
+    async def execute(self, **inputs):
+        calls.append('source')
+        return [1, 2, 3]
+
+
+class Double(Step):
+
+    @classmethod
+    def supported_inputs(cls):
+        return {'x': (Step,)}
+
+    async def execute(self, **inputs):
+        calls.append('double')
+        return [2 * x for x in inputs['x']]
+
+
+@pytest.fixture
+def gzip_format(monkeypatch):
+    calls.clear()
+    source['version'] = 0
+    data_format.initialise_format_registry()
+    data_format.register_format('test-pickle', PickleFormat)
+    data_format.set_compression('test-pickle', Compression('gzip'))
+    # Every gzip file is written at a later time
+    clock = iter(range(1_000_000_000, 2_000_000_000, 60))
+    monkeypatch.setattr(gzip, 'time', types.SimpleNamespace(time=lambda: next(clock)))
+    yield
+    data_format.initialise_format_registry()
+
+
+def _run(tmp_path):
+    pipeline = checkpointed_core.Pipeline('pipeline')
+    source_step = pipeline.add_source(Source)
+    double = pipeline.add_step(Double)
+    sink = pipeline.add_sink(Double, filename='output')
+    pipeline.connect(source_step, double, 'x')
+    pipeline.connect(double, sink, 'x')
+    loop = asyncio.new_event_loop()
+    try:
+        result = pipeline.build({source_step: {}, double: {}, sink: {}}).execute(
+            output_directory=str(tmp_path / 'output'),
+            checkpoint_directory=str(tmp_path / 'checkpoints'),
+            logger=logging.getLogger(__name__),
+            loop=loop,
+            _return_values={sink}
+        )
+    finally:
+        loop.close()
+    return result[sink]
+
+
+def test_gzip_checkpoints_allow_early_cutoff(tmp_path, gzip_format):
+    assert _run(tmp_path) == [4, 8, 12]
+    assert calls == ['source', 'double', 'double']
+    calls.clear()
+    # The source is recomputed, but its output is unchanged
+    source['version'] = 1
+    assert _run(tmp_path) == [4, 8, 12]
+    assert calls == ['source']
@@ -0,0 +1,86 @@
+import json
+import logging
+import os
+import pickle
+import sqlite3
+
+import checkpointed_core
+from checkpointed_core import checkpointing
+from steps import Double, Source, calls
+
+logger = logging.getLogger(__name__)
+
+
+def _pipeline(*, extra=False):
+    pipeline = checkpointed_core.Pipeline('pipeline')
+    config = {}
+    if extra:
+        # Added first, so that the identifiers of the other steps change
+        other = pipeline.add_source_sink(Source, filename='other')
+        config[other] = {'value': 5}
+    source = pipeline.add_source(Source)
+    sink = pipeline.add_sink(Double, filename='output')
+    pipeline.connect(source, sink, 'x')
+    config |= {source: {'value': 3}, sink: {}}
+    return pipeline, config
+
+
+def _run(tmp_path, loop, *, extra=False):
+    pipeline, config = _pipeline(extra=extra)
+    pipeline.build(config).execute(
+        output_directory=str(tmp_path / 'output'),
+        checkpoint_directory=str(tmp_path / 'checkpoints'),
+        logger=logger,
+        loop=loop
+    )
+
+
+def _locations(root):
+    connection = sqlite3.connect(os.path.join(root, 'manifest.sqlite'))
+    try:
+        return {location for location, in connection.execute('SELECT location FROM checkpoints')}
+    finally:
+        connection.close()
+
+
+def _convert_to_legacy_layout(root, graph):
+    # Older versions stored a pickled graph, and a metadata file and
+    # data directory for every step, named after its identifier.
+    os.makedirs(os.path.join(root, 'metadata'))
+    os.makedirs(os.path.join(root, 'data'))
+    connection = sqlite3.connect(os.path.join(root, 'manifest.sqlite'))
+    for step, location, metadata in connection.execute('SELECT step, location, metadata FROM checkpoints'):
+        os.rename(os.path.join(root, location), os.path.join(root, 'data', str(step)))
+        with open(os.path.join(root, 'metadata', f'{step}.json'), 'w') as file:
+            json.dump(json.loads(metadata), file)
+    connection.close()
+    for name in os.listdir(root):
+        if name.startswith('manifest.sqlite'):
+            os.remove(os.path.join(root, name))
+    with open(os.path.join(root, 'metadata', 'graph.pickle'), 'wb') as file:
+        pickle.dump(graph, file)
+
+
+def test_legacy_checkpoints_are_reused(tmp_path, loop):
+    _run(tmp_path, loop)
+    assert calls == ['source', 'double']
+    pipeline, config = _pipeline()
+    graph = checkpointing.CheckpointGraph(pipeline.as_graph(), config)
+    # Graphs stored by older versions identify steps by their class name only
+    graph._factories = {handle: name.rsplit('.', 1)[-1] for handle, name in graph._factories.items()}
+    del graph._fingerprints
+    _convert_to_legacy_layout(str(tmp_path / 'checkpoints' / 'pipeline'), graph)
+    calls.clear()
+    _run(tmp_path, loop)
+    assert calls == []
+
+
+def test_checkpoints_are_remapped_without_moving_data(tmp_path, loop):
+    root = str(tmp_path / 'checkpoints' / 'pipeline')
+    _run(tmp_path, loop)
+    locations = _locations(root)
+    calls.clear()
+    _run(tmp_path, loop, extra=True)
+    assert calls == ['source']
+    assert locations < _locations(root)
+    assert all(os.path.isdir(os.path.join(root, location)) for location in locations)
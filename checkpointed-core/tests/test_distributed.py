@@ -0,0 +1,85 @@
+import contextlib
+import logging
+import os
+
+import pytest
+
+import checkpointed_core
+from checkpointed_core.distributed import Coordinator, WorkerLostError
+from steps import Crash, Double, Fail, Remote
+
+
+@contextlib.contextmanager
+def local_cluster(loop, *, max_attempts=3):
+    coordinator = Coordinator(authkey=b'test', max_attempts=max_attempts)
+    executor = checkpointed_core.TaskExecutor(loop, coordinator=coordinator)
+    processes = coordinator.start_local_workers(2, preload_modules=['steps'])
+    try:
+        loop.run_until_complete(coordinator.wait_for_workers(2, timeout=30))
+        yield coordinator, executor
+    finally:
+        coordinator.shutdown()
+        executor.shutdown()
+        for process in processes:
+            process.join(5)
+
+
+def _run(pipeline, config, sinks, tmp_path, executor):
+    return pipeline.build(config).execute(
+        output_directory=str(tmp_path / 'output'),
+        checkpoint_directory=str(tmp_path / 'checkpoints'),
+        logger=logging.getLogger(__name__),
+        executor=executor,
+        _return_values=set(sinks)
+    )
+
+
+def test_steps_run_on_workers(tmp_path, loop):
+    pipeline = checkpointed_core.Pipeline('pipeline')
+    first = pipeline.add_source_sink(Remote, filename='first')
+    second = pipeline.add_source_sink(Remote, filename='second')
+    config = {first: {'marker': 'first', 'seconds': 0.5}, second: {'marker': 'second', 'seconds': 0.5}}
+    with local_cluster(loop) as (_, executor):
+        result = _run(pipeline, config, [first, second], tmp_path, executor)
+    assert result[first][0] == 'first'
+    assert result[second][0] == 'second'
+    # Both steps ran at the same time, in different workers
+    assert len({result[first][1], result[second][1], os.getpid()}) == 3
+
+
+def test_task_of_lost_worker_is_retried(tmp_path, loop):
+    pipeline = checkpointed_core.Pipeline('pipeline')
+    crash = pipeline.add_source_sink(Crash, filename='crash')
+    config = {crash: {'marker': str(tmp_path / 'crashed')}}
+    with local_cluster(loop) as (coordinator, executor):
+        result = _run(pipeline, config, [crash], tmp_path, executor)
+        assert coordinator.number_of_workers == 1
+    assert result[crash] == ['RECOVERED']
+
+
+def test_task_is_attempted_at_most_max_attempts_times(tmp_path, loop):
+    pipeline = checkpointed_core.Pipeline('pipeline')
+    crash = pipeline.add_source_sink(Crash, filename='crash')
+    with local_cluster(loop, max_attempts=2) as (coordinator, executor):
+        with pytest.raises(WorkerLostError):
+            _run(pipeline, {crash: {}}, [crash], tmp_path, executor)
+        assert coordinator.number_of_workers == 0
+
+
+def test_workers_of_failed_session_are_not_reused_early(tmp_path, loop):
+    failing = checkpointed_core.Pipeline('failing')
+    slow = [failing.add_source_sink(Remote, filename=f'slow-{i}') for i in range(2)]
+    fail = failing.add_source_sink(Fail, filename='fail')
+    config = {step: {'marker': f'SLOW-{i}', 'seconds': 1.0} for i, step in enumerate(slow)}
+    config[fail] = {'seconds': 0.3}
+    pipeline = checkpointed_core.Pipeline('pipeline')
+    fast = pipeline.add_source(Remote)
+    sink = pipeline.add_sink(Double, filename='output')
+    pipeline.connect(fast, sink, 'x')
+    with local_cluster(loop) as (_, executor):
+        # The failure cancels the slow steps, while the workers still run them
+        with pytest.raises(RuntimeError, match='step failed'):
+            _run(failing, config, [], tmp_path, executor)
+        # Replies to the cancelled tasks are not mistaken for results of this run
+        result = _run(pipeline, {fast: {'marker': 'FAST', 'seconds': 0.5}, sink: {}}, [sink], tmp_path, executor)
+    assert result[sink][0] == 'FASTFAST'
@@ -0,0 +1,74 @@
+import logging
+import os
+
+import pytest
+
+import checkpointed_core
+from checkpointed_core import manifest
+from checkpointed_core.garbage_collection import collect_garbage, parse_size
+from steps import Double, Source, calls
+
+
+def _run(tmp_path, loop, name):
+    pipeline = checkpointed_core.Pipeline(name)
+    source = pipeline.add_source(Source)
+    sink = pipeline.add_sink(Double, filename='output')
+    pipeline.connect(source, sink, 'x')
+    pipeline.build({source: {'value': 3}, sink: {}}).execute(
+        output_directory=str(tmp_path / 'output'),
+        checkpoint_directory=str(tmp_path / 'checkpoints'),
+        logger=logging.getLogger(__name__),
+        loop=loop
+    )
+
+
+def test_checkpoints_beyond_quota_are_removed(tmp_path, loop):
+    _run(tmp_path, loop, 'first')
+    _run(tmp_path, loop, 'second')
+    report = collect_garbage(str(tmp_path / 'checkpoints'), quota=0,
+                             protected=[str(tmp_path / 'checkpoints' / 'second')])
+    assert report.removed_stores == [str(tmp_path / 'checkpoints' / 'first')]
+    assert {checkpoint.step for checkpoint in report.removed} == {0, 1}
+    assert sorted(os.listdir(tmp_path / 'checkpoints')) == ['second']
+    calls.clear()
+    _run(tmp_path, loop, 'second')
+    assert calls == []
+
+
+def test_unindexed_data_is_removed(tmp_path, loop):
+    _run(tmp_path, loop, 'first')
+    stray = tmp_path / 'checkpoints' / 'first' / 'store' / '00' / 'stray'
+    stray.mkdir(parents=True)
+    (stray / 'data').write_bytes(b'x' * 10)
+    report = collect_garbage(str(tmp_path / 'checkpoints'))
+    assert [(checkpoint.step, checkpoint.size) for checkpoint in report.removed] == [(None, 10)]
+    assert not stray.exists()
+    calls.clear()
+    _run(tmp_path, loop, 'first')
+    assert calls == []
+
+
+def test_dry_run_removes_nothing(tmp_path, loop):
+    _run(tmp_path, loop, 'first')
+    report = collect_garbage(str(tmp_path / 'checkpoints'), quota=0, dry_run=True)
+    assert len(report.removed) == 2
+    calls.clear()
+    _run(tmp_path, loop, 'first')
+    assert calls == []
+
+
+def test_pipelines_without_checkpoints_are_kept(tmp_path):
+    directory = tmp_path / 'checkpoints' / 'empty'
+    directory.mkdir(parents=True)
+    manifest.Manifest(str(directory / manifest.MANIFEST_FILENAME)).close()
+    report = collect_garbage(str(tmp_path / 'checkpoints'), quota=0)
+    assert report.removed_stores == []
+    assert directory.exists()
+
+
+def test_sizes_are_parsed_with_units():
+    assert parse_size('500') == 500
+    assert parse_size('2K') == 2048
+    assert parse_size('1.5GB') == 3 << 29
+    with pytest.raises(ValueError):
+        parse_size('lots')
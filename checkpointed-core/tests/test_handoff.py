@@ -0,0 +1,70 @@
+import logging
+
+import pytest
+
+import checkpointed_core
+from checkpointed_core.handoff import HandoffCache
+from steps import Double, PickleFormat, Source
+
+logger = logging.getLogger(__name__)
+
+
+def test_values_are_kept_until_all_consumers_retrieved_them():
+    cache = HandoffCache(None, logger)
+    value = [1, 2, 3]
+    cache.put('step', value, consumers=2)
+    # Values are handed out as-is
+    assert cache.get('step') == (True, value)
+    assert cache.get('step')[1] is value
+    assert cache.get('step') == (False, None)
+    assert cache.memory_in_use == 0
+
+
+def test_values_without_consumers_are_not_kept():
+    cache = HandoffCache(None, logger)
+    cache.put('step', [1], consumers=0)
+    assert 'step' not in cache
+
+
+def test_oldest_values_are_evicted_beyond_memory_limit():
+    cache = HandoffCache(1000, logger)
+    cache.put('first', b'x' * 500, consumers=1)
+    cache.put('second', b'x' * 500, consumers=1)
+    assert 'first' not in cache
+    assert 'second' in cache
+    # Values exceeding the limit are never kept
+    cache.put('large', b'x' * 2000, consumers=1)
+    assert 'large' not in cache
+    assert cache.memory_in_use <= 1000
+
+
+def test_arrays_are_handed_out_as_read_only_views():
+    numpy = pytest.importorskip('numpy')
+    cache = HandoffCache(None, logger)
+    array = numpy.zeros(4)
+    cache.put('step', array, consumers=1)
+    _, view = cache.get('step')
+    assert not view.flags.writeable
+    assert array.flags.writeable
+
+
+def test_consumers_receive_results_without_loading_checkpoints(tmp_path, loop, monkeypatch):
+    loads = []
+    load = PickleFormat.load
+    monkeypatch.setattr(PickleFormat, 'load', staticmethod(lambda path: loads.append(path) or load(path)))
+    pipeline = checkpointed_core.Pipeline('pipeline')
+    source = pipeline.add_source(Source)
+    first = pipeline.add_step(Double)
+    second = pipeline.add_sink(Double, filename='output')
+    pipeline.connect(source, first, 'x')
+    pipeline.connect(first, second, 'x')
+    result = pipeline.build({source: {'value': 3}, first: {}, second: {}}).execute(
+        output_directory=str(tmp_path / 'output'),
+        checkpoint_directory=str(tmp_path / 'checkpoints'),
+        logger=logger,
+        loop=loop,
+        _return_values={second}
+    )
+    assert result[second] == [0, 4, 8]
+    # Only the returned value is loaded
+    assert len(loads) == 1
@@ -0,0 +1,61 @@
+import logging
+
+import pytest
+
+import checkpointed_core
+from checkpointed_core import partitioning
+from steps import Double, PartitionedDouble, Source, calls, fail_on
+
+
+def test_inputs_are_split_into_balanced_partitions():
+    shards = partitioning.split_inputs({'x': list(range(5)), 'y': 'shared'}, {'x'}, 2)
+    assert shards == [{'x': [0, 1, 2], 'y': 'shared'}, {'x': [3, 4], 'y': 'shared'}]
+
+
+def test_partitioned_inputs_keep_their_partitions():
+    value = partitioning.Partitions([[0], [1, 2]])
+    shards = partitioning.split_inputs({'x': value}, {'x'}, 4)
+    assert [shard['x'] for shard in shards] == [[0], [1, 2]]
+    assert partitioning.concatenate(value) == [0, 1, 2]
+
+
+def test_partition_digests_depend_on_key_and_index():
+    digests = partitioning.compute_digests('key', 2)
+    assert digests == partitioning.compute_digests('key', 2)
+    assert digests[0] != digests[1]
+    assert set(digests).isdisjoint(partitioning.compute_digests('other', 2))
+    assert set(digests).isdisjoint(partitioning.compute_digests('key', 3))
+    assert partitioning.compute_digests(None, 2) == [None, None]
+
+
+def test_only_failed_partitions_are_recomputed(tmp_path, loop):
+    pipeline = checkpointed_core.Pipeline('pipeline')
+    source = pipeline.add_source(Source)
+    partitioned = pipeline.add_step(PartitionedDouble)
+    sink = pipeline.add_sink(Double, filename='output')
+    pipeline.connect(source, partitioned, 'x')
+    pipeline.connect(partitioned, sink, 'x')
+    config = {source: {'value': 8}, partitioned: {}, sink: {}}
+    executor = checkpointed_core.TaskExecutor(loop, partitions=4)
+
+    def run():
+        return pipeline.build(config).execute(
+            output_directory=str(tmp_path / 'output'),
+            checkpoint_directory=str(tmp_path / 'checkpoints'),
+            logger=logging.getLogger(__name__),
+            executor=executor,
+            _return_values={sink}
+        )
+
+    try:
+        fail_on.add(5)
+        with pytest.raises(RuntimeError, match='step failed'):
+            run()
+        assert sorted(calls) == ['partition-0', 'partition-2', 'partition-4', 'partition-6', 'source']
+        fail_on.clear()
+        calls.clear()
+        result = run()
+    finally:
+        executor.shutdown()
+    assert calls == ['partition-4', 'double']
+    assert result[sink] == [4 * x for x in range(8)]
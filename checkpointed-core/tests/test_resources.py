@@ -0,0 +1,88 @@
+import asyncio
+import logging
+
+import pytest
+
+import checkpointed_core
+from checkpointed_core.resources import ResourceManager
+from steps import Double, Source
+
+# Number of `Budgeted` steps running, and the maximum seen
+running = {'now': 0, 'max': 0}
+
+
+class Budgeted(Double):
+
+    @classmethod
+    def get_resource_requirements(cls):
+        return {'cores': 1, 'memory': 3}
+
+    async def execute(self, **inputs):
+        running['now'] += 1
+        running['max'] = max(running['max'], running['now'])
+        await asyncio.sleep(0.05)
+        running['now'] -= 1
+        return await super().execute(**inputs)
+
+
+def test_resources_are_limited_by_budget():
+    manager = ResourceManager({'cores': 2})
+    manager.acquire({'cores': 1, 'gpu': 5})
+    assert manager.can_acquire({'cores': 1})
+    manager.acquire({'cores': 1})
+    assert not manager.can_acquire({'cores': 1})
+    manager.release({'cores': 1})
+    assert manager.in_use == {'cores': 1, 'gpu': 5}
+    with pytest.raises(RuntimeError):
+        manager.release({'cores': 2})
+
+
+def test_requirements_beyond_budget_are_admitted_alone():
+    manager = ResourceManager({'memory': 2})
+    assert manager.can_acquire({'memory': 3})
+    manager.acquire({'memory': 1})
+    assert not manager.can_acquire({'memory': 3})
+
+
+def test_waiters_are_woken_when_resources_are_released(loop):
+    manager = ResourceManager({'cores': 1})
+    manager.acquire({'cores': 1})
+
+    async def wait():
+        waiter = asyncio.ensure_future(manager.wait_for_release())
+        await asyncio.sleep(0)
+        assert not waiter.done()
+        manager.release({'cores': 1})
+        await asyncio.wait_for(waiter, 1)
+
+    loop.run_until_complete(wait())
+
+
+@pytest.mark.parametrize('budget, expected', [
+    ({'cores': 2}, 2),
+    ({'memory': 7}, 2),
+    ({'memory': 2}, 1),
+    (None, 4),
+])
+def test_concurrent_steps_are_limited_by_budget(tmp_path, loop, budget, expected):
+    running.update(now=0, max=0)
+    pipeline = checkpointed_core.Pipeline('pipeline')
+    source = pipeline.add_source(Source)
+    sinks = [pipeline.add_sink(Budgeted, filename=f'output-{i}') for i in range(4)]
+    for sink in sinks:
+        pipeline.connect(source, sink, 'x')
+    # Distinct configurations, so that the steps do not share their results
+    config = {step: {'value': i} for i, step in enumerate(sinks)}
+    config[source] = {'value': 2}
+    executor = checkpointed_core.TaskExecutor(loop, max_workers=4, resources=budget)
+    try:
+        pipeline.build(config).execute(
+            output_directory=str(tmp_path / 'output'),
+            checkpoint_directory=str(tmp_path / 'checkpoints'),
+            logger=logging.getLogger(__name__),
+            executor=executor
+        )
+    finally:
+        executor.shutdown()
+    assert running['max'] == expected
+    assert executor.resource_manager.in_use == {}
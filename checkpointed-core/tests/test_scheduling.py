@@ -0,0 +1,65 @@
+import json
+import logging
+
+import checkpointed_core
+from checkpointed_core import fileutils, scheduling
+from steps import Double, Source, calls
+
+
+class Chain(Double):
+
+    @classmethod
+    def get_resource_requirements(cls):
+        return {'cores': 1}
+
+    async def execute(self, **inputs):
+        calls.append('chain')
+        return inputs['x']
+
+
+class Plot(Chain):
+
+    async def execute(self, **inputs):
+        calls.append('plot')
+        return inputs['x']
+
+
+def test_unknown_costs_are_estimated_from_known_ones():
+    durations = {scheduling.get_factory_key(Chain): 1.0, scheduling.get_factory_key(Plot): 3.0}
+    assert scheduling.estimate_costs([Chain, Plot, Source], durations) == [1.0, 3.0, 2.0]
+    assert scheduling.estimate_costs([Chain, Plot], {}) == [1.0, 1.0]
+
+
+def test_steps_on_the_critical_path_run_first(tmp_path, loop, monkeypatch):
+    writes = []
+    write = fileutils.write_json_atomically
+    monkeypatch.setattr(fileutils, 'write_json_atomically',
+                        lambda filename, data: writes.append(filename) or write(filename, data))
+    pipeline = checkpointed_core.Pipeline('pipeline')
+    source = pipeline.add_source(Source)
+    plots = [pipeline.add_sink(Plot, filename=f'plot-{i}') for i in range(3)]
+    for plot in plots:
+        pipeline.connect(source, plot, 'x')
+    chain = [pipeline.add_step(Chain), pipeline.add_step(Chain), pipeline.add_sink(Chain, filename='chain')]
+    for previous, step in zip([source] + chain, chain):
+        pipeline.connect(previous, step, 'x')
+    config = {step: {'value': i} for i, step in enumerate([source] + plots + chain)}
+    executor = checkpointed_core.TaskExecutor(loop, max_workers=4, resources={'cores': 1})
+    try:
+        pipeline.build(config).execute(
+            output_directory=str(tmp_path / 'output'),
+            checkpoint_directory=str(tmp_path / 'checkpoints'),
+            logger=logging.getLogger(__name__),
+            executor=executor
+        )
+    finally:
+        executor.shutdown()
+    # The last step of the chain is no longer on the critical path
+    assert calls[:3] == ['source', 'chain', 'chain']
+    assert sorted(calls[3:]) == ['chain'] + ['plot'] * 3
+    # Durations are saved once, when the run ends
+    statistics = str(tmp_path / 'checkpoints' / 'pipeline' / 'statistics.json')
+    assert writes.count(statistics) == 1
+    with open(statistics) as file:
+        durations = json.load(file)['durations']
+    assert scheduling.get_factory_key(Chain) in durations
@@ -0,0 +1,40 @@
+import logging
+
+import checkpointed_core
+from steps import Double, Source, calls
+
+
+def _run(tmp_path, loop, name, *, value=3, length=1):
+    pipeline = checkpointed_core.Pipeline(name)
+    source = pipeline.add_source(Source)
+    config = {source: {'value': value}}
+    previous = source
+    for i in range(length):
+        step = pipeline.add_sink(Double, filename='output') if i == length - 1 else pipeline.add_step(Double)
+        pipeline.connect(previous, step, 'x')
+        config[step] = {}
+        previous = step
+    result = pipeline.build(config).execute(
+        output_directory=str(tmp_path / 'output'),
+        checkpoint_directory=str(tmp_path / 'checkpoints'),
+        cache_directory=str(tmp_path / 'cache'),
+        logger=logging.getLogger(__name__),
+        loop=loop,
+        _return_values={previous}
+    )
+    return result[previous]
+
+
+def test_results_are_shared_between_pipelines(tmp_path, loop):
+    assert _run(tmp_path, loop, 'first') == [0, 2, 4]
+    calls.clear()
+    # Only the step not computed by the first pipeline runs
+    assert _run(tmp_path, loop, 'second', length=2) == [0, 4, 8]
+    assert calls == ['double']
+
+
+def test_results_are_not_shared_between_configurations(tmp_path, loop):
+    _run(tmp_path, loop, 'first')
+    calls.clear()
+    assert _run(tmp_path, loop, 'second', value=4) == [0, 2, 4, 6]
+    assert calls == ['source', 'double']
@@ -0,0 +1,45 @@
+import threading
+
+from checkpointed_core import storage
+
+
+class BlockingObjectStore(storage.InMemoryObjectStore):
+    """Uploads parts only once `released` is set."""
+
+    def __init__(self):
+        super().__init__()
+        self.released = threading.Event()
+
+    def upload_part(self, **kwargs):
+        self.released.wait(10)
+        return super().upload_part(**kwargs)
+
+
+def test_objects_are_uploaded_in_parts():
+    client = storage.InMemoryObjectStore()
+    backend = storage.ObjectStoreBackend(client, 'bucket', part_size=4)
+    backend.put('key', b'0123456789')
+    assert backend.get('key') == b'0123456789'
+    backend.close()
+
+
+def test_parts_in_flight_are_bounded():
+    client = BlockingObjectStore()
+    backend = storage.ObjectStoreBackend(client, 'bucket', part_size=4, max_concurrency=2)
+    written = []
+
+    def write():
+        with backend.open_write('key') as file:
+            for i in range(10):
+                file.write(b'%04d' % i)
+                written.append(i)
+
+    thread = threading.Thread(target=write)
+    thread.start()
+    thread.join(0.5)
+    # Writing blocks while two parts are being uploaded
+    assert len(written) == 2
+    client.released.set()
+    thread.join(10)
+    assert backend.get('key') == b''.join(b'%04d' % i for i in range(10))
+    backend.close()
@@ -0,0 +1,115 @@
+import asyncio
+import logging
+
+import pytest
+
+import checkpointed_core
+from checkpointed_core import streaming
+from steps import Step, calls
+
+
+class StreamedSource(Step):
+
+    @classmethod
+    def supports_streamed_output(cls):
+        return True
+
+    async def execute(self, **inputs):
+        return list(range(self.config.get('params.value')))
+
+    async def execute_streamed(self, **inputs):
+        value = self.config.get('params.value')
+        for start in range(0, value, 10):
+            calls.append(f'produce-{start}')
+            await asyncio.sleep(0)
+            yield list(range(start, min(value, start + 10)))
+
+
+class StreamedSum(Step):
+
+    @classmethod
+    def supported_inputs(cls):
+        return {'x': (Step,)}
+
+    @classmethod
+    def supported_streamed_inputs(cls):
+        return {'x': (Step,)}
+
+    async def execute(self, **inputs):
+        total = 0
+        async for batch in streaming.batches(inputs['x']):
+            calls.append(f'consume-{batch[0]}')
+            if self.config.get('params.marker') == 'fail':
+                raise RuntimeError('step failed')
+            total += sum(batch)
+        return [total]
+
+
+def test_full_channel_suspends_producer(loop):
+    async def produce():
+        channel = streaming.Channel(1)
+        await channel.put([1])
+        blocked = asyncio.ensure_future(channel.put([2]))
+        await asyncio.sleep(0)
+        assert not blocked.done()
+        assert await channel.__anext__() == [1]
+        await blocked
+        assert await channel.__anext__() == [2]
+        await channel.close()
+        return [batch async for batch in channel]
+
+    assert loop.run_until_complete(produce()) == []
+
+
+def test_failed_channel_raises_in_consumer(loop):
+    async def consume():
+        channel = streaming.Channel(2)
+        await channel.put([1])
+        channel.fail(RuntimeError('producer failed'))
+        return [batch async for batch in channel]
+
+    with pytest.raises(RuntimeError, match='producer failed'):
+        loop.run_until_complete(consume())
+
+
+def test_materialised_inputs_are_split_into_batches(loop):
+    async def iterate():
+        return [batch async for batch in streaming.batches(list(range(5)), batch_size=2)]
+
+    assert loop.run_until_complete(iterate()) == [[0, 1], [2, 3], [4]]
+    assert loop.run_until_complete(streaming.collect([1, 2])) == [1, 2]
+
+
+def _run(tmp_path, loop, *, marker=''):
+    pipeline = checkpointed_core.Pipeline('pipeline')
+    source = pipeline.add_source(StreamedSource)
+    sink = pipeline.add_sink(StreamedSum, filename='output')
+    pipeline.connect(source, sink, 'x', streaming=True)
+    executor = checkpointed_core.TaskExecutor(loop, stream_buffer_size=1)
+    try:
+        return sink, pipeline.build({source: {'value': 50}, sink: {'marker': marker}}).execute(
+            output_directory=str(tmp_path / 'output'),
+            checkpoint_directory=str(tmp_path / 'checkpoints'),
+            logger=logging.getLogger(__name__),
+            executor=executor,
+            _return_values={sink}
+        )
+    finally:
+        executor.shutdown()
+
+
+def test_batches_are_consumed_while_produced(tmp_path, loop):
+    sink, result = _run(tmp_path, loop)
+    assert result[sink] == [sum(range(50))]
+    # The producer is at most a few batches ahead of the consumer
+    assert calls.index('consume-0') < calls.index('produce-40')
+    calls.clear()
+    sink, result = _run(tmp_path, loop)
+    assert calls == []
+    assert result[sink] == [sum(range(50))]
+
+
+def test_failing_consumer_stops_producer(tmp_path, loop):
+    with pytest.raises(RuntimeError, match='step failed'):
+        _run(tmp_path, loop, marker='fail')
+    assert 'produce-40' not in calls
@@ -0,0 +1,47 @@
+import logging
+
+import pytest
+
+import checkpointed_core
+from steps import Double, Source, calls
+
+
+def _run(tmp_path, loop, targets=None):
+    pipeline = checkpointed_core.Pipeline('pipeline')
+    source = pipeline.add_source(Source)
+    left = pipeline.add_sink(Double, filename='left', name='left')
+    middle = pipeline.add_step(Double)
+    right = pipeline.add_sink(Double, filename='right', name='right')
+    pipeline.connect(source, left, 'x')
+    pipeline.connect(source, middle, 'x')
+    pipeline.connect(middle, right, 'x')
+    calls.clear()
+    pipeline.build({source: {'value': 3}, left: {}, middle: {}, right: {}}).execute(
+        output_directory=str(tmp_path / 'output'),
+        checkpoint_directory=str(tmp_path / 'checkpoints'),
+        logger=logging.getLogger(__name__),
+        loop=loop,
+        targets=targets
+    )
+
+
+def test_only_targets_and_their_dependencies_run(tmp_path, loop):
+    _run(tmp_path, loop, targets=['left'])
+    assert calls == ['source', 'double']
+    assert (tmp_path / 'output' / 'pipeline' / 'left').exists()
+    assert not (tmp_path / 'output' / 'pipeline' / 'right').exists()
+    _run(tmp_path, loop)
+    assert calls == ['double', 'double']
+
+
+def test_checkpoints_outside_targets_are_kept(tmp_path, loop):
+    _run(tmp_path, loop)
+    _run(tmp_path, loop, targets=['right'])
+    assert calls == []
+    _run(tmp_path, loop)
+    assert calls == []
+
+
+def test_unknown_targets_are_rejected(tmp_path, loop):
+    with pytest.raises(ValueError):
+        _run(tmp_path, loop, targets=['missing'])
@@ -0,0 +1,70 @@
+import logging
+import os
+import shutil
+
+import checkpointed_core
+from checkpointed_core import tiering
+from steps import Double, PickleFormat, Source
+
+logger = logging.getLogger(__name__)
+
+
+def _add_copy(tier, location, size, *, promoted=True):
+    os.makedirs(tier.prepare(location))
+    tier.add(location, location, size, placement=tiering.CACHE, promoted=promoted)
+
+
+def test_least_recently_used_copies_are_evicted(tmp_path):
+    tier = tiering.HotTier(str(tmp_path), quota=100)
+    _add_copy(tier, 'store/00/first', 60)
+    os.utime(str(tmp_path / 'store/00/first.json'), (0, 0))
+    _add_copy(tier, 'store/00/second', 60)
+    assert tier.lookup('store/00/first', 'store/00/first') is None
+    assert tier.lookup('store/00/second', 'store/00/second') is not None
+
+
+def test_copies_are_not_evicted_before_promotion(tmp_path):
+    tier = tiering.HotTier(str(tmp_path), quota=100)
+    _add_copy(tier, 'store/00/first', 60, promoted=False)
+    _add_copy(tier, 'store/00/second', 60, promoted=False)
+    assert tier.lookup('store/00/first', 'store/00/first') is not None
+    tier.mark_promoted('store/00/first')
+    assert tier.lookup('store/00/first', 'store/00/first') is None
+
+
+def test_copies_are_not_evicted_while_read(tmp_path):
+    tier = tiering.HotTier(str(tmp_path), quota=100)
+    _add_copy(tier, 'store/00/first', 60)
+    os.utime(str(tmp_path / 'store/00/first.json'), (0, 0))
+    with tier.pinned('store/00/first'):
+        _add_copy(tier, 'store/00/second', 60)
+    # The more recently used copy is evicted instead
+    assert tier.lookup('store/00/first', 'store/00/first') is not None
+    assert tier.lookup('store/00/second', 'store/00/second') is None
+
+
+def test_checkpoint_is_loaded_if_copy_is_evicted_while_read(tmp_path, loop, monkeypatch):
+    hot_directory = str(tmp_path / 'hot')
+    pipeline = checkpointed_core.Pipeline('pipeline')
+    source = pipeline.add_source(Source)
+    sink = pipeline.add_sink(Double, filename='output')
+    pipeline.connect(source, sink, 'x')
+    config = {source: {'value': 3}, sink: {}}
+    load = PickleFormat.load
+
+    def evicting_load(path):
+        # Simulates eviction by another process
+        if path.startswith(hot_directory):
+            shutil.rmtree(path)
+        return load(path)
+
+    monkeypatch.setattr(PickleFormat, 'load', staticmethod(evicting_load))
+    result = pipeline.build(config).execute(
+        output_directory=str(tmp_path / 'output'),
+        checkpoint_directory=str(tmp_path / 'checkpoints'),
+        hot_directory=hot_directory,
+        logger=logger,
+        loop=loop,
+        _return_values={sink}
+    )
+    assert result[sink] == [0, 2, 4]
@@ -68,12 +68,12 @@ class JsonFormat(DataFormat):
 
     @staticmethod
     def store(path: str, data: typing.Any):
-        with open(os.path.join(path, 'main.json'), 'w') as f:
+        with data_format.open_file(os.path.join(path, 'main.json'), 'w') as f:
             json.dump(data, f)
 
     @staticmethod
     def load(path: str) -> typing.Any:
-        with open(os.path.join(path, 'main.json'), 'r') as f:
+        with data_format.open_file(os.path.join(path, 'main.json'), 'r') as f:
             return json.load(f)
 
 
@@ -81,26 +81,47 @@ class PickleFormat(DataFormat):
 
     @staticmethod
     def store(path: str, data: typing.Any):
-        with open(os.path.join(path, 'main.pickle'), 'wb') as f:
-            pickle.dump(data, f)
+        with data_format.open_file(os.path.join(path, 'main.pickle'), 'wb') as f:
+            pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
 
     @staticmethod
     def load(path: str) -> typing.Any:
-        with open(os.path.join(path, 'main.pickle'), 'rb') as f:
+        if data_format.file_exists(os.path.join(path, 'stream.pickle')):
+            return [item for batch in PickleFormat.load_stream(path) for item in batch]
+        with data_format.open_file(os.path.join(path, 'main.pickle'), 'rb') as f:
             return pickle.load(f)
 
+    @staticmethod
+    def store_stream(path: str, batches: typing.Iterable[list]):
+        # Streams are stored as a sequence of pickled batches
+        with data_format.open_file(os.path.join(path, 'stream.pickle'), 'wb') as f:
+            for batch in batches:
+                pickle.dump(batch, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    @staticmethod
+    def load_stream(path: str) -> typing.Iterator[list]:
+        if not data_format.file_exists(os.path.join(path, 'stream.pickle')):
+            yield PickleFormat.load(path)
+            return
+        with data_format.open_file(os.path.join(path, 'stream.pickle'), 'rb') as f:
+            while True:
+                try:
+                    yield pickle.load(f)
+                except EOFError:
+                    return
+
 
 class TextFormat(DataFormat):
 
     @staticmethod
     def store(path: str, data: typing.Any):
         assert isinstance(data, str)
-        with open(os.path.join(path, 'main.txt'), 'w') as f:
+        with data_format.open_file(os.path.join(path, 'main.txt'), 'w') as f:
             f.write(data)
 
     @staticmethod
     def load(path: str) -> typing.Any:
-        with open(os.path.join(path, 'main.txt'), 'r') as f:
+        with data_format.open_file(os.path.join(path, 'main.txt'), 'r') as f:
             return f.read()
 
 
@@ -109,12 +130,12 @@ class BinaryFormat(DataFormat):
     @staticmethod
     def store(path: str, data: typing.Any):
         assert isinstance(data, (bytes, bytearray))
-        with open(os.path.join(path, 'main.bin'), 'wb') as f:
+        with data_format.open_file(os.path.join(path, 'main.bin'), 'wb') as f:
             f.write(data)
 
     @staticmethod
     def load(path: str) -> typing.Any:
-        with open(os.path.join(path, 'main.bin'), 'rb') as f:
+        with data_format.open_file(os.path.join(path, 'main.bin'), 'rb') as f:
             return f.read()
 
 
@@ -122,11 +143,14 @@ class NumpyFormat(DataFormat):
 
     @staticmethod
     def store(path: str, data: typing.Any):
-        numpy.save(os.path.join(path, 'main.npy'), data)
+        # Equivalent to numpy.save, but sequential, so that the file can be compressed
+        with data_format.open_file(os.path.join(path, 'main.npy'), 'wb') as f:
+            numpy.lib.format.write_array(f, numpy.asanyarray(data))
 
     @staticmethod
     def load(path: str) -> typing.Any:
-        return numpy.load(os.path.join(path, 'main.npy'))
+        with data_format.open_file(os.path.join(path, 'main.npy'), 'rb') as f:
+            return numpy.lib.format.read_array(f)
 
 
 class GensimWord2VecFormat(DataFormat):
@@ -202,11 +226,13 @@ class PandasPickleFormat(DataFormat):
 
     @staticmethod
     def store(path: str, data: typing.Any):
-        data.to_pickle(os.path.join(path, 'main.pickle'))
+        with data_format.open_file(os.path.join(path, 'main.pickle'), 'wb') as f:
+            data.to_pickle(f)
 
     @staticmethod
     def load(path: str) -> typing.Any:
-        return pandas.read_pickle(os.path.join(path, 'main.pickle'))
+        with data_format.open_file(os.path.join(path, 'main.pickle'), 'rb') as f:
+            return pandas.read_pickle(f)
 
 
 class ScipySparseFormat(DataFormat):
@@ -1,8 +1,11 @@
 import abc
+import functools
 import hashlib
+import os
 import typing
 
 import checkpointed_core
+from checkpointed_core import fileutils
 from checkpointed_core.parameters.constraints import Constraint
 from checkpointed_core.parameters.arguments import Argument, StringArgument
 
@@ -33,10 +36,49 @@ class GenericFileLoader(checkpointed_core.PipelineStep, bases.DataLoader, abc.AB
     def get_constraints(cls) -> list[Constraint]:
         return []
 
+    @classmethod
+    def get_resource_requirements(cls) -> dict[str, float]:
+        return {'disk': 1}
+
     def get_checkpoint_metadata(self) -> typing.Any:
-        with open(self.config.get('params.filename'), 'rb') as file:
-            return {'file_hash': hashlib.sha256(file.read()).hexdigest()}
+        signature, digest = _get_file_digest(self.config.get('params.filename'))
+        return {'file_hash': digest, 'hash_algorithm': _HASH_ALGORITHM, 'file_signature': signature}
 
     def checkpoint_is_valid(self, metadata: typing.Any) -> bool:
-        with open(self.config.get('params.filename'), 'rb') as file:
-            return metadata['file_hash'] == hashlib.sha256(file.read()).hexdigest()
+        filename = self.config.get('params.filename')
+        # Metadata stored by older versions holds the SHA-256 digest of the file
+        if 'hash_algorithm' not in metadata:
+            digest = hashlib.sha256()
+            with open(filename, 'rb') as file:
+                while chunk := file.read(1 << 20):
+                    digest.update(chunk)
+            return metadata['file_hash'] == digest.hexdigest()
+        if metadata['hash_algorithm'] != _HASH_ALGORITHM:
+            return False
+        # The file is only hashed if it may have changed
+        if fileutils.stat_signature(filename) == metadata.get('file_signature'):
+            return True
+        _, digest = _get_file_digest(filename)
+        return metadata['file_hash'] == digest
+
+    def get_checkpoint_dependencies(self) -> list[str] | None:
+        return [self.config.get('params.filename')]
+
+
+_HASH_ALGORITHM = 'sha256-chunked'
+
+
+def _get_file_digest(filename: str) -> tuple[list[int], str]:
+    """Return the stat signature and digest of a file."""
+    path = os.path.abspath(filename)
+    signature = fileutils.stat_signature(path)
+    if signature is None:
+        raise FileNotFoundError(path)
+    return signature, _compute_file_digest(path, tuple(signature))
+
+
+# Files are hashed once when they are both validated and loaded in the
+# same process; the signature is part of the key, so changed files are hashed again.
+@functools.lru_cache(maxsize=64)
+def _compute_file_digest(path: str, signature: tuple[int, ...]) -> str:
+    return fileutils.file_digest(path)
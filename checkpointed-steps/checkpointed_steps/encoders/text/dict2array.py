@@ -49,6 +49,9 @@ class DictToSparseArray(checkpointed_core.PipelineStep, bases.DocumentSparseVect
     def checkpoint_is_valid(self, metadata: typing.Any) -> bool:
         return True
 
+    def get_checkpoint_dependencies(self) -> list[str] | None:
+        return []
+
     @classmethod
     def get_arguments(cls) -> dict[str, arguments.Argument]:
         return {}
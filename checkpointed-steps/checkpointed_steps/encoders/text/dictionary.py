@@ -36,6 +36,9 @@ class GenerateWordToIndexDictionary(checkpointed_core.PipelineStep, bases.WordIn
     def checkpoint_is_valid(self, metadata: typing.Any) -> bool:
         return True
 
+    def get_checkpoint_dependencies(self) -> list[str] | None:
+        return []
+
     @classmethod
     def get_arguments(cls) -> dict[str, arguments.Argument]:
         return {}
@@ -47,6 +47,14 @@ class HuggingFaceDocumentEncoder(checkpointed_core.PipelineStep, bases.DocumentV
         sentence_embeddings = F.normalize(sentence_embeddings, p=2, dim=1)
         return model(inputs['documents'])
 
+    @classmethod
+    def get_execution_mode(cls) -> str | None:
+        return 'thread'
+
+    @classmethod
+    def get_resource_requirements(cls) -> dict[str, float]:
+        return {'cores': 1, 'model': 1}
+
     @classmethod
     def get_output_storage_format(cls) -> str:
         return 'numpy-array'
@@ -57,6 +65,9 @@ class HuggingFaceDocumentEncoder(checkpointed_core.PipelineStep, bases.DocumentV
     def checkpoint_is_valid(self, metadata: typing.Any) -> bool:
         return True
 
+    def get_checkpoint_dependencies(self) -> list[str] | None:
+        return []
+
     @classmethod
     def get_arguments(cls) -> dict[str, arguments.Argument]:
         return {
@@ -26,6 +26,14 @@ class SentenceTransformersDocumentEncoder(checkpointed_core.PipelineStep, bases.
         )
         return model.encode(inputs['documents'], convert_to_tensor=True, show_progress_bar=True)
 
+    @classmethod
+    def get_execution_mode(cls) -> str | None:
+        return 'thread'
+
+    @classmethod
+    def get_resource_requirements(cls) -> dict[str, float]:
+        return {'cores': 1, 'model': 1}
+
     @classmethod
     def get_output_storage_format(cls) -> str:
         return 'numpy-array'
@@ -36,6 +44,9 @@ class SentenceTransformersDocumentEncoder(checkpointed_core.PipelineStep, bases.
     def checkpoint_is_valid(self, metadata: typing.Any) -> bool:
         return True
 
+    def get_checkpoint_dependencies(self) -> list[str] | None:
+        return []
+
     @classmethod
     def get_arguments(cls) -> dict[str, arguments.Argument]:
         return {
@@ -57,6 +57,14 @@ class TFIDF(checkpointed_core.PipelineStep, bases.DocumentDictEncoder):
             result.append(document_result)
         return result
 
+    @classmethod
+    def get_execution_mode(cls) -> str | None:
+        return 'process'
+
+    @classmethod
+    def get_resource_requirements(cls) -> dict[str, float]:
+        return {'cores': 1}
+
     @classmethod
     def get_output_storage_format(cls) -> str:
         return 'std-pickle'
@@ -67,6 +75,9 @@ class TFIDF(checkpointed_core.PipelineStep, bases.DocumentDictEncoder):
     def checkpoint_is_valid(self, metadata: typing.Any) -> bool:
         return True
 
+    def get_checkpoint_dependencies(self) -> list[str] | None:
+        return []
+
     @classmethod
     def get_arguments(cls) -> dict[str, arguments.Argument]:
         return {
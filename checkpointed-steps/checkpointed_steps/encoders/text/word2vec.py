@@ -82,3 +82,6 @@ class Word2VecEncoder(checkpointed_core.PipelineStep, bases.WordVectorEncoder):
 
     def checkpoint_is_valid(self, metadata: typing.Any) -> bool:
         return True
+
+    def get_checkpoint_dependencies(self) -> list[str] | None:
+        return []
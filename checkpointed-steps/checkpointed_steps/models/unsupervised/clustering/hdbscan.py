@@ -33,6 +33,14 @@ class HDBSCAN(checkpointed_core.PipelineStep, bases.LabelAssignment):
         clustered = model.fit(inputs['data'])
         return clustered.labels_    # Ignore IDE warnings
 
+    @classmethod
+    def get_execution_mode(cls) -> str | None:
+        return 'process'
+
+    @classmethod
+    def get_resource_requirements(cls) -> dict[str, float]:
+        return {'cores': 1, 'model': 1}
+
     @classmethod
     def get_output_storage_format(cls) -> str:
         return 'numpy-array'
@@ -43,6 +51,9 @@ class HDBSCAN(checkpointed_core.PipelineStep, bases.LabelAssignment):
     def checkpoint_is_valid(self, metadata: typing.Any) -> bool:
         return True
 
+    def get_checkpoint_dependencies(self) -> list[str] | None:
+        return []
+
     @classmethod
     def get_arguments(cls) -> dict[str, arguments.Argument]:
         return {
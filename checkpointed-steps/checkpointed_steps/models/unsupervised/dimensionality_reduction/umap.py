@@ -32,6 +32,14 @@ class UMAPTraining(checkpointed_core.PipelineStep):
         )
         return model.fit(inputs['data'])
 
+    @classmethod
+    def get_execution_mode(cls) -> str | None:
+        return 'process'
+
+    @classmethod
+    def get_resource_requirements(cls) -> dict[str, float]:
+        return {'cores': 1, 'model': 1}
+
     @classmethod
     def get_output_storage_format(cls) -> str:
         return 'std-pickle'
@@ -42,6 +50,9 @@ class UMAPTraining(checkpointed_core.PipelineStep):
     def checkpoint_is_valid(self, metadata: typing.Any) -> bool:
         return metadata['seed'] != -1
 
+    def get_checkpoint_dependencies(self) -> list[str] | None:
+        return []
+
     @classmethod
     def get_arguments(cls) -> dict[str, arguments.Argument]:
         return {
@@ -109,6 +120,14 @@ class UMAPTransform(checkpointed_core.PipelineStep, bases.DenseNumericalVectorDa
     async def execute(self, **inputs) -> typing.Any:
         return inputs['umap-model'].transform(inputs['data'])
 
+    @classmethod
+    def get_execution_mode(cls) -> str | None:
+        return 'process'
+
+    @classmethod
+    def get_resource_requirements(cls) -> dict[str, float]:
+        return {'cores': 1}
+
     @classmethod
     def get_output_storage_format(cls) -> str:
         return 'numpy-array'
@@ -119,6 +138,9 @@ class UMAPTransform(checkpointed_core.PipelineStep, bases.DenseNumericalVectorDa
     def checkpoint_is_valid(self, metadata: typing.Any) -> bool:
         return True
 
+    def get_checkpoint_dependencies(self) -> list[str] | None:
+        return []
+
     @classmethod
     def get_arguments(cls) -> dict[str, arguments.Argument]:
         return {}
@@ -31,6 +31,14 @@ class LdaModel(checkpointed_core.PipelineStep):
         )
         return model
 
+    @classmethod
+    def get_execution_mode(cls) -> str | None:
+        return 'thread'
+
+    @classmethod
+    def get_resource_requirements(cls) -> dict[str, float]:
+        return {'cores': 1, 'model': 1}
+
     @classmethod
     def get_output_storage_format(cls) -> str:
         return 'gensim-lda'
@@ -41,6 +49,9 @@ class LdaModel(checkpointed_core.PipelineStep):
     def checkpoint_is_valid(self, metadata: typing.Any) -> bool:
         return True
 
+    def get_checkpoint_dependencies(self) -> list[str] | None:
+        return []
+
     @classmethod
     def get_arguments(cls) -> dict[str, arguments.Argument]:
         return {
@@ -92,6 +103,9 @@ class ExtractLdaTopics(checkpointed_core.PipelineStep):
     def checkpoint_is_valid(self, metadata: typing.Any) -> bool:
         return True
 
+    def get_checkpoint_dependencies(self) -> list[str] | None:
+        return []
+
     @classmethod
     def get_arguments(cls) -> dict[str, arguments.Argument]:
         return {
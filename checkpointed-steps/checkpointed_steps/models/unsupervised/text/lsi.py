@@ -30,6 +30,14 @@ class LsiModel(checkpointed_core.PipelineStep):
         )
         return model
 
+    @classmethod
+    def get_execution_mode(cls) -> str | None:
+        return 'thread'
+
+    @classmethod
+    def get_resource_requirements(cls) -> dict[str, float]:
+        return {'cores': 1, 'model': 1}
+
     @classmethod
     def get_output_storage_format(cls) -> str:
         return 'gensim-lsi'
@@ -40,6 +48,9 @@ class LsiModel(checkpointed_core.PipelineStep):
     def checkpoint_is_valid(self, metadata: typing.Any) -> bool:
         return True
 
+    def get_checkpoint_dependencies(self) -> list[str] | None:
+        return []
+
     @classmethod
     def get_arguments(cls) -> dict[str, arguments.Argument]:
         return {
@@ -96,6 +107,9 @@ class ExtractLsiTopics(checkpointed_core.PipelineStep):
     def checkpoint_is_valid(self, metadata: typing.Any) -> bool:
         return True
 
+    def get_checkpoint_dependencies(self) -> list[str] | None:
+        return []
+
     @classmethod
     def get_arguments(cls) -> dict[str, arguments.Argument]:
         return {
@@ -1,6 +1,7 @@
 import typing
 
 import checkpointed_core
+from checkpointed_core import streaming
 from checkpointed_core.parameters import constraints, arguments
 
 from ... import bases
@@ -16,14 +17,31 @@ class CaseTransform(checkpointed_core.PipelineStep, bases.TextDocumentSource):
 
     @classmethod
     def supported_streamed_inputs(cls) -> dict[str | type(...), tuple[type]]:
-        return {}
+        return {
+            'documents': (bases.TextDocumentSource,)
+        }
 
     async def execute(self, **inputs) -> typing.Any:
+        return self._transform(inputs['documents'])
+
+    @classmethod
+    def supports_streamed_output(cls) -> bool:
+        return True
+
+    async def execute_streamed(self, **inputs) -> typing.AsyncIterator[list]:
+        async for batch in streaming.batches(inputs['documents']):
+            yield self._transform(batch)
+
+    def _transform(self, documents: list[str]) -> list[str]:
         match self.config.get_casted('params.mode', str):
             case 'lower':
-                return [document.lower() for document in inputs['documents']]
+                return [document.lower() for document in documents]
             case 'upper':
-                return [document.upper() for document in inputs['documents']]
+                return [document.upper() for document in documents]
+
+    @classmethod
+    def get_partitioned_inputs(cls) -> frozenset[str]:
+        return frozenset({'documents'})
 
     @classmethod
     def get_output_storage_format(cls) -> str:
@@ -35,6 +53,9 @@ class CaseTransform(checkpointed_core.PipelineStep, bases.TextDocumentSource):
     def checkpoint_is_valid(self, metadata: typing.Any) -> bool:
         return True
 
+    def get_checkpoint_dependencies(self) -> list[str] | None:
+        return []
+
     @classmethod
     def get_arguments(cls) -> dict[str, arguments.Argument]:
         return {
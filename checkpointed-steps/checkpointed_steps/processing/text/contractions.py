@@ -26,6 +26,10 @@ class ExpandContractions(checkpointed_core.PipelineStep, bases.TextDocumentSourc
             for document in inputs['documents']
         ]
 
+    @classmethod
+    def get_partitioned_inputs(cls) -> frozenset[str]:
+        return frozenset({'documents'})
+
     @classmethod
     def get_output_storage_format(cls) -> str:
         return 'std-pickle'
@@ -36,6 +40,9 @@ class ExpandContractions(checkpointed_core.PipelineStep, bases.TextDocumentSourc
     def checkpoint_is_valid(self, metadata: typing.Any) -> bool:
         return True
 
+    def get_checkpoint_dependencies(self) -> list[str] | None:
+        return []
+
     @classmethod
     def get_arguments(cls) -> dict[str, arguments.Argument]:
         return {
@@ -56,6 +56,9 @@ class DocumentFrequencyFilter(checkpointed_core.PipelineStep, bases.WordIndexDic
     def checkpoint_is_valid(self, metadata: typing.Any) -> bool:
         return True
 
+    def get_checkpoint_dependencies(self) -> list[str] | None:
+        return []
+
     @classmethod
     def get_arguments(cls) -> dict[str, arguments.Argument]:
         return {
@@ -64,6 +64,18 @@ class Lemmatization(checkpointed_core.PipelineStep, bases.PartOfSpeechTokenizedD
             for document in inputs['documents']
         ]
 
+    @classmethod
+    def get_execution_mode(cls) -> str | None:
+        return 'process'
+
+    @classmethod
+    def get_resource_requirements(cls) -> dict[str, float]:
+        return {'cores': 1}
+
+    @classmethod
+    def get_partitioned_inputs(cls) -> frozenset[str]:
+        return frozenset({'documents'})
+
     @classmethod
     def get_output_storage_format(cls) -> str:
         return 'std-pickle'
@@ -74,6 +86,9 @@ class Lemmatization(checkpointed_core.PipelineStep, bases.PartOfSpeechTokenizedD
     def checkpoint_is_valid(self, metadata: typing.Any) -> bool:
         return True
 
+    def get_checkpoint_dependencies(self) -> list[str] | None:
+        return []
+
     @classmethod
     def get_arguments(cls) -> dict[str, arguments.Argument]:
         return {}
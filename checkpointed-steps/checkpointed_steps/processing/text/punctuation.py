@@ -27,6 +27,10 @@ class RemovePunctuation(checkpointed_core.PipelineStep, bases.TokenizedDocumentS
             for document in documents
         ]
 
+    @classmethod
+    def get_partitioned_inputs(cls) -> frozenset[str]:
+        return frozenset({'documents'})
+
     @classmethod
     def get_output_storage_format(cls) -> str:
         return 'std-pickle'
@@ -37,6 +41,9 @@ class RemovePunctuation(checkpointed_core.PipelineStep, bases.TokenizedDocumentS
     def checkpoint_is_valid(self, metadata: typing.Any) -> bool:
         return True
 
+    def get_checkpoint_dependencies(self) -> list[str] | None:
+        return []
+
     @classmethod
     def get_arguments(cls) -> dict[str, arguments.Argument]:
         return {}
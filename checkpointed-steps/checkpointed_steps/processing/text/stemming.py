@@ -32,6 +32,18 @@ class PorterStemming(checkpointed_core.PipelineStep, bases.TokenizedDocumentSour
             for document in documents
         ]
 
+    @classmethod
+    def get_execution_mode(cls) -> str | None:
+        return 'process'
+
+    @classmethod
+    def get_resource_requirements(cls) -> dict[str, float]:
+        return {'cores': 1}
+
+    @classmethod
+    def get_partitioned_inputs(cls) -> frozenset[str]:
+        return frozenset({'documents'})
+
     @classmethod
     def get_output_storage_format(cls) -> str:
         return 'std-pickle'
@@ -42,6 +54,9 @@ class PorterStemming(checkpointed_core.PipelineStep, bases.TokenizedDocumentSour
     def checkpoint_is_valid(self, metadata: typing.Any) -> bool:
         return True
 
+    def get_checkpoint_dependencies(self) -> list[str] | None:
+        return []
+
     @classmethod
     def get_arguments(cls) -> dict[str, arguments.Argument]:
         return {}
@@ -7,6 +7,7 @@ except LookupError:
     nltk.download('stopwords')
 
 import checkpointed_core
+from checkpointed_core import streaming
 from checkpointed_core.parameters import constraints, arguments
 
 from ... import bases
@@ -22,11 +23,25 @@ class RemoveStopwords(checkpointed_core.PipelineStep, bases.TokenizedDocumentSou
 
     @classmethod
     def supported_streamed_inputs(cls) -> dict[str | type(...), tuple[type]]:
-        return {}
+        return {
+            'documents': (bases.TokenizedDocumentSource,)
+        }
 
     async def execute(self, **inputs) -> typing.Any:
         stopwords = set(nltk.corpus.stopwords.words('english'))
-        documents = inputs['documents']
+        return self._remove_stopwords(inputs['documents'], stopwords)
+
+    @classmethod
+    def supports_streamed_output(cls) -> bool:
+        return True
+
+    async def execute_streamed(self, **inputs) -> typing.AsyncIterator[list]:
+        stopwords = set(nltk.corpus.stopwords.words('english'))
+        async for batch in streaming.batches(inputs['documents']):
+            yield self._remove_stopwords(batch, stopwords)
+
+    @staticmethod
+    def _remove_stopwords(documents, stopwords: set[str]):
         return [
             [[word for word in sent if word not in stopwords] for sent in document]
             for document in documents
@@ -42,6 +57,9 @@ class RemoveStopwords(checkpointed_core.PipelineStep, bases.TokenizedDocumentSou
     def checkpoint_is_valid(self, metadata: typing.Any) -> bool:
         return True
 
+    def get_checkpoint_dependencies(self) -> list[str] | None:
+        return []
+
     @classmethod
     def get_arguments(cls) -> dict[str, arguments.Argument]:
         return {}
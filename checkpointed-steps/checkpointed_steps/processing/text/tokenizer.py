@@ -1,6 +1,8 @@
+import asyncio
 import typing
 
 import checkpointed_core
+from checkpointed_core import streaming
 from checkpointed_core.parameters import constraints, arguments
 
 import nltk.tokenize
@@ -18,15 +20,41 @@ class Tokenize(checkpointed_core.PipelineStep, bases.TokenizedDocumentSource):
 
     @classmethod
     def supported_streamed_inputs(cls) -> dict[str | type(...), tuple[type]]:
-        return {}
+        return {
+            'documents': (bases.TextDocumentSource,)
+        }
 
     async def execute(self, **inputs) -> typing.Any:
-        documents = inputs['documents']
+        return self._tokenize(inputs['documents'])
+
+    @classmethod
+    def supports_streamed_output(cls) -> bool:
+        return True
+
+    async def execute_streamed(self, **inputs) -> typing.AsyncIterator[list]:
+        # Streamed steps run on the event loop, so tokenize in a thread
+        async for batch in streaming.batches(inputs['documents']):
+            yield await asyncio.to_thread(self._tokenize, batch)
+
+    @staticmethod
+    def _tokenize(documents: list[str]) -> list[list[list[str]]]:
         return [
             [nltk.tokenize.word_tokenize(sent) for sent in nltk.tokenize.sent_tokenize(document)]
             for document in documents
         ]
 
+    @classmethod
+    def get_execution_mode(cls) -> str | None:
+        return 'process'
+
+    @classmethod
+    def get_resource_requirements(cls) -> dict[str, float]:
+        return {'cores': 1}
+
+    @classmethod
+    def get_partitioned_inputs(cls) -> frozenset[str]:
+        return frozenset({'documents'})
+
     @classmethod
     def get_output_storage_format(cls) -> str:
         return 'std-pickle'
@@ -37,6 +65,9 @@ class Tokenize(checkpointed_core.PipelineStep, bases.TokenizedDocumentSource):
     def checkpoint_is_valid(self, metadata: typing.Any) -> bool:
         return True
 
+    def get_checkpoint_dependencies(self) -> list[str] | None:
+        return []
+
     @classmethod
     def get_arguments(cls) -> dict[str, arguments.Argument]:
         return {}
@@ -1,6 +1,7 @@
-from checkpointed_core import Pipeline, PipelineStep, PipelineStepHandle, ExecutionPlan
+from checkpointed_core import Pipeline, PipelineStep, PipelineStepHandle, ExecutionPlan, TaskExecutor, Coordinator, Compression, collect_garbage
 from checkpointed_core.parameters import Config, ConfigFactory
 from checkpointed_core.parameters import arguments, constraints
+from checkpointed_core import storage, tiering
 import checkpointed_steps as steps
 
 __all__ = [
@@ -8,9 +9,15 @@ __all__ = [
     "PipelineStep",
     "PipelineStepHandle",
     "ExecutionPlan",
+    "TaskExecutor",
+    "Coordinator",
+    "Compression",
+    "collect_garbage",
 
     "arguments",
     "constraints",
+    "storage",
+    "tiering",
 
     "steps",
 ]